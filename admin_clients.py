@@ -4,68 +4,33 @@ import html
 from fastapi import APIRouter, Depends, Query, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
-from sqlalchemy.orm import joinedload
 
-from models import Order, OrderStatusHistory, Employee
+from models import Employee, CustomerStats, normalize_phone
 from templates import ADMIN_HTML_TEMPLATE, ADMIN_CLIENTS_LIST_BODY, ADMIN_CLIENT_DETAIL_BODY
 from dependencies import get_db_session, check_credentials
+from queries import client_orders_query, archived_client_orders_query, clients_list_query, CLIENTS_LIST_KEYS
+from pagination import paginate_keyset, render_page_bar
+from archive import archive_needed
 
 router = APIRouter()
 
 @router.get("/admin/clients", response_class=HTMLResponse)
 async def admin_clients_list(
-    page: int = Query(1, ge=1),
+    cursor: str = Query(None),
     q: str = Query(None, alias="search"),
     session: AsyncSession = Depends(get_db_session),
     username: str = Depends(check_credentials)
 ):
-    """Displays a paginated and searchable list of clients."""
-    per_page = 20
-    offset = (page - 1) * per_page
-
-    # Subquery to get the latest customer name for each phone number
-    latest_name_subquery = (
-        select(
-            Order.phone_number,
-            Order.customer_name,
-            func.row_number().over(
-                partition_by=Order.phone_number,
-                order_by=Order.id.desc()
-            ).label("rn")
-        )
-        .where(Order.phone_number.isnot(None))
-        .subquery()
+    """Displays a searchable list of clients, paginated by (order_count, last_order_id) cursor."""
+    # Aggregates are maintained incrementally in customer_stats (see customer_stats.py)
+    page = await paginate_keyset(
+        session, clients_list_query(q), CLIENTS_LIST_KEYS, per_page=20, cursor=cursor,
+        count_table=None if q else CustomerStats.__table__,
     )
-
-    # Main query to aggregate client data
-    client_query = (
-        select(
-            Order.phone_number,
-            func.count(Order.id).label("order_count"),
-            func.sum(Order.total_price).label("total_spent"),
-            latest_name_subquery.c.customer_name.label("customer_name")
-        )
-        .join(latest_name_subquery, Order.phone_number == latest_name_subquery.c.phone_number)
-        .where(latest_name_subquery.c.rn == 1)
-        .group_by(Order.phone_number, latest_name_subquery.c.customer_name)
-        .order_by(func.count(Order.id).desc())
-    )
-
-    if q:
-        client_query = client_query.where(
-            or_(
-                latest_name_subquery.c.customer_name.ilike(f"%{q}%"),
-                Order.phone_number.ilike(f"%{q}%")
-            )
-        )
-
-    total_res = await session.execute(select(func.count()).select_from(client_query.subquery()))
-    total = total_res.scalar_one()
-    pages = (total // per_page) + (1 if total % per_page > 0 else 0)
-
-    clients_res = await session.execute(client_query.limit(per_page).offset(offset))
-    clients = clients_res.mappings().all()
+    clients = [
+        {"phone_number": c.phone_number, "customer_name": c.customer_name or "", "order_count": c.order_count, "total_spent": c.total_spent}
+        for c in page.items
+    ]
 
     rows = "".join([f"""
     <tr>
@@ -78,12 +43,10 @@ async def admin_clients_list(
         </td>
     </tr>""" for c in clients])
 
-    pagination = f"<div class='pagination'>{''.join([f'<a href=\"/admin/clients?page={i}{f'&search={q}' if q else ''}\" class=\"{'active' if i == page else ''}\">{i}</a>' for i in range(1, pages + 1)])}</div>"
-
     body = ADMIN_CLIENTS_LIST_BODY.format(
         search_query=q or '',
         rows=rows or "<tr><td colspan='5'>Клиентов не найдено</td></tr>",
-        pagination=pagination if pages > 1 else ""
+        pagination=render_page_bar(page, "/admin/clients", {"search": q})
     )
 
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Клиенты", body=body, clients_active="active", **{k: "" for k in ["main_active", "products_active", "categories_active", "orders_active", "statuses_active", "employees_active", "settings_active", "reports_active", "menu_active"]}))
@@ -96,20 +59,18 @@ async def admin_client_detail(
     username: str = Depends(check_credentials)
 ):
     """Displays a detailed view of a single client and their order history."""
-    orders_res = await session.execute(
-        select(Order)
-        .where(Order.phone_number == phone_number)
-        .options(
-            joinedload(Order.status),
-            joinedload(Order.completed_by_courier),
-            joinedload(Order.history).joinedload(OrderStatusHistory.status)
-        )
-        .order_by(Order.id.desc())
-    )
+    phone_key = normalize_phone(phone_number)
+    orders_res = await session.execute(client_orders_query(phone_key))
     
     # ИЗМЕНЕНО: Добавлен .unique() для устранения ошибки дублирования
     orders = orders_res.unique().scalars().all()
 
+    # Old completed orders live in orders_archive; read it only if the client is older than the archive horizon
+    stats = await session.get(CustomerStats, phone_key) if phone_key else None
+    if stats and await archive_needed(session, stats.first_order_at.date() if stats.first_order_at else None):
+        archived_res = await session.execute(archived_client_orders_query(phone_key))
+        orders = sorted([*orders, *archived_res.unique().scalars().all()], key=lambda o: o.id, reverse=True)
+
     if not orders:
         raise HTTPException(status_code=404, detail="Клиент с таким номером не найден")
 
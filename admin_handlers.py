@@ -10,12 +10,22 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder, KeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from typing import Optional
 from urllib.parse import quote_plus
 
-from models import Order, Product, Category, OrderStatus, Employee, Role, Settings, OrderStatusHistory
+from models import Order, Product, Employee, OrderStatusHistory
+from order_items import add_order_item, change_item_quantity, remove_order_item, refresh_order_summary
+from customer_stats import order_snapshot, update_customer_stats
+from queries import get_order
 from courier_handlers import get_operator_keyboard, get_staff_login_keyboard, get_courier_keyboard
-from notification_manager import notify_all_parties_on_status_change
+from order_jobs import add_status_change_event
+from db_writer import write_coordinator
+from settings_cache import get_settings_snapshot
+from reference_data import get_reference_data
+from menu_catalog import get_menu_catalog
+from staff_identity import StaffMember, forget_staff, bind_staff_telegram
+from send_scheduler import PRIORITY_LOG
+from fan_out import Notice, fan_out
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -28,36 +38,8 @@ class AdminEditOrderStates(StatesGroup):
 class OperatorAuthStates(StatesGroup):
     waiting_for_phone = State()
 
-def parse_products_string(products_str: str) -> dict[str, int]:
-    """Разбирает строку 'Название x Количество, ...' на словарь."""
-    if not products_str: return {}
-    products_dict = {}
-    for part in products_str.split(', '):
-        try:
-            name, quantity_str = part.rsplit(' x ', 1)
-            products_dict[name] = int(quantity_str)
-        except ValueError:
-            logging.warning(f"Could not parse product string part: {part}")
-    return products_dict
-
-def build_products_string(products_dict: dict[str, int]) -> str:
-    """Собирает словарь обратно в строку 'Название x Количество, ...'."""
-    return ", ".join([f"{name} x {quantity}" for name, quantity in products_dict.items()])
-
-async def recalculate_order_total(products_dict: dict[str, int], session: AsyncSession) -> int:
-    """Пересчитывает общую сумму заказа на основе обновленного состава."""
-    total = 0
-    if not products_dict: return 0
-    products_res = await session.execute(select(Product).where(Product.name.in_(list(products_dict.keys()))))
-    db_products = {p.name: p for p in products_res.scalars().all()}
-    for name, quantity in products_dict.items():
-        if product := db_products.get(name):
-            total += product.price * quantity
-    return total
-
 async def _generate_order_admin_view(order: Order, session: AsyncSession):
-    """Генерирует текст и клавиатуру для отображения заказа в админ-боте."""
-    await session.refresh(order, ['status', 'courier'])
+    """Генерирует текст и клавиатуру для отображения заказа в админ-боте. Заказ загружен с профилем "notify"."""
     status_name = order.status.name if order.status else 'Неизвестный'
     delivery_info = f"Адрес: {html.quote(order.address or 'Не указан')}" if order.is_delivery else 'Самовывоз'
     time_info = f"Время: {html.quote(order.delivery_time)}"
@@ -73,10 +55,7 @@ async def _generate_order_admin_view(order: Order, session: AsyncSession):
                   f"<b>Статус:</b> {status_name}")
 
     kb_admin = InlineKeyboardBuilder()
-    statuses_res = await session.execute(
-        select(OrderStatus).where(OrderStatus.visible_to_operator == True).order_by(OrderStatus.id)
-    )
-    statuses = statuses_res.scalars().all()
+    statuses = (await get_reference_data(session)).operator_statuses
     status_buttons = [
         InlineKeyboardButton(text=f"{'✅ ' if s.id == order.status_id else ''}{s.name}", callback_data=f"change_order_status_{order.id}_{s.id}")
         for s in statuses
@@ -91,7 +70,7 @@ async def _generate_order_admin_view(order: Order, session: AsyncSession):
 
 async def _display_order_view(bot: Bot, chat_id: int, message_id: int, order_id: int, session: AsyncSession):
     """Обновляет сообщение с деталями заказа."""
-    order = await session.get(Order, order_id)
+    order = await get_order(session, order_id, "notify", refresh=True)
     if not order: return
     admin_text, kb_admin = await _generate_order_admin_view(order, session)
     try:
@@ -101,32 +80,31 @@ async def _display_order_view(bot: Bot, chat_id: int, message_id: int, order_id:
 
 async def _display_edit_items_menu(bot: Bot, chat_id: int, message_id: int, order_id: int, session: AsyncSession):
     """Показывает меню редактирования состава заказа."""
-    order = await session.get(Order, order_id)
+    order = await get_order(session, order_id, "items", refresh=True)
     if not order: return
-    products_dict = parse_products_string(order.products)
     text = f"<b>Состав заказа #{order.id}</b> (Сумма: {order.total_price} грн)\n\n"
     kb = InlineKeyboardBuilder()
-    if not products_dict:
+    if not order.items:
         text += "<i>Заказ пуст</i>"
     else:
-        product_names = list(products_dict.keys())
-        products_res = await session.execute(select(Product).where(Product.name.in_(product_names)))
-        db_products = {p.name: p for p in products_res.scalars().all()}
-        for name, quantity in products_dict.items():
-            if product := db_products.get(name):
-                kb.row(
-                    InlineKeyboardButton(text="➖", callback_data=f"admin_change_qnt_{order.id}_{product.id}_-1"),
-                    InlineKeyboardButton(text=f"{html.quote(name)}: {quantity}", callback_data="noop"),
-                    InlineKeyboardButton(text="➕", callback_data=f"admin_change_qnt_{order.id}_{product.id}_1"),
-                    InlineKeyboardButton(text="❌", callback_data=f"admin_delete_item_{order.id}_{product.id}")
-                )
+        for item in order.items:
+            # Позиции удалённых из меню товаров показываются без кнопок редактирования
+            if item.product_id is None:
+                kb.row(InlineKeyboardButton(text=f"{html.quote(item.name)}: {item.quantity}", callback_data="noop"))
+                continue
+            kb.row(
+                InlineKeyboardButton(text="➖", callback_data=f"admin_change_qnt_{order.id}_{item.product_id}_-1"),
+                InlineKeyboardButton(text=f"{html.quote(item.name)}: {item.quantity}", callback_data="noop"),
+                InlineKeyboardButton(text="➕", callback_data=f"admin_change_qnt_{order.id}_{item.product_id}_1"),
+                InlineKeyboardButton(text="❌", callback_data=f"admin_delete_item_{order.id}_{item.product_id}")
+            )
     kb.row(InlineKeyboardButton(text="➕ Добавить блюдо", callback_data=f"admin_add_item_start_{order_id}"))
     kb.row(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"edit_order_{order_id}"))
     await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=kb.as_markup())
 
 async def _display_edit_customer_menu(bot: Bot, chat_id: int, message_id: int, order_id: int, session: AsyncSession):
     """Показывает меню редактирования данных клиента."""
-    order = await session.get(Order, order_id)
+    order = await session.get(Order, order_id, populate_existing=True)
     if not order: return
 
     text = (f"<b>Редактирование клиента (Заказ #{order.id})</b>\n\n"
@@ -147,7 +125,7 @@ async def _display_edit_customer_menu(bot: Bot, chat_id: int, message_id: int, o
 
 async def _display_edit_delivery_menu(bot: Bot, chat_id: int, message_id: int, order_id: int, session: AsyncSession):
     """Показывает меню редактирования доставки/самовывоза."""
-    order = await session.get(Order, order_id)
+    order = await session.get(Order, order_id, populate_existing=True)
     if not order: return
 
     delivery_type_str = "🚚 Доставка" if order.is_delivery else "🏠 Самовывоз"
@@ -173,13 +151,12 @@ async def _display_edit_delivery_menu(bot: Bot, chat_id: int, message_id: int, o
 
 def register_admin_handlers(dp: Dispatcher):
     @dp.message(F.text == "🔐 Вход оператора")
-    async def operator_login_start(message: Message, state: FSMContext, session: AsyncSession):
-        employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == message.from_user.id).options(joinedload(Employee.role)))
-        if employee:
-            if employee.role.can_manage_orders:
-                return await message.answer(f"✅ Вы уже авторизованы как оператор.", reply_markup=get_operator_keyboard(employee.is_on_shift))
-            elif employee.role.can_be_assigned:
-                return await message.answer("❌ Вы авторизованы как курьер. Для входа как оператор, сначала выйдите из системы.", reply_markup=get_courier_keyboard(employee.is_on_shift))
+    async def operator_login_start(message: Message, state: FSMContext, staff: Optional[StaffMember]):
+        if staff:
+            if staff.is_operator:
+                return await message.answer(f"✅ Вы уже авторизованы как оператор.", reply_markup=get_operator_keyboard(staff.is_on_shift))
+            elif staff.is_courier:
+                return await message.answer("❌ Вы авторизованы как курьер. Для входа как оператор, сначала выйдите из системы.", reply_markup=get_courier_keyboard(staff.is_on_shift))
         await state.set_state(OperatorAuthStates.waiting_for_phone)
         kb = InlineKeyboardBuilder().add(InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_auth")).as_markup()
         await message.answer("Пожалуйста, введите номер телефона для роли **оператора**:", reply_markup=kb)
@@ -187,20 +164,17 @@ def register_admin_handlers(dp: Dispatcher):
     @dp.message(OperatorAuthStates.waiting_for_phone)
     async def process_operator_phone(message: Message, state: FSMContext, session: AsyncSession):
         phone = message.text.strip()
-        employee = await session.scalar(select(Employee).options(joinedload(Employee.role)).where(Employee.phone_number == phone))
-        if employee and employee.role.can_manage_orders:
-            employee.telegram_user_id = message.from_user.id
-            await session.commit()
+        login = await write_coordinator.run(bind_staff_telegram(phone, message.from_user.id, courier=False))
+        if login:
+            forget_staff(login.previous_user_id, message.from_user.id)
             await state.clear()
-            await message.answer(f"🎉 Здравствуйте, {employee.full_name}! Вы успешно авторизованы как {employee.role.name}.", reply_markup=get_operator_keyboard(employee.is_on_shift))
+            await message.answer(f"🎉 Здравствуйте, {login.full_name}! Вы успешно авторизованы как {login.role_name}.", reply_markup=get_operator_keyboard(login.is_on_shift))
         else:
             await message.answer("❌ Сотрудник с таким номером не найден или не имеет прав Оператора.")
     
     @dp.callback_query(F.data.startswith("change_order_status_"))
-    async def change_order_status_admin(callback: CallbackQuery, session: AsyncSession):
-        client_bot = dp.get("client_bot")
-        employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == callback.from_user.id))
-        actor_info = f"Оператор: {employee.full_name}" if employee else f"Оператор (ID: {callback.from_user.id})"
+    async def change_order_status_admin(callback: CallbackQuery, session: AsyncSession, staff: Optional[StaffMember]):
+        actor_info = f"Оператор: {staff.full_name}" if staff else f"Оператор (ID: {callback.from_user.id})"
         
         parts = callback.data.split("_")
         order_id, new_status_id = int(parts[3]), int(parts[4])
@@ -209,29 +183,24 @@ def register_admin_handlers(dp: Dispatcher):
         if not order: return await callback.answer("Заказ не найден!", show_alert=True)
         if order.status_id == new_status_id: return await callback.answer("Статус уже установлен.")
 
-        old_status = await session.get(OrderStatus, order.status_id)
+        old_status = (await get_reference_data(session)).status(order.status_id)
         old_status_name = old_status.name if old_status else 'Неизвестный'
 
-        order.status_id = new_status_id
-        
-        # ДОБАВЛЕНО: Создание записи в истории
-        history_entry = OrderStatusHistory(
-            order_id=order.id,
-            status_id=new_status_id,
-            actor_info=actor_info
-        )
-        session.add(history_entry)
-        
-        await session.commit()
-        
-        await notify_all_parties_on_status_change(
-            order=order,
-            old_status_name=old_status_name,
-            actor_info=actor_info,
-            admin_bot=callback.bot,
-            client_bot=client_bot,
-            session=session
-        )
+        async def save_status(write_session: AsyncSession):
+            order_to_update = await write_session.get(Order, order_id)
+            before = await order_snapshot(write_session, order_to_update)
+            order_to_update.status_id = new_status_id
+            # ДОБАВЛЕНО: Создание записи в истории
+            write_session.add(OrderStatusHistory(
+                order_id=order_id,
+                status_id=new_status_id,
+                actor_info=actor_info
+            ))
+            await update_customer_stats(write_session, order_to_update, before)
+            add_status_change_event(write_session, order_id, old_status_name, actor_info)
+
+        await write_coordinator.run(save_status)
+        await session.refresh(order)
         
         await _display_order_view(callback.bot, callback.message.chat.id, callback.message.message_id, order_id, session)
         await callback.answer(f"Статус заказа #{order.id} изменен.")
@@ -293,10 +262,15 @@ def register_admin_handlers(dp: Dispatcher):
     async def process_fsm_for_edit(message: Message, state: FSMContext, session: AsyncSession, field_to_update: str, menu_to_return_func):
         data = await state.get_data()
         order_id, message_id = data['order_id'], data['message_id']
-        order = await session.get(Order, order_id)
-        if order:
-            setattr(order, field_to_update, message.text)
-            await session.commit()
+
+        async def save_field(write_session: AsyncSession):
+            order = await write_session.get(Order, order_id)
+            if order:
+                before = await order_snapshot(write_session, order)
+                setattr(order, field_to_update, message.text)
+                await update_customer_stats(write_session, order, before)
+
+        await write_coordinator.run(save_field)
         await state.clear()
         try: await message.delete()
         except TelegramBadRequest: pass
@@ -318,39 +292,45 @@ def register_admin_handlers(dp: Dispatcher):
     async def admin_modify_item(callback: CallbackQuery, session: AsyncSession):
         parts = callback.data.split("_")
         order_id, product_id = int(parts[3]), int(parts[4])
-        order = await session.get(Order, order_id)
-        product = await session.get(Product, product_id)
-        if not order or not product: return await callback.answer("Ошибка!", show_alert=True)
-
-        products_dict = parse_products_string(order.products)
-        if "change_qnt" in callback.data:
-            new_quantity = products_dict.get(product.name, 0) + int(parts[5])
-            if new_quantity > 0: products_dict[product.name] = new_quantity
-            else: del products_dict[product.name]
-        elif "delete_item" in callback.data and product.name in products_dict:
-            del products_dict[product.name]
-
-        order.products = build_products_string(products_dict)
-        order.total_price = await recalculate_order_total(products_dict, session)
-        await session.commit()
+
+        async def save_items(write_session: AsyncSession) -> bool:
+            order = await get_order(write_session, order_id, "items")
+            if not order: return False
+            before = await order_snapshot(write_session, order)
+
+            if "change_qnt" in callback.data:
+                changed = change_item_quantity(order, product_id, int(parts[5]))
+            else:
+                changed = remove_order_item(order, product_id)
+            if not changed: return False
+
+            refresh_order_summary(order)
+            await update_customer_stats(write_session, order, before)
+            return True
+
+        if not await write_coordinator.run(save_items): return await callback.answer("Ошибка!", show_alert=True)
         await _display_edit_items_menu(callback.bot, callback.message.chat.id, callback.message.message_id, order_id, session)
         await callback.answer()
 
     @dp.callback_query(F.data.startswith("toggle_delivery_type_"))
     async def toggle_delivery_type(callback: CallbackQuery, session: AsyncSession):
         order_id = int(callback.data.split("_")[-1])
-        order = await session.get(Order, order_id)
-        if not order: return
-        order.is_delivery = not order.is_delivery
-        if not order.is_delivery: order.address = None
-        await session.commit()
+
+        async def save_delivery_type(write_session: AsyncSession) -> bool:
+            order = await write_session.get(Order, order_id)
+            if not order: return False
+            order.is_delivery = not order.is_delivery
+            if not order.is_delivery: order.address = None
+            return True
+
+        if not await write_coordinator.run(save_delivery_type): return
         await _display_edit_delivery_menu(callback.bot, callback.message.chat.id, callback.message.message_id, order_id, session)
         await callback.answer()
 
     @dp.callback_query(F.data.startswith("admin_add_item_start_"))
     async def admin_add_item_start(callback: CallbackQuery, session: AsyncSession):
         order_id = int(callback.data.split("_")[-1])
-        categories = (await session.execute(select(Category).order_by(Category.sort_order, Category.name))).scalars().all()
+        categories = (await get_menu_catalog(session)).categories
         kb = InlineKeyboardBuilder()
         for cat in categories:
             kb.add(InlineKeyboardButton(text=cat.name, callback_data=f"admin_show_cat_{order_id}_{cat.id}_1"))
@@ -361,7 +341,8 @@ def register_admin_handlers(dp: Dispatcher):
     @dp.callback_query(F.data.startswith("admin_show_cat_"))
     async def admin_show_category(callback: CallbackQuery, session: AsyncSession):
         order_id, category_id = map(int, callback.data.split("_")[3:5])
-        products = (await session.execute(select(Product).where(Product.category_id == category_id, Product.is_active == True))).scalars().all()
+        category = (await get_menu_catalog(session)).category(category_id)
+        products = category.products if category else ()
         kb = InlineKeyboardBuilder()
         for prod in products:
             kb.add(InlineKeyboardButton(text=f"{prod.name} ({prod.price} грн)", callback_data=f"admin_add_prod_{order_id}_{prod.id}"))
@@ -372,27 +353,31 @@ def register_admin_handlers(dp: Dispatcher):
     @dp.callback_query(F.data.startswith("admin_add_prod_"))
     async def admin_add_to_order(callback: CallbackQuery, session: AsyncSession):
         order_id, product_id = map(int, callback.data.split("_")[3:])
-        order = await session.get(Order, order_id)
-        product = await session.get(Product, product_id)
-        if not order or not product: return await callback.answer("Ошибка!", show_alert=True)
-        products_dict = parse_products_string(order.products)
-        products_dict[product.name] = products_dict.get(product.name, 0) + 1
-        order.products = build_products_string(products_dict)
-        order.total_price = await recalculate_order_total(products_dict, session)
-        await session.commit()
+
+        async def save_items(write_session: AsyncSession) -> str | None:
+            order = await get_order(write_session, order_id, "items")
+            product = await write_session.get(Product, product_id)
+            if not order or not product: return None
+            before = await order_snapshot(write_session, order)
+            add_order_item(order, product)
+            refresh_order_summary(order)
+            await update_customer_stats(write_session, order, before)
+            return product.name
+
+        product_name = await write_coordinator.run(save_items)
+        if not product_name: return await callback.answer("Ошибка!", show_alert=True)
         await _display_edit_items_menu(callback.bot, callback.message.chat.id, callback.message.message_id, order_id, session)
-        await callback.answer(f"✅ {product.name} добавлено!")
+        await callback.answer(f"✅ {product_name} добавлено!")
 
     @dp.callback_query(F.data.startswith("select_courier_"))
     async def select_courier_start(callback: CallbackQuery, session: AsyncSession):
         order_id = int(callback.data.split("_")[2])
-        courier_role_res = await session.execute(select(Role).where(Role.can_be_assigned == True).limit(1))
-        courier_role = courier_role_res.scalar_one_or_none()
+        courier_role_ids = (await get_reference_data(session)).courier_role_ids
         
-        if not courier_role:
+        if not courier_role_ids:
             return await callback.answer("Ошибка: Роль 'Курьер' не найдена в системе.", show_alert=True)
         
-        couriers = (await session.execute(select(Employee).where(Employee.role_id == courier_role.id, Employee.is_on_shift == True).order_by(Employee.full_name))).scalars().all()
+        couriers = (await session.execute(select(Employee).where(Employee.role_id.in_(courier_role_ids), Employee.is_on_shift == True).order_by(Employee.full_name))).scalars().all()
         
         kb = InlineKeyboardBuilder()
         text = f"<b>Заказ #{order_id}</b>\nВыберите курьера (🟢 На смене):"
@@ -411,52 +396,52 @@ def register_admin_handlers(dp: Dispatcher):
 
     @dp.callback_query(F.data.startswith("assign_courier_"))
     async def assign_courier(callback: CallbackQuery, session: AsyncSession):
-        settings = await session.get(Settings, 1)
+        settings = await get_settings_snapshot(session)
         order_id, courier_id = map(int, callback.data.split("_")[2:])
         order = await session.get(Order, order_id)
         if not order: return await callback.answer("Заказ не найден!", show_alert=True)
 
         old_courier_id = order.courier_id
         new_courier_name = "Не назначен"
+        notices = []
 
         if old_courier_id and old_courier_id != courier_id:
             old_courier = await session.get(Employee, old_courier_id)
             if old_courier and old_courier.telegram_user_id:
-                try:
-                    await callback.bot.send_message(old_courier.telegram_user_id, f"❗️ Заказ #{order.id} был снят с вас оператором.")
-                except Exception as e:
-                    logging.error(f"Не удалось уведомить бывшего курьера {old_courier.id}: {e}")
+                notices.append(Notice("бывший курьер", callback.bot, old_courier.telegram_user_id,
+                                      f"❗️ Заказ #{order.id} был снят с вас оператором."))
 
         if courier_id == 0:
-            order.courier_id = None
+            new_courier = None
         else:
             new_courier = await session.get(Employee, courier_id)
             if not new_courier: return await callback.answer("Курьер не найден!", show_alert=True)
-            order.courier_id = courier_id
             new_courier_name = new_courier.full_name
             
             if new_courier.telegram_user_id:
-                try:
-                    kb_courier = InlineKeyboardBuilder()
-                    statuses_res = await session.execute(select(OrderStatus).where(OrderStatus.visible_to_courier == True).order_by(OrderStatus.id))
-                    statuses = statuses_res.scalars().all()
-                    kb_courier.row(*[InlineKeyboardButton(text=s.name, callback_data=f"courier_set_status_{order.id}_{s.id}") for s in statuses])
-                    if order.is_delivery and order.address:
-                        encoded_address = quote_plus(order.address)
-                        map_query = f"https://www.google.com/maps/search/?api=1&query={encoded_address}"
-                        kb_courier.row(InlineKeyboardButton(text="🗺️ На карте", url=map_query))
-                    await callback.bot.send_message(
-                        new_courier.telegram_user_id,
-                        f"🔔 Вам назначен новый заказ!\n\n<b>Заказ #{order.id}</b>\nАдрес: {html.quote(order.address or 'Самовывоз')}\nСумма: {order.total_price} грн.",
-                        reply_markup=kb_courier.as_markup()
-                    )
-                except Exception as e:
-                    logging.error(f"Failed to notify new courier {new_courier.telegram_user_id}: {e}")
-        
-        await session.commit()
+                kb_courier = InlineKeyboardBuilder()
+                statuses = (await get_reference_data(session)).courier_statuses
+                kb_courier.row(*[InlineKeyboardButton(text=s.name, callback_data=f"courier_set_status_{order.id}_{s.id}") for s in statuses])
+                if order.is_delivery and order.address:
+                    encoded_address = quote_plus(order.address)
+                    map_query = f"https://www.google.com/maps/search/?api=1&query={encoded_address}"
+                    kb_courier.row(InlineKeyboardButton(text="🗺️ На карте", url=map_query))
+                notices.append(Notice(
+                    "новый курьер", callback.bot, new_courier.telegram_user_id,
+                    f"🔔 Вам назначен новый заказ!\n\n<b>Заказ #{order.id}</b>\nАдрес: {html.quote(order.address or 'Самовывоз')}\nСумма: {order.total_price} грн.",
+                    options={"reply_markup": kb_courier.as_markup()}
+                ))
+
+        async def save_courier(write_session: AsyncSession):
+            order_to_update = await write_session.get(Order, order_id)
+            order_to_update.courier_id = new_courier.id if new_courier else None
+
+        await write_coordinator.run(save_courier)
         
         if settings and settings.admin_chat_id:
-            await callback.bot.send_message(settings.admin_chat_id, f"👤 Заказу #{order.id} назначен курьер: <b>{html.quote(new_courier_name)}</b>")
+            notices.append(Notice("админ-чат", callback.bot, settings.admin_chat_id,
+                                  f"👤 Заказу #{order.id} назначен курьер: <b>{html.quote(new_courier_name)}</b>", PRIORITY_LOG))
+        (await fan_out(notices)).log_failures(f"Назначение курьера на заказ #{order.id}")
         
         await _display_order_view(callback.bot, callback.message.chat.id, callback.message.message_id, order_id, session)
         await callback.answer(f"Курьер назначен: {new_courier_name}")
\ No newline at end of file
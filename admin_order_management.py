@@ -4,34 +4,25 @@ from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
-from aiogram import Bot
 from urllib.parse import quote_plus
 
-from models import Order, OrderStatus, Employee, Role, OrderStatusHistory, Settings
+from models import Order, Employee, OrderStatusHistory
 from templates import ADMIN_HTML_TEMPLATE, ADMIN_ORDER_MANAGE_BODY
-from dependencies import get_db_session, check_credentials
-from notification_manager import notify_all_parties_on_status_change
+from dependencies import get_db_session, check_credentials, get_bot_registry
+from bot_instances import BotRegistry
+from order_jobs import add_status_change_event
+from db_writer import write_coordinator
+from customer_stats import order_snapshot, update_customer_stats
+from queries import order_load
+from settings_cache import get_settings_snapshot
+from reference_data import get_reference_data
+from send_scheduler import PRIORITY_LOG
+from fan_out import Notice, fan_out
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-async def get_bot_instances(session: AsyncSession) -> tuple[Bot | None, Bot | None]:
-    """Допоміжна функція для отримання екземплярів ботів на основі налаштувань у БД."""
-    settings = await session.get(Settings, 1)
-    if not settings or not settings.admin_bot_token or not settings.client_bot_token:
-        logger.warning("Токени ботів не налаштовані в базі даних.")
-        return None, None
-    
-    # Використовуємо html парсер за замовчуванням, оскільки він використовується у всьому проекті
-    from aiogram.enums import ParseMode
-    from aiogram.client.default import DefaultBotProperties
-
-    admin_bot = Bot(token=settings.admin_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    client_bot = Bot(token=settings.client_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    return admin_bot, client_bot
-
 @router.get("/admin/order/manage/{order_id}", response_class=HTMLResponse)
 async def get_manage_order_page(
     order_id: int,
@@ -39,26 +30,17 @@ async def get_manage_order_page(
     username: str = Depends(check_credentials)
 ):
     """Відображає сторінку керування для конкретного замовлення."""
-    order = await session.get(
-        Order,
-        order_id,
-        options=[
-            joinedload(Order.status),
-            joinedload(Order.courier),
-            joinedload(Order.history).joinedload(OrderStatusHistory.status)
-        ]
-    )
+    order = await session.get(Order, order_id, options=order_load("detail"))
     if not order:
         raise HTTPException(status_code=404, detail="Замовлення не знайдено")
 
     # Отримати всі можливі статуси
-    statuses_res = await session.execute(select(OrderStatus).order_by(OrderStatus.id))
-    all_statuses = statuses_res.scalars().all()
+    reference = await get_reference_data(session)
+    all_statuses = reference.statuses
     status_options = "".join([f'<option value="{s.id}" {"selected" if s.id == order.status_id else ""}>{html.escape(s.name)}</option>' for s in all_statuses])
 
     # Отримати всіх кур'єрів на зміні
-    courier_role_res = await session.execute(select(Role.id).where(Role.can_be_assigned == True))
-    courier_role_ids = courier_role_res.scalars().all()
+    courier_role_ids = reference.courier_role_ids
     
     couriers_on_shift = []
     if courier_role_ids:
@@ -81,7 +63,7 @@ async def get_manage_order_page(
     history_html += "</ul>"
     
     # Сформатувати склад замовлення
-    products_html = "<ul>" + "".join([f"<li>{html.escape(item.strip())}</li>" for item in order.products.split(',')]) + "</ul>"
+    products_html = "<ul>" + "".join([f"<li>{html.escape(item.name)} x {item.quantity} ({item.price * item.quantity} грн)</li>" for item in order.items]) + "</ul>"
 
     body = ADMIN_ORDER_MANAGE_BODY.format(
         order_id=order.id,
@@ -106,7 +88,7 @@ async def web_set_order_status(
     username: str = Depends(check_credentials)
 ):
     """Обробляє зміну статусу замовлення з веб-панелі."""
-    order = await session.get(Order, order_id, options=[joinedload(Order.status)])
+    order = await session.get(Order, order_id, options=order_load("list"))
     if not order:
         raise HTTPException(status_code=404, detail="Замовлення не знайдено")
     
@@ -114,28 +96,19 @@ async def web_set_order_status(
         return RedirectResponse(url=f"/admin/order/manage/{order_id}", status_code=303)
 
     old_status_name = order.status.name if order.status else "Невідомий"
-    order.status_id = status_id
     actor_info = "Адміністратор веб-панелі"
-    
-    # Додавання запису в історію
-    history_entry = OrderStatusHistory(order_id=order.id, status_id=status_id, actor_info=actor_info)
-    session.add(history_entry)
-    
-    await session.commit()
-
-    # Надсилання сповіщень
-    admin_bot, client_bot = await get_bot_instances(session)
-    if admin_bot:
-        await notify_all_parties_on_status_change(
-            order=order,
-            old_status_name=old_status_name,
-            actor_info=actor_info,
-            admin_bot=admin_bot,
-            client_bot=client_bot,
-            session=session
-        )
-        await admin_bot.session.close()
-        if client_bot: await client_bot.session.close()
+
+    async def save_status(write_session: AsyncSession):
+        order_to_update = await write_session.get(Order, order_id)
+        before = await order_snapshot(write_session, order_to_update)
+        order_to_update.status_id = status_id
+        # Додавання запису в історію
+        write_session.add(OrderStatusHistory(order_id=order_id, status_id=status_id, actor_info=actor_info))
+        await update_customer_stats(write_session, order_to_update, before)
+        # Сповіщення адмін-чату, кур'єра й клієнта — подією outbox у цій же транзакції
+        add_status_change_event(write_session, order_id, old_status_name, actor_info)
+
+    await write_coordinator.run(save_status)
 
     return RedirectResponse(url=f"/admin/order/manage/{order_id}", status_code=303)
 
@@ -145,66 +118,64 @@ async def web_assign_courier(
     order_id: int,
     courier_id: int = Form(...),
     session: AsyncSession = Depends(get_db_session),
-    username: str = Depends(check_credentials)
+    username: str = Depends(check_credentials),
+    bots: BotRegistry = Depends(get_bot_registry)
 ):
     """Обробляє призначення кур'єра на замовлення з веб-панелі."""
     order = await session.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Замовлення не знайдено")
 
-    admin_bot, _ = await get_bot_instances(session)
+    admin_bot = bots.admin_bot
     if not admin_bot:
          raise HTTPException(status_code=500, detail="Бот не налаштований для відправки сповіщень.")
 
     old_courier_id = order.courier_id
     new_courier_name = "Не призначено"
+    notices = []
 
     # Сповістити старого кур'єра, якщо він був і змінився
     if old_courier_id and old_courier_id != courier_id:
         old_courier = await session.get(Employee, old_courier_id)
         if old_courier and old_courier.telegram_user_id:
-            try:
-                await admin_bot.send_message(old_courier.telegram_user_id, f"❗️ Замовлення #{order.id} було знято з вас оператором.")
-            except Exception as e:
-                logger.error(f"Не вдалося сповістити колишнього кур'єра {old_courier.id}: {e}")
-
-    if courier_id == 0:
-        order.courier_id = None
-    else:
+            notices.append(Notice("колишній кур'єр", admin_bot, old_courier.telegram_user_id,
+                                  f"❗️ Замовлення #{order.id} було знято з вас оператором."))
+
+    if courier_id != 0:
         new_courier = await session.get(Employee, courier_id)
         if not new_courier:
             raise HTTPException(status_code=404, detail="Кур'єра не знайдено")
         
-        order.courier_id = courier_id
         new_courier_name = new_courier.full_name
         
         # Сповістити нового кур'єра
         if new_courier.telegram_user_id:
-            try:
-                kb_courier = InlineKeyboardBuilder()
-                statuses_res = await session.execute(select(OrderStatus).where(OrderStatus.visible_to_courier == True).order_by(OrderStatus.id))
-                statuses = statuses_res.scalars().all()
-                kb_courier.row(*[InlineKeyboardButton(text=s.name, callback_data=f"courier_set_status_{order.id}_{s.id}") for s in statuses])
-                if order.is_delivery and order.address:
-                    encoded_address = quote_plus(order.address)
-                    map_url = f"https://www.google.com/maps/search/?api=1&query={encoded_address}"
-                    kb_courier.row(InlineKeyboardButton(text="🗺️ На карті", url=map_url))
-                
-                await admin_bot.send_message(
-                    new_courier.telegram_user_id,
-                    f"🔔 Вам призначено нове замовлення!\n\n<b>Замовлення #{order.id}</b>\nАдреса: {html.escape(order.address or 'Самовивіз')}\nСума: {order.total_price} грн.",
-                    reply_markup=kb_courier.as_markup()
-                )
-            except Exception as e:
-                logger.error(f"Не вдалося сповістити нового кур'єра {new_courier.telegram_user_id}: {e}")
-    
-    await session.commit()
-
-    # Надіслати лог у головний чат
-    settings = await session.get(Settings, 1)
+            kb_courier = InlineKeyboardBuilder()
+            statuses = (await get_reference_data(session)).courier_statuses
+            kb_courier.row(*[InlineKeyboardButton(text=s.name, callback_data=f"courier_set_status_{order.id}_{s.id}") for s in statuses])
+            if order.is_delivery and order.address:
+                encoded_address = quote_plus(order.address)
+                map_url = f"https://www.google.com/maps/search/?api=1&query={encoded_address}"
+                kb_courier.row(InlineKeyboardButton(text="🗺️ На карті", url=map_url))
+
+            notices.append(Notice(
+                "новий кур'єр", admin_bot, new_courier.telegram_user_id,
+                f"🔔 Вам призначено нове замовлення!\n\n<b>Замовлення #{order.id}</b>\nАдреса: {html.escape(order.address or 'Самовивіз')}\nСума: {order.total_price} грн.",
+                options={"reply_markup": kb_courier.as_markup()}
+            ))
+
+    async def save_courier(write_session: AsyncSession):
+        order_to_update = await write_session.get(Order, order_id)
+        order_to_update.courier_id = courier_id or None
+
+    await write_coordinator.run(save_courier)
+
+    # Лог у головний чат
+    settings = await get_settings_snapshot(session)
     if settings and settings.admin_chat_id:
-        await admin_bot.send_message(settings.admin_chat_id, f"👤 Замовленню #{order.id} призначено кур'єра: <b>{html.escape(new_courier_name)}</b> (через веб-панель)")
-        
-    await admin_bot.session.close()
-    
+        notices.append(Notice("адмін-чат", admin_bot, settings.admin_chat_id,
+                              f"👤 Замовленню #{order.id} призначено кур'єра: <b>{html.escape(new_courier_name)}</b> (через веб-панель)",
+                              PRIORITY_LOG))
+    (await fan_out(notices)).log_failures(f"Призначення кур'єра на замовлення #{order.id}")
+
     return RedirectResponse(url=f"/admin/order/manage/{order_id}", status_code=303)
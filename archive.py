@@ -0,0 +1,134 @@
+# archive.py
+"""
+Перенесення старих завершених і скасованих замовлень в архівні таблиці.
+
+Замовлення у фінальному статусі, старші за ARCHIVE_AFTER_DAYS днів, разом з позиціями
+та історією статусів переносяться в orders_archive, order_items_archive і
+order_status_history_archive. Робочі таблиці лишаються невеликими: у них активні
+замовлення і свіжа історія, з якою працюють оператори, кур'єри та клієнтський бот.
+
+Кожна порція (ARCHIVE_BATCH_SIZE замовлень) переноситься однією короткою транзакцією
+через write_coordinator, тож архівація не блокує оформлення замовлень надовго.
+Агрегати customer_stats не змінюються: вони рахуються з обох таблиць.
+
+Звіти та картка клієнта читають архів лише тоді, коли запитаний період сягає
+за межу архіву (archive_horizon) — найновіше заархівоване замовлення.
+
+    python archive.py run [--days 90]   # перенести старі замовлення
+    python archive.py status            # кількість записів і межа архіву
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from os import getenv
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import (engine, async_session_maker, Order, OrderItem, OrderStatusHistory,
+                    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory)
+from queries import final_status_ids_query
+from db_writer import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(getenv("ARCHIVE_AFTER_DAYS", "90"))
+# Як часто фонове завдання перевіряє, чи є що архівувати; 0 — фонова архівація вимкнена
+ARCHIVE_INTERVAL_HOURS = float(getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+ARCHIVE_BATCH_SIZE = int(getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# (робоча таблиця, архівна таблиця, колонка з id замовлення); порядок видалення — з кінця
+_ARCHIVED_TABLES = [
+    (Order.__table__, ArchivedOrder.__table__, Order.__table__.c.id),
+    (OrderItem.__table__, ArchivedOrderItem.__table__, OrderItem.__table__.c.order_id),
+    (OrderStatusHistory.__table__, ArchivedOrderStatusHistory.__table__, OrderStatusHistory.__table__.c.order_id),
+]
+
+
+async def _archive_batch(session: AsyncSession, cutoff: datetime, limit: int) -> int:
+    """Переносить до limit найстаріших фінальних замовлень, створених до cutoff. Повертає їх кількість."""
+    order_ids = (await session.execute(
+        select(Order.id)
+        .where(Order.status_id.in_(final_status_ids_query()), Order.created_at < cutoff)
+        .order_by(Order.id)
+        .limit(limit)
+    )).scalars().all()
+    if not order_ids:
+        return 0
+
+    for source, archive, order_id_column in _ARCHIVED_TABLES:
+        columns = [column.name for column in source.columns]
+        await session.execute(
+            sa.insert(archive).from_select(columns, select(*source.columns).where(order_id_column.in_(order_ids)))
+        )
+    for source, _, order_id_column in reversed(_ARCHIVED_TABLES):
+        await session.execute(sa.delete(source).where(order_id_column.in_(order_ids)))
+    return len(order_ids)
+
+
+async def archive_old_orders(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Переносить в архів усі фінальні замовлення, старші за older_than_days днів. Повертає їх кількість."""
+    # created_at пишеться як CURRENT_TIMESTAMP SQLite (UTC без зони), тож межу рахуємо в UTC
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = await write_coordinator.run(partial(_archive_batch, cutoff=cutoff, limit=batch_size))
+        total += moved
+        if moved < batch_size:
+            break
+        # Між порціями даємо пройти іншим записам
+        await asyncio.sleep(0)
+    if total:
+        logger.info(f"В архів перенесено {total} замовлень, створених до {cutoff:%d.%m.%Y}.")
+    return total
+
+
+async def run_archiver(interval_hours: float = ARCHIVE_INTERVAL_HOURS):
+    """Фонове завдання для lifespan: періодично архівує старі замовлення."""
+    if interval_hours <= 0:
+        return
+    while True:
+        try:
+            await archive_old_orders()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Помилка архівації замовлень: {e}", exc_info=True)
+        await asyncio.sleep(interval_hours * 3600)
+
+
+async def archive_horizon(session: AsyncSession) -> Optional[date]:
+    """Дата найновішого заархівованого замовлення (None — архів порожній). Пошук по індексу created_at."""
+    newest = await session.scalar(select(func.max(ArchivedOrder.created_at)))
+    return newest.date() if newest else None
+
+
+async def archive_needed(session: AsyncSession, since: Optional[date]) -> bool:
+    """Чи потрапляють в архів дані, починаючи з дати since (None — за весь час)."""
+    horizon = await archive_horizon(session)
+    return horizon is not None and (since is None or since <= horizon)
+
+
+async def _main(args):
+    if args.command == "run":
+        print(f"Заархівовано замовлень: {await archive_old_orders(args.days)}")
+    else:
+        async with async_session_maker() as session:
+            hot = await session.scalar(select(func.count(Order.id)))
+            archived = await session.scalar(select(func.count(ArchivedOrder.id)))
+            horizon = await archive_horizon(session)
+        print(f"Робоча таблиця: {hot}, архів: {archived}, межа архіву: {horizon or '—'}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Архівація старих замовлень crm_bot")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Архівувати фінальні замовлення, старші за стільки днів")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,137 @@
+# background_jobs.py
+"""
+Фонові завдання в процесі застосунку.
+
+Побічні дії після збереження замовлення (сповіщення персоналу, відправка в R-Keeper)
+не повинні затримувати відповідь клієнту. Диспетчер outbox (outbox.py) ставить їх
+у чергу через job_runner.enqueue(name, func, *args); JOB_WORKERS воркерів
+виконують завдання у фоні.
+
+- черга обмежена JOB_QUEUE_SIZE завданнями: коли вона повна, enqueue() чекає на місце,
+  тож під перевантаженням запити сповільнюються, а не накопичують завдання без меж;
+- при зупинці (lifespan) нові завдання виконуються одразу у викликача, а черга
+  дочищується до JOB_DRAIN_SECONDS секунд; що не встигло — пишеться в лог;
+- для кожного типу завдань рахуються запуски, помилки, середній і найдовший час
+  (job_runner.metrics()); завдання довші за JOB_SLOW_SECONDS пишуться в лог.
+
+Завдання отримує лише прості значення (id замовлення, бот) і сам відкриває сесію БД:
+сесія запиту на момент виконання вже закрита. Поки раннер не запущений (скрипти),
+enqueue() виконує завдання одразу.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_SIZE = int(getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_WORKERS = int(getenv("JOB_WORKERS", "4"))
+JOB_DRAIN_SECONDS = float(getenv("JOB_DRAIN_SECONDS", "15"))
+JOB_SLOW_SECONDS = float(getenv("JOB_SLOW_SECONDS", "5"))
+
+JobFunc = Callable[..., Awaitable[Any]]
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "runs": self.runs, "failures": self.failures,
+            "avg_seconds": round(self.total_seconds / self.runs, 3) if self.runs else 0.0,
+            "max_seconds": round(self.max_seconds, 3),
+        }
+
+
+@dataclass(frozen=True)
+class _Job:
+    name: str
+    func: JobFunc
+    args: tuple
+    kwargs: dict
+    enqueued_at: float
+
+
+class JobRunner:
+    def __init__(self, max_queue: int = JOB_QUEUE_SIZE, workers: int = JOB_WORKERS):
+        self.max_queue = max_queue
+        self.workers = workers
+        self.stats: dict[str, JobStats] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        logger.info(f"Фонові завдання: запущено {self.workers} воркери, черга до {self.max_queue}.")
+
+    async def stop(self, timeout: float = JOB_DRAIN_SECONDS):
+        """Дочікується виконання завдань у черзі (не довше timeout секунд) і зупиняє воркери."""
+        if not self.running:
+            return
+        tasks, self._tasks = self._tasks, []
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Фонові завдання не встигли завершитись за {timeout} с, у черзі лишилось: {self._queue.qsize()}.")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"Фонові завдання зупинено: {self.metrics()}")
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+    async def enqueue(self, name: str, func: JobFunc, *args, **kwargs):
+        """Ставить завдання func(*args, **kwargs) у чергу; name — тип завдання для метрик і логу."""
+        job = _Job(name, func, args, kwargs, time.monotonic())
+        if not self.running:
+            await self._run(job)
+            return
+        await self._queue.put(job)
+
+    async def _worker_loop(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: _Job):
+        stats = self.stats.setdefault(job.name, JobStats())
+        started = time.monotonic()
+        try:
+            await job.func(*job.args, **job.kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats.failures += 1
+            logger.error(f"Фонове завдання '{job.name}' завершилось помилкою: {e}", exc_info=True)
+        finally:
+            elapsed = time.monotonic() - started
+            stats.runs += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            if elapsed > JOB_SLOW_SECONDS:
+                logger.warning(f"Фонове завдання '{job.name}' тривало {elapsed:.1f} с (у черзі {started - job.enqueued_at:.1f} с).")
+
+
+job_runner = JobRunner()
@@ -0,0 +1,189 @@
+# bench.py
+"""
+Навантажувальні прогони для SQLite на одноразовій копії схеми.
+
+    python bench.py engine --duration 10 --readers 8 --writers 4
+    python bench.py writer --duration 10 --writers 64
+
+Кожен прогін створює тимчасовий файл БД, наповнює його замовленнями і паралельно
+запускає читачів (список останніх замовлень, як у адмінці) та письменників
+(нове замовлення + запис історії), рахуючи операції та помилки "database is locked".
+Прогін writer порівнює прямі коміти з черги координатора записів (db_writer.py)
+при великій кількості одночасних дрібних записів.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Order, OrderStatus, OrderStatusHistory, create_engine_for_profile
+from db_writer import WriteCoordinator
+
+SEED_ORDERS = 2000
+
+
+@dataclass
+class BenchResult:
+    label: str
+    duration: float
+    reads: int = 0
+    writes: int = 0
+    locked_errors: int = 0
+    write_latencies: list[float] = field(default_factory=list)
+
+    def row(self) -> str:
+        latencies = sorted(self.write_latencies) or [0.0]
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        return (f"{self.label:<12} {self.reads / self.duration:>10.1f} {self.writes / self.duration:>10.1f} "
+                f"{self.locked_errors:>8} {p50:>9.2f} {p99:>9.2f}")
+
+
+def print_results(results: list[BenchResult]):
+    print(f"{'режим':<12} {'читань/с':>10} {'записів/с':>10} {'locked':>8} {'p50 мс':>9} {'p99 мс':>9}")
+    for result in results:
+        print(result.row())
+
+
+async def prepare_database(session_maker, engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        session.add(OrderStatus(id=1, name="Новий"))
+        session.add_all([
+            Order(products="Борщ x 1", total_price=150, customer_name="Bench", phone_number=f"+380{i:09d}", status_id=1)
+            for i in range(SEED_ORDERS)
+        ])
+        await session.commit()
+
+
+async def reader_loop(session_maker, result: BenchResult, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            async with session_maker() as session:
+                await session.execute(sa.select(Order.id, Order.customer_name, Order.total_price).order_by(Order.id.desc()).limit(15))
+                await session.scalar(sa.select(sa.func.count(Order.id)))
+            result.reads += 1
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            result.locked_errors += 1
+
+
+async def writer_loop(session_maker, result: BenchResult, deadline: float, worker_id: int):
+    n = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with session_maker() as session:
+                order = Order(products="Вареники x 2", total_price=240, customer_name=f"Writer {worker_id}",
+                              phone_number=f"+38099{worker_id:02d}{n:05d}", status_id=1)
+                session.add(order)
+                await session.flush()
+                session.add(OrderStatusHistory(order_id=order.id, status_id=1, actor_info="bench"))
+                await session.commit()
+            result.writes += 1
+            result.write_latencies.append(time.perf_counter() - started)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            result.locked_errors += 1
+        n += 1
+
+
+async def run_engine_profile(profile: str, args) -> BenchResult:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine_for_profile(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}", profile)
+        session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await prepare_database(session_maker, engine)
+
+        result = BenchResult(label=profile, duration=args.duration)
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *[reader_loop(session_maker, result, deadline) for _ in range(args.readers)],
+            *[writer_loop(session_maker, result, deadline, i) for i in range(args.writers)],
+        )
+        await engine.dispose()
+        return result
+
+
+async def coordinated_writer_loop(coordinator: WriteCoordinator, result: BenchResult, deadline: float, worker_id: int):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+
+        async def add_history(write_session: AsyncSession):
+            write_session.add(OrderStatusHistory(order_id=worker_id % SEED_ORDERS + 1, status_id=1, actor_info=f"bench {worker_id}"))
+
+        try:
+            await coordinator.run(add_history)
+            result.writes += 1
+            result.write_latencies.append(time.perf_counter() - started)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            result.locked_errors += 1
+
+
+async def run_write_mode(mode: str, args) -> BenchResult:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine_for_profile(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}", args.profile)
+        session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await prepare_database(session_maker, engine)
+
+        coordinator = WriteCoordinator(engine, session_maker, mode=mode, max_batch=args.batch)
+        await coordinator.start()
+        result = BenchResult(label=mode, duration=args.duration)
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *[reader_loop(session_maker, result, deadline) for _ in range(args.readers)],
+            *[coordinated_writer_loop(coordinator, result, deadline, i) for i in range(args.writers)],
+        )
+        await coordinator.stop()
+        await engine.dispose()
+        return result
+
+
+async def bench_writer(args):
+    results = [await run_write_mode(mode, args) for mode in args.modes]
+    print_results(results)
+
+
+async def bench_engine(args):
+    results = [await run_engine_profile(profile, args) for profile in args.profiles]
+    print_results(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки SQLite для crm_bot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    engine_parser = subparsers.add_parser("engine", help="Порівняння профілів PRAGMA (до/після)")
+    engine_parser.add_argument("--profiles", nargs="+", default=["legacy", "prod"])
+    engine_parser.add_argument("--duration", type=float, default=5.0)
+    engine_parser.add_argument("--readers", type=int, default=8)
+    engine_parser.add_argument("--writers", type=int, default=4)
+    engine_parser.set_defaults(func=bench_engine)
+
+    writer_parser = subparsers.add_parser("writer", help="Порівняння прямих комітів і черги координатора записів")
+    writer_parser.add_argument("--modes", nargs="+", default=["direct", "queue"])
+    writer_parser.add_argument("--profile", default="prod")
+    writer_parser.add_argument("--duration", type=float, default=5.0)
+    writer_parser.add_argument("--readers", type=int, default=4)
+    writer_parser.add_argument("--writers", type=int, default=64)
+    writer_parser.add_argument("--batch", type=int, default=50)
+    writer_parser.set_defaults(func=bench_writer)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,97 @@
 # bot_instances.py
+"""
+Спільні екземпляри ботів процесу.
+
+bot_registry тримає клієнтського (bot) і адмін-бота (admin_bot), створених за токенами
+з налаштувань, на весь час роботи застосунку: polling, webhook, outbox-сповіщення й
+веб-адмінка користуються тими самими Bot. Обидва бота працюють через одну
+AiohttpSession з пулом до BOT_HTTP_POOL_SIZE з'єднань, тож з'єднання й TLS-рукостискання
+з api.telegram.org не повторюються на кожен запит.
+
+- start() / close() викликаються в lifespan; поки реєстр не запущений (скрипти),
+  refresh() створює ботів і сесію при першому зверненні;
+- refresh() звіряє токени з get_settings_snapshot() (кеш, без запиту до БД) і, якщо
+  токен змінився на /admin/settings (в цьому чи іншому воркері), підміняє бота.
+  Старий Bot не закривається: сесія спільна, а вже поставлені в чергу повідомлення
+  дійдуть. start_bot чекає на wait_changed() і перезапускає polling з новими ботами;
+- у FastAPI реєстр передається залежністю get_bot_registry (dependencies.py).
+"""
+
+import asyncio
+import logging
+from os import getenv
+from typing import Optional
+
 from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums import ParseMode
+from aiogram.utils.token import TokenValidationError
+
+from settings_cache import SettingsSnapshot, get_settings_snapshot
+
+logger = logging.getLogger(__name__)
+
+BOT_HTTP_POOL_SIZE = int(getenv("BOT_HTTP_POOL_SIZE", "100"))
+
+
+class BotRegistry:
+    def __init__(self, pool_size: int = BOT_HTTP_POOL_SIZE):
+        self.pool_size = pool_size
+        self.bot: Optional[Bot] = None  # клієнтський бот
+        self.admin_bot: Optional[Bot] = None
+        self.swaps = 0
+        self._session: Optional[AiohttpSession] = None
+        self._tokens: tuple[Optional[str], Optional[str]] = (None, None)
+        self._changed = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.bot is not None and self.admin_bot is not None
+
+    async def start(self):
+        await self.refresh()
+        self._changed.clear()  # перші боти — не заміна
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self.bot = self.admin_bot = None
+        self._tokens = (None, None)
+
+    async def refresh(self, settings: Optional[SettingsSnapshot] = None) -> bool:
+        """Приводить ботів у відповідність до токенів у налаштуваннях; True — якщо щось змінилось."""
+        settings = settings or await get_settings_snapshot()
+        tokens = (settings.client_bot_token or None, settings.admin_bot_token or None)
+        if tokens == self._tokens:
+            return False
+        if self._session is None:
+            self._session = AiohttpSession(limit=self.pool_size)
+        if tokens[0] != self._tokens[0]:
+            self.bot = self._create(tokens[0])
+        if tokens[1] != self._tokens[1]:
+            self.admin_bot = self._create(tokens[1])
+        if self._tokens != (None, None):
+            self.swaps += 1
+            logger.info("Токени ботів змінено, боти замінено.")
+        self._tokens = tokens
+        self._changed.set()
+        return True
+
+    async def wait_changed(self):
+        """Чекає на наступну заміну ботів."""
+        await self._changed.wait()
+        self._changed.clear()
+
+    def _create(self, token: Optional[str]) -> Optional[Bot]:
+        if not token:
+            return None
+        try:
+            return Bot(token=token, session=self._session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        except TokenValidationError:
+            logger.error("Невірний формат токена бота в налаштуваннях.")
+            return None
+
 
-# Эти переменные будут инициализированы при старте в main.py
-bot: Bot | None = None
-admin_bot: Bot | None = None
\ No newline at end of file
+bot_registry = BotRegistry()
@@ -0,0 +1,92 @@
+# bot_webhooks.py
+"""
+Режим webhook для клієнтського та адмін-бота.
+
+Якщо задано WEBHOOK_BASE_URL (публічна адреса застосунку, наприклад https://shop.example.com),
+Telegram надсилає апдейти POST-запитами на {WEBHOOK_BASE_URL}/telegram/webhook/client
+і .../admin, а ці маршрути передають їх у dp / dp_admin через feed_update. Апдейти
+обробляє той uvicorn-воркер, до якого прийшов запит, тож боти масштабуються разом з сайтом
+і стоять за тим самим балансувальником.
+
+Кожен запит перевіряється за заголовком X-Telegram-Bot-Api-Secret-Token. Секрет —
+WEBHOOK_SECRET або, якщо його не задано, похідний від токена бота: усі воркери отримують
+той самий секрет без додаткового налаштування, а зміна токена його змінює.
+
+register_webhook() при старті кожного воркера встановлює webhook (setWebhook ідемпотентний,
+а секрет Telegram не повертає, тож перевірити його наперед не можна). Без WEBHOOK_BASE_URL
+або якщо встановити webhook не вдалося, start_bot() працює як раніше — через long polling.
+"""
+
+import hashlib
+import hmac
+import logging
+from os import getenv
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import APIRouter, HTTPException, Request, Response
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BASE_URL = getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PATH = "/telegram/webhook/{name}"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+router = APIRouter()
+
+# ім'я бота ("client", "admin") -> (диспетчер, бот, секрет); заповнюється register_webhook()
+_targets: dict[str, tuple[Dispatcher, Bot, str]] = {}
+
+
+def webhook_enabled() -> bool:
+    return bool(WEBHOOK_BASE_URL)
+
+
+def webhook_url(name: str) -> str:
+    return WEBHOOK_BASE_URL + WEBHOOK_PATH.format(name=name)
+
+
+def webhook_secret(bot: Bot) -> str:
+    """Секрет для setWebhook: дозволені символи A-Z, a-z, 0-9, _ і -, до 256 символів."""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{bot.token}".encode("utf-8")).hexdigest()
+
+
+async def register_webhook(name: str, dispatcher: Dispatcher, bot: Bot) -> bool:
+    """
+    Встановлює webhook бота і приймає його апдейти на WEBHOOK_PATH.
+    False — webhook не встановлено, бот має працювати через polling.
+    """
+    url = webhook_url(name)
+    secret = webhook_secret(bot)
+    allowed_updates = dispatcher.resolve_used_update_types()
+    # Маршрут має приймати апдейти ще до того, як Telegram почне їх надсилати
+    _targets[name] = (dispatcher, bot, secret)
+    try:
+        await bot.set_webhook(url, secret_token=secret, allowed_updates=allowed_updates)
+        logger.info(f"Webhook бота '{name}' встановлено: {url}")
+        return True
+    except Exception as e:
+        _targets.pop(name, None)
+        logger.error(f"Не вдалося встановити webhook бота '{name}' ({url}): {e}. Переходимо на polling.")
+        return False
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(name: str, request: Request):
+    target = _targets.get(name)
+    if target is None:
+        raise HTTPException(status_code=404)
+    dispatcher, bot, secret = target
+    if not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode("utf-8"), secret.encode("utf-8")):
+        raise HTTPException(status_code=401)
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    try:
+        await dispatcher.feed_update(bot, update)
+    except Exception as e:
+        # Як і в polling: помилка обробника не повинна змушувати Telegram надсилати апдейт повторно
+        logger.error(f"Помилка обробки апдейту {update.update_id} бота '{name}': {e}", exc_info=True)
+    return Response(status_code=200)
@@ -0,0 +1,116 @@
+# cache_versions.py
+"""
+Кеші в пам'яті процесу, узгоджені між воркерами uvicorn через таблицю cache_versions.
+
+Кожен кеш має ім'я і лічильник версії в cache_versions. Код, що змінює закешовані дані:
+- у тій самій транзакції, що й зміна, викликає bump_version(session, name);
+- після коміту кладе нове значення в кеш свого процесу через cache.store(value, version)
+  (write-through) або, якщо зібрати значення складно, скидає його cache.invalidate().
+
+Інші процеси звіряють версію не частіше ніж раз на CACHE_CHECK_SECONDS секунд — один
+запит за первинним ключем — і перечитують дані лише тоді, коли версія змінилась.
+Між звірками читання кешу взагалі не звертається до БД. Тобто інший воркер бачить
+зміну із затримкою до CACHE_CHECK_SECONDS; 0 — звіряти версію при кожному читанні.
+Так працюють settings_cache, reference_data, menu_catalog і site_pages.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from os import getenv
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import async_session_maker, CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHECK_SECONDS = float(getenv("CACHE_CHECK_SECONDS", "5"))
+
+T = TypeVar("T")
+
+
+async def bump_version(session: AsyncSession, name: str) -> int:
+    """Збільшує версію кешу name в поточній транзакції сесії і повертає нову версію."""
+    # CURRENT_TIMESTAMP у SQLite — час UTC
+    await session.execute(
+        sqlite_insert(CacheVersion).values(name=name, version=1, updated_at=func.current_timestamp())
+        .on_conflict_do_update(index_elements=[CacheVersion.name],
+                               set_={"version": CacheVersion.version + 1, "updated_at": func.current_timestamp()})
+    )
+    return await read_version(session, name)
+
+
+async def read_version(session: AsyncSession, name: str) -> int:
+    """Поточна версія кешу name; 0 — дані ще жодного разу не змінювались."""
+    return (await session.scalar(select(CacheVersion.version).where(CacheVersion.name == name))) or 0
+
+
+async def read_version_info(session: AsyncSession, name: str) -> tuple[int, Optional[datetime]]:
+    """Версія кешу name і час її зміни (UTC, None — невідомо)."""
+    row = (await session.execute(
+        select(CacheVersion.version, CacheVersion.updated_at).where(CacheVersion.name == name)
+    )).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+class VersionedCache(Generic[T]):
+    """
+    Значення, зібране loader(session) з БД, з перевіркою версії раз на check_seconds.
+    Версія і дані читаються в одній транзакції, тож значення відповідає своїй версії.
+    """
+
+    def __init__(self, name: str, loader: Callable[[AsyncSession], Awaitable[T]],
+                 check_seconds: float = CACHE_CHECK_SECONDS):
+        self.name = name
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self._value: Optional[T] = None
+        self._version: Optional[int] = None  # None — значення ще не завантажене
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def _fresh(self) -> bool:
+        return self._version is not None and time.monotonic() - self._checked_at < self.check_seconds
+
+    async def get(self, session: Optional[AsyncSession] = None) -> T:
+        """
+        Значення кешу. session — сесія викликача для звірки версії (якщо вона потрібна);
+        без неї береться окрема сесія з пулу.
+        """
+        if self._fresh():
+            return self._value
+        async with self._lock:
+            if self._fresh():
+                return self._value
+            if session is not None:
+                return await self._revalidate(session)
+            async with async_session_maker() as own_session:
+                return await self._revalidate(own_session)
+
+    async def _revalidate(self, session: AsyncSession) -> T:
+        version = await read_version(session, self.name)
+        if version != self._version:
+            self._value = await self.loader(session)
+            self._version = version
+            self.loads += 1
+            logger.debug(f"Кеш '{self.name}' завантажено, версія {version}.")
+        self._checked_at = time.monotonic()
+        return self._value
+
+    def store(self, value: T, version: int):
+        """Write-through: значення, щойно записане цим процесом у БД разом з версією version."""
+        self._value, self._version, self._checked_at = value, version, time.monotonic()
+
+    def invalidate(self):
+        """Наступне читання завантажить значення з БД."""
+        self._value, self._version = None, None
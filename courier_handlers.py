@@ -9,13 +9,17 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.filters import CommandStart
 from aiogram.exceptions import TelegramBadRequest
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
-from sqlalchemy.orm import joinedload
-from typing import Dict, Any
+from sqlalchemy import update
+from typing import Dict, Any, Optional
 from urllib.parse import quote_plus
 
-from models import Employee, Order, OrderStatus, Settings, OrderStatusHistory
-from notification_manager import notify_all_parties_on_status_change
+from models import Employee, Order, Settings, OrderStatusHistory
+from order_jobs import add_status_change_event
+from db_writer import write_coordinator
+from customer_stats import order_snapshot, update_customer_stats
+from queries import courier_active_orders_query, operator_active_orders_query, get_order
+from reference_data import get_reference_data
+from staff_identity import StaffMember, forget_staff, bind_staff_telegram
 
 logger = logging.getLogger(__name__)
 
@@ -48,30 +52,18 @@ def get_operator_keyboard(is_on_shift: bool):
     builder.row(KeyboardButton(text="🚪 Выйти"))
     return builder.as_markup(resize_keyboard=True)
 
-async def show_courier_orders(message_or_callback: Message | CallbackQuery, session: AsyncSession, **kwargs: Dict[str, Any]):
-    user_id = message_or_callback.from_user.id
+async def show_courier_orders(message_or_callback: Message | CallbackQuery, session: AsyncSession, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
     message = message_or_callback.message if isinstance(message_or_callback, CallbackQuery) else message_or_callback
 
-    employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == user_id).options(joinedload(Employee.role)))
-    
-    if not employee or not employee.role.can_be_assigned:
+    if not staff or not staff.is_courier:
          return await message.answer("❌ У вас нет прав курьера.")
 
-    final_statuses_res = await session.execute(
-        select(OrderStatus.id).where(or_(OrderStatus.is_completed_status == True, OrderStatus.is_cancelled_status == True))
-    )
-    final_status_ids = final_statuses_res.scalars().all()
-
-    orders_res = await session.execute(
-        select(Order).options(joinedload(Order.status)).where(
-            Order.courier_id == employee.id,
-            Order.status_id.not_in(final_status_ids)
-        ).order_by(Order.id.desc())
-    )
+    reference = await get_reference_data(session)
+    orders_res = await session.execute(courier_active_orders_query(staff.id, list(reference.final_status_ids)))
     orders = orders_res.scalars().all()
 
     text = "🚚 <b>Ваши активные заказы:</b>\n\n"
-    if not employee.is_on_shift:
+    if not staff.is_on_shift:
          text += "🔴 Вы не на смене. Нажмите '🟢 Начать смену', чтобы получать новые заказы.\n\n"
     if not orders:
         text += "На данный момент нет активных заказов, назначенных вам."
@@ -105,18 +97,8 @@ async def show_operator_orders(message_or_callback: Message | CallbackQuery, ses
     is_callback = isinstance(message_or_callback, CallbackQuery)
     message = message_or_callback.message if is_callback else message_or_callback
 
-    final_statuses_res = await session.execute(
-        select(OrderStatus.id).where(
-            or_(OrderStatus.is_completed_status == True, OrderStatus.is_cancelled_status == True)
-        )
-    )
-    final_status_ids = final_statuses_res.scalars().all()
-
-    orders_res = await session.execute(
-        select(Order).options(joinedload(Order.status), joinedload(Order.courier)).where(
-            Order.status_id.not_in(final_status_ids)
-        ).order_by(Order.id.desc())
-    )
+    reference = await get_reference_data(session)
+    orders_res = await session.execute(operator_active_orders_query(list(reference.active_status_ids)))
     orders = orders_res.scalars().all()
     text = "🖥️ <b>Активные заказы для обработки:</b>\n\n"
     if not orders:
@@ -138,18 +120,15 @@ async def show_operator_orders(message_or_callback: Message | CallbackQuery, ses
         await message.answer(text)
 
 
-async def start_handler(message: Message, state: FSMContext, session: AsyncSession, **kwargs: Dict[str, Any]):
+async def start_handler(message: Message, state: FSMContext, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
     await state.clear()
-    employee = await session.scalar(
-        select(Employee).where(Employee.telegram_user_id == message.from_user.id).options(joinedload(Employee.role))
-    )
-    if employee:
-        if employee.role.can_be_assigned:
-            await message.answer(f"🎉 Здравствуйте, {employee.full_name}! Вы вошли в режим курьера.",
-                                 reply_markup=get_courier_keyboard(employee.is_on_shift))
-        elif employee.role.can_manage_orders:
-            await message.answer(f"🎉 Здравствуйте, {employee.full_name}! Вы вошли в режим оператора.",
-                                 reply_markup=get_operator_keyboard(employee.is_on_shift))
+    if staff:
+        if staff.is_courier:
+            await message.answer(f"🎉 Здравствуйте, {staff.full_name}! Вы вошли в режим курьера.",
+                                 reply_markup=get_courier_keyboard(staff.is_on_shift))
+        elif staff.is_operator:
+            await message.answer(f"🎉 Здравствуйте, {staff.full_name}! Вы вошли в режим оператора.",
+                                 reply_markup=get_operator_keyboard(staff.is_on_shift))
         else:
             await message.answer("Вы авторизованы, но ваша роль не определена. Обратитесь к администратору.")
     else:
@@ -161,13 +140,12 @@ def register_courier_handlers(dp_admin: Dispatcher):
     dp_admin.message.register(start_handler, CommandStart())
 
     @dp_admin.message(F.text == "🚚 Вход курьера")
-    async def courier_login_start(message: Message, state: FSMContext, session: AsyncSession, **kwargs: Dict[str, Any]):
-        employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == message.from_user.id).options(joinedload(Employee.role)))
-        if employee:
-            if employee.role.can_be_assigned:
-                return await message.answer(f"✅ Вы уже авторизованы как курьер.", reply_markup=get_courier_keyboard(employee.is_on_shift))
-            elif employee.role.can_manage_orders:
-                 return await message.answer("❌ Вы авторизованы как оператор. Для входа как курьер, сначала выйдите из системы.", reply_markup=get_operator_keyboard(employee.is_on_shift))
+    async def courier_login_start(message: Message, state: FSMContext, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
+        if staff:
+            if staff.is_courier:
+                return await message.answer(f"✅ Вы уже авторизованы как курьер.", reply_markup=get_courier_keyboard(staff.is_on_shift))
+            elif staff.is_operator:
+                 return await message.answer("❌ Вы авторизованы как оператор. Для входа как курьер, сначала выйдите из системы.", reply_markup=get_operator_keyboard(staff.is_on_shift))
         
         await state.set_state(CourierAuthStates.waiting_for_phone)
         kb = InlineKeyboardBuilder().add(InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_auth")).as_markup()
@@ -176,13 +154,12 @@ def register_courier_handlers(dp_admin: Dispatcher):
     @dp_admin.message(CourierAuthStates.waiting_for_phone)
     async def process_courier_phone(message: Message, state: FSMContext, session: AsyncSession):
         phone = message.text.strip()
-        employee = await session.scalar(select(Employee).options(joinedload(Employee.role)).where(Employee.phone_number == phone))
-        
-        if employee and employee.role.can_be_assigned:
-            employee.telegram_user_id = message.from_user.id
-            await session.commit()
+        login = await write_coordinator.run(bind_staff_telegram(phone, message.from_user.id, courier=True))
+
+        if login:
+            forget_staff(login.previous_user_id, message.from_user.id)
             await state.clear()
-            await message.answer(f"🎉 Здравствуйте, {employee.full_name}! Вы успешно авторизованы как {employee.role.name}.", reply_markup=get_courier_keyboard(employee.is_on_shift))
+            await message.answer(f"🎉 Здравствуйте, {login.full_name}! Вы успешно авторизованы как {login.role_name}.", reply_markup=get_courier_keyboard(login.is_on_shift))
         else:
             await message.answer("❌ Сотрудник с таким номером не найден или не имеет прав Курьера. Попробуйте еще раз или обратитесь к администратору.")
 
@@ -196,58 +173,62 @@ def register_courier_handlers(dp_admin: Dispatcher):
              await callback.message.answer("Авторизация отменена.", reply_markup=get_staff_login_keyboard())
     
     @dp_admin.message(F.text.in_({"🟢 Начать смену", "🔴 Завершить смену"}))
-    async def toggle_shift(message: Message, session: AsyncSession):
-        employee = await session.scalar(
-            select(Employee).where(Employee.telegram_user_id == message.from_user.id).options(joinedload(Employee.role))
-        )
-        if not employee:
+    async def toggle_shift(message: Message, session: AsyncSession, staff: Optional[StaffMember]):
+        if not staff:
             return
 
         is_start = message.text.startswith("🟢")
-        
-        if employee.is_on_shift == is_start:
-            await message.answer(f"Ваш статус уже {'на смене' if is_start else 'не на смене'}.")
-            return
 
-        employee.is_on_shift = is_start
-        if not is_start and employee.role.can_be_assigned:
-             employee.current_order_id = None 
+        values = {"is_on_shift": is_start}
+        if not is_start and staff.is_courier:
+             values["current_order_id"] = None
+
+        # staff.is_on_shift з кешу процесу може бути застарілим, тож стан перевіряє сам UPDATE
+        async def save_shift(write_session: AsyncSession) -> bool:
+            result = await write_session.execute(
+                update(Employee).where(Employee.id == staff.id, Employee.is_on_shift.is_not(is_start)).values(**values)
+            )
+            return result.rowcount > 0
+
+        changed = await write_coordinator.run(save_shift)
+        forget_staff(staff.telegram_user_id)
 
-        await session.commit()
-        action = "начали" if is_start else "завершили"
-        
         keyboard = None
-        if employee.role.can_be_assigned:
-            keyboard = get_courier_keyboard(employee.is_on_shift)
-        elif employee.role.can_manage_orders:
-            keyboard = get_operator_keyboard(employee.is_on_shift)
-        
+        if staff.is_courier:
+            keyboard = get_courier_keyboard(is_start)
+        elif staff.is_operator:
+            keyboard = get_operator_keyboard(is_start)
+
+        if not changed:
+            await message.answer(f"Ваш статус уже {'на смене' if is_start else 'не на смене'}.", reply_markup=keyboard)
+            return
+        action = "начали" if is_start else "завершили"
         await message.answer(f"✅ Вы успешно {action} смену.", reply_markup=keyboard)
 
 
     @dp_admin.message(F.text == "🚪 Выйти")
-    async def logout_handler(message: Message, session: AsyncSession):
-        employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == message.from_user.id))
-        if employee:
-            employee.telegram_user_id = None
-            employee.is_on_shift = False
-            employee.current_order_id = None
-            await session.commit()
+    async def logout_handler(message: Message, session: AsyncSession, staff: Optional[StaffMember]):
+        if staff:
+            async def save_logout(write_session: AsyncSession):
+                await write_session.execute(
+                    update(Employee).where(Employee.id == staff.id)
+                    .values(telegram_user_id=None, is_on_shift=False, current_order_id=None)
+                )
+
+            await write_coordinator.run(save_logout)
+            forget_staff(staff.telegram_user_id)
             await message.answer("👋 Вы вышли из системы.", reply_markup=get_staff_login_keyboard())
         else:
             await message.answer("❌ Вы не авторизованы.")
 
     @dp_admin.message(F.text.in_({"📦 Мои заказы", "📦 Активные заказы"}))
-    async def handle_show_orders_by_role(message: Message, session: AsyncSession, **kwargs: Dict[str, Any]):
-        employee = await session.scalar(
-            select(Employee).where(Employee.telegram_user_id == message.from_user.id).options(joinedload(Employee.role))
-        )
-        if not employee:
+    async def handle_show_orders_by_role(message: Message, session: AsyncSession, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
+        if not staff:
             return await message.answer("❌ Вы не авторизованы.")
 
-        if employee.role.can_be_assigned:
-            await show_courier_orders(message, session)
-        elif employee.role.can_manage_orders:
+        if staff.is_courier:
+            await show_courier_orders(message, session, staff)
+        elif staff.is_operator:
             await show_operator_orders(message, session)
         else:
             await message.answer("❌ Ваша роль не позволяет просматривать заказы.")
@@ -257,7 +238,7 @@ def register_courier_handlers(dp_admin: Dispatcher):
         parts = callback.data.split("_")
         order_id = int(parts[3])
 
-        order = await session.get(Order, order_id)
+        order = await get_order(session, order_id, "list")
         if not order: return await callback.answer("Заказ не найден.")
 
         status_name = order.status.name if order.status else 'Неизвестный'
@@ -271,10 +252,7 @@ def register_courier_handlers(dp_admin: Dispatcher):
         text += f"Сумма: {order.total_price} грн\n\n"
         
         kb = InlineKeyboardBuilder()
-        statuses_res = await session.execute(
-            select(OrderStatus).where(OrderStatus.visible_to_courier == True).order_by(OrderStatus.id)
-        )
-        courier_statuses = statuses_res.scalars().all()
+        courier_statuses = (await get_reference_data(session)).courier_statuses
         
         status_buttons = [
             InlineKeyboardButton(text=status.name, callback_data=f"courier_set_status_{order.id}_{status.id}")
@@ -292,54 +270,52 @@ def register_courier_handlers(dp_admin: Dispatcher):
         await callback.answer()
 
     @dp_admin.callback_query(F.data == "show_courier_orders_list")
-    async def back_to_list(callback: CallbackQuery, session: AsyncSession, **kwargs: Dict[str, Any]):
-        await show_courier_orders(callback, session)
+    async def back_to_list(callback: CallbackQuery, session: AsyncSession, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
+        await show_courier_orders(callback, session, staff)
 
     @dp_admin.callback_query(F.data.startswith("courier_set_status_"))
-    async def courier_set_status(callback: CallbackQuery, session: AsyncSession, **kwargs: Dict[str, Any]):
-        client_bot = dp_admin.get("client_bot")
-        employee = await session.scalar(select(Employee).where(Employee.telegram_user_id == callback.from_user.id))
-        actor_info = f"Курьер: {employee.full_name}" if employee else f"Курьер (ID: {callback.from_user.id})"
+    async def courier_set_status(callback: CallbackQuery, session: AsyncSession, staff: Optional[StaffMember], **kwargs: Dict[str, Any]):
+        actor_info = f"Курьер: {staff.full_name}" if staff else f"Курьер (ID: {callback.from_user.id})"
         
         parts = callback.data.split("_")
         order_id = int(parts[3])
         new_status_id = int(parts[4])
         
-        order = await session.get(Order, order_id)
+        order = await get_order(session, order_id, "list")
         if not order: return await callback.answer("Заказ не найден.")
         
-        new_status = await session.get(OrderStatus, new_status_id)
+        new_status = (await get_reference_data(session)).status(new_status_id)
         if not new_status:
             return await callback.answer(f"Ошибка: Статус с ID {new_status_id} не найден.")
 
         old_status_name = order.status.name if order.status else 'Неизвестный'
-        order.status_id = new_status.id
         alert_text = f"Статус изменен: {new_status.name}"
-
-        if new_status.is_completed_status or new_status.is_cancelled_status:
-            if employee and employee.current_order_id == order_id:
-                employee.current_order_id = None
-            if new_status.is_completed_status:
-                order.completed_by_courier_id = order.courier_id
-
-        # ДОБАВЛЕНО: Создание записи в истории
-        history_entry = OrderStatusHistory(
-            order_id=order.id,
-            status_id=new_status.id,
-            actor_info=actor_info
-        )
-        session.add(history_entry)
-
-        await session.commit()
-        
-        await notify_all_parties_on_status_change(
-            order=order,
-            old_status_name=old_status_name,
-            actor_info=actor_info,
-            admin_bot=callback.bot,
-            client_bot=client_bot,
-            session=session
-        )
+        is_final_status = new_status.is_completed_status or new_status.is_cancelled_status
+        employee_id = staff.id if staff else None
+
+        async def save_status(write_session: AsyncSession):
+            order_to_update = await write_session.get(Order, order_id)
+            before = await order_snapshot(write_session, order_to_update)
+            order_to_update.status_id = new_status_id
+
+            if is_final_status:
+                courier = await write_session.get(Employee, employee_id) if employee_id else None
+                if courier and courier.current_order_id == order_id:
+                    courier.current_order_id = None
+                if new_status.is_completed_status:
+                    order_to_update.completed_by_courier_id = order_to_update.courier_id
+
+            # ДОБАВЛЕНО: Создание записи в истории
+            write_session.add(OrderStatusHistory(
+                order_id=order_id,
+                status_id=new_status_id,
+                actor_info=actor_info
+            ))
+            await update_customer_stats(write_session, order_to_update, before)
+            add_status_change_event(write_session, order_id, old_status_name, actor_info)
+
+        await write_coordinator.run(save_status)
+        await session.refresh(order)
 
         await callback.answer(alert_text)
-        await show_courier_orders(callback, session)
\ No newline at end of file
+        await show_courier_orders(callback, session, staff)
\ No newline at end of file
@@ -0,0 +1,66 @@
+# customer_lookup.py
+"""
+Пошук клієнта за телефоном для автозаповнення форми на сайті (/api/customer_info).
+
+Ім'я, телефон і остання адреса беруться з customer_stats — одного рядка за первинним ключем
+phone_key. Цю таблицю оновлюють усі шляхи створення та зміни замовлень (customer_stats.py),
+тож вона завжди відповідає останньому замовленню клієнта.
+
+Перед БД стоять:
+- LRU на CUSTOMER_INFO_CACHE_SIZE телефонів (і знайдених, і не знайдених) з часом життя
+  CUSTOMER_INFO_CACHE_SECONDS; update_customer_stats скидає запис клієнта в цьому процесі,
+  інші воркери побачать зміну не пізніше, ніж через час життя запису;
+- обмеження частоти запитів з однієї IP-адреси (token bucket): CUSTOMER_INFO_RATE запитів
+  на секунду з запасом CUSTOMER_INFO_BURST; понад це — 429 з Retry-After.
+"""
+
+import math
+from dataclasses import dataclass
+from os import getenv
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from queries import customer_profile_query
+from memory_utils import TTLCache, RateLimiter
+
+CUSTOMER_INFO_CACHE_SIZE = int(getenv("CUSTOMER_INFO_CACHE_SIZE", "2048"))
+CUSTOMER_INFO_CACHE_SECONDS = float(getenv("CUSTOMER_INFO_CACHE_SECONDS", "60"))
+CUSTOMER_INFO_RATE = float(getenv("CUSTOMER_INFO_RATE", "2"))
+CUSTOMER_INFO_BURST = float(getenv("CUSTOMER_INFO_BURST", "10"))
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class CustomerProfile:
+    customer_name: Optional[str]
+    phone_number: str
+    address: Optional[str]
+
+
+customer_info_cache: TTLCache[Optional[CustomerProfile]] = TTLCache(CUSTOMER_INFO_CACHE_SIZE, CUSTOMER_INFO_CACHE_SECONDS)
+customer_info_limiter = RateLimiter(CUSTOMER_INFO_RATE, CUSTOMER_INFO_BURST)
+
+
+async def find_customer(session: AsyncSession, phone_key: Optional[str]) -> Optional[CustomerProfile]:
+    """Профіль клієнта за канонічним телефоном; None — замовлень з цим телефоном немає."""
+    if not phone_key:
+        return None
+    profile = customer_info_cache.get(phone_key, _MISSING)
+    if profile is not _MISSING:
+        return profile
+    row = (await session.execute(customer_profile_query(phone_key))).first()
+    profile = CustomerProfile(row.customer_name, row.phone_number, row.address) if row else None
+    customer_info_cache.put(phone_key, profile)
+    return profile
+
+
+def forget_customer(phone_key: Optional[str]):
+    """Скидає закешований профіль після зміни замовлень клієнта."""
+    if phone_key:
+        customer_info_cache.discard(phone_key)
+
+
+def retry_after_header(wait: float) -> dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(wait)))}
@@ -0,0 +1,190 @@
+# customer_stats.py
+"""
+Підтримка таблиці customer_stats (агрегати по клієнтах для /admin/clients).
+
+Код, що створює або змінює замовлення, викликає update_customer_stats() у тій самій сесії
+перед комітом. Для змін статусу чи суми передається знімок замовлення до зміни
+(order_snapshot), і в customer_stats додається лише різниця — без перерахунку всіх замовлень.
+Якщо змінився телефон замовлення, записи старого й нового клієнта перераховуються
+за індексом orders.phone_key. Закешовані профілі змінених клієнтів (customer_lookup)
+скидаються після коміту транзакції, а не всередині неї.
+
+    python customer_stats.py rebuild   # повний перерахунок з таблиці orders
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import select, func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from models import engine, Order, OrderStatus, CustomerStats, ArchivedOrder
+from customer_lookup import forget_customer
+from db_writer import run_after_commit
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OrderSnapshot:
+    phone_key: Optional[str]
+    order_count: int
+    total_spent: int
+
+
+def _forget_after_commit(session: AsyncSession, *phone_keys: Optional[str]):
+    # Скидання всередині транзакції дозволило б паралельному читачу закешувати ще старий профіль
+    for phone_key in phone_keys:
+        if phone_key:
+            run_after_commit(session, ("forget_customer", phone_key), partial(forget_customer, phone_key))
+
+
+async def order_snapshot(session: AsyncSession, order: Order) -> OrderSnapshot:
+    """Внесок замовлення в агрегати клієнта. Викликати до зміни замовлення."""
+    status = await session.get(OrderStatus, order.status_id)
+    counted = 0 if status and status.is_cancelled_status else 1
+    return OrderSnapshot(order.phone_key, counted, (order.total_price or 0) * counted)
+
+
+async def update_customer_stats(session: AsyncSession, order: Order, before: Optional[OrderSnapshot] = None):
+    """
+    Оновлює customer_stats після створення (before=None) або зміни замовлення.
+    Має викликатися в тій самій транзакції, що й зміна замовлення.
+    """
+    await session.flush()
+    after = await order_snapshot(session, order)
+    _forget_after_commit(session, after.phone_key, before.phone_key if before else None)
+
+    if before and before.phone_key != after.phone_key:
+        for phone_key in (before.phone_key, after.phone_key):
+            if phone_key:
+                await recompute_customer(session, phone_key)
+        return
+    if not after.phone_key:
+        return
+
+    # Час створення беремо з БД: created_at заповнюється на боці SQLite
+    created_at = select(Order.created_at).where(Order.id == order.id).scalar_subquery()
+    stmt = sqlite_insert(CustomerStats).values(
+        phone_key=after.phone_key,
+        phone_number=order.phone_number,
+        customer_name=order.customer_name,
+        address=order.address,
+        order_count=after.order_count - (before.order_count if before else 0),
+        total_spent=after.total_spent - (before.total_spent if before else 0),
+        first_order_at=created_at,
+        last_order_at=created_at,
+        last_order_id=order.id,
+    )
+    excluded = stmt.excluded
+    is_latest = excluded.last_order_id >= CustomerStats.last_order_id
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CustomerStats.phone_key],
+        set_={
+            "order_count": CustomerStats.order_count + excluded.order_count,
+            "total_spent": CustomerStats.total_spent + excluded.total_spent,
+            "first_order_at": func.min(CustomerStats.first_order_at, excluded.first_order_at),
+            "last_order_at": func.max(CustomerStats.last_order_at, excluded.last_order_at),
+            "last_order_id": func.max(CustomerStats.last_order_id, excluded.last_order_id),
+            # Ім'я та адреса — з найновішого замовлення клієнта
+            "phone_number": case((is_latest, excluded.phone_number), else_=CustomerStats.phone_number),
+            "customer_name": case((is_latest, excluded.customer_name), else_=CustomerStats.customer_name),
+            "address": case((is_latest, func.coalesce(excluded.address, CustomerStats.address)), else_=CustomerStats.address),
+        },
+    )
+    await session.execute(stmt)
+
+
+def _aggregate_query(phone_key: Optional[str] = None) -> sa.Select:
+    """
+    Агрегати customer_stats, пораховані з таблиці orders разом з архівом orders_archive
+    (для всіх клієнтів або одного).
+    """
+    cancelled_ids = select(OrderStatus.id).where(OrderStatus.is_cancelled_status == True)
+
+    def orders_of(model) -> sa.Select:
+        return (
+            select(model.id, model.phone_key, model.status_id, model.total_price, model.created_at)
+            .where(model.phone_key.isnot(None) if phone_key is None else model.phone_key == phone_key)
+        )
+
+    all_orders = sa.union_all(orders_of(Order), orders_of(ArchivedOrder)).subquery()
+    counted = case((all_orders.c.status_id.in_(cancelled_ids), 0), else_=1)
+    totals = (
+        select(
+            all_orders.c.phone_key.label("phone_key"),
+            func.sum(counted).label("order_count"),
+            func.sum(counted * all_orders.c.total_price).label("total_spent"),
+            func.min(all_orders.c.created_at).label("first_order_at"),
+            func.max(all_orders.c.created_at).label("last_order_at"),
+            func.max(all_orders.c.id).label("last_order_id"),
+        )
+        .group_by(all_orders.c.phone_key)
+        .subquery()
+    )
+
+    def latest(column) -> sa.ColumnElement:
+        """Значення з останнього замовлення клієнта — воно в одній з двох таблиць, пошук за первинним ключем."""
+        return func.coalesce(*[
+            select(getattr(model, column)).where(model.id == totals.c.last_order_id).scalar_subquery()
+            for model in (Order, ArchivedOrder)
+        ]).label(column)
+
+    # Остання відома адреса: архівні замовлення старші за робочі, тож архів — лише запасний варіант
+    latest_address = func.coalesce(*[
+        select(model.address)
+        .where(model.phone_key == totals.c.phone_key, model.address.isnot(None))
+        .order_by(model.id.desc())
+        .limit(1)
+        .scalar_subquery()
+        for model in (Order, ArchivedOrder)
+    ]).label("address")
+    return select(
+        totals.c.phone_key, latest("phone_number"), latest("customer_name"), latest_address,
+        totals.c.order_count, totals.c.total_spent, totals.c.first_order_at, totals.c.last_order_at, totals.c.last_order_id,
+    )
+
+
+_STATS_COLUMNS = ["phone_key", "phone_number", "customer_name", "address", "order_count", "total_spent",
+                  "first_order_at", "last_order_at", "last_order_id"]
+
+
+async def recompute_customer(session: AsyncSession, phone_key: str):
+    """Перераховує запис одного клієнта за індексом orders.phone_key."""
+    _forget_after_commit(session, phone_key)
+    await session.execute(sa.delete(CustomerStats).where(CustomerStats.phone_key == phone_key))
+    await session.execute(sa.insert(CustomerStats).from_select(_STATS_COLUMNS, _aggregate_query(phone_key)))
+
+
+async def fill_customer_stats(conn: AsyncConnection) -> int:
+    """Перебудовує customer_stats у поточній транзакції conn (крок міграції). Повертає кількість клієнтів."""
+    await conn.execute(sa.delete(CustomerStats))
+    await conn.execute(sa.insert(CustomerStats).from_select(_STATS_COLUMNS, _aggregate_query()))
+    count = await conn.scalar(select(func.count()).select_from(CustomerStats))
+    logger.info(f"customer_stats перебудовано: {count} клієнтів.")
+    return count
+
+
+async def rebuild_customer_stats(db_engine: AsyncEngine = engine) -> int:
+    """Повністю перебудовує customer_stats з таблиці orders в одній транзакції."""
+    async with db_engine.begin() as conn:
+        return await fill_customer_stats(conn)
+
+
+async def _main(args):
+    if args.command == "rebuild":
+        print(f"Клієнтів: {await rebuild_customer_stats()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Обслуговування таблиці customer_stats")
+    parser.add_argument("command", choices=["rebuild"])
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,172 @@
+# db_writer.py
+"""
+Координатор записів у SQLite.
+
+Усі невеликі записи (замовлення, історія статусів, кошик) передаються сюди як
+функція `work(session)`, яка лише змінює об'єкти і НЕ викликає commit.
+
+- режим "queue": одне виділене з'єднання-письменник забирає роботи з asyncio-черги,
+  виконує пачку в одній транзакції і після COMMIT повертає результат кожному викликачу.
+  Якщо якась робота падає, пачка відкочується і виконується повторно по одній роботі
+  на транзакцію, тож помилка однієї не скасовує інші (роботи мають бути придатні
+  до повторного запуску — вони лише читають і змінюють дані в переданій сесії);
+- режим "direct": кожна робота виконується в окремій сесії з власним commit
+  (стара поведінка, також використовується, поки координатор не запущений).
+
+Результатом роботи краще робити прості значення (наприклад, id замовлення):
+ORM-об'єкти сесії письменника після коміту від'єднані від неї.
+Дії, що мають статися лише після коміту (скидання кешів, пробудження диспетчера outbox),
+робота реєструє через run_after_commit(write_session, key, callback): координатор викликає
+їх після COMMIT з'єднання, а якщо транзакцію відкочено — відкидає.
+Читання, як і раніше, йде через звичайні сесії з пулу.
+"""
+
+import asyncio
+import logging
+from os import getenv
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from models import engine, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteWork = Callable[[AsyncSession], Awaitable[T]]
+
+DB_WRITE_MODE = getenv("DB_WRITE_MODE", "queue")
+DB_WRITE_BATCH_MAX = int(getenv("DB_WRITE_BATCH_MAX", "50"))
+
+_STOP = object()
+_AFTER_COMMIT = "after_commit_callbacks"
+
+
+def run_after_commit(session: AsyncSession, key: Hashable, callback: Callable[[], Any]):
+    """Викликати callback() після коміту транзакції роботи; з однаковим key — один раз."""
+    session.info.setdefault(_AFTER_COMMIT, {})[key] = callback
+
+
+def _run_after_commit_callbacks(session: AsyncSession):
+    for key, callback in session.info.pop(_AFTER_COMMIT, {}).items():
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Помилка дії після коміту '{key}': {e}", exc_info=True)
+
+
+class WriteCoordinator:
+    def __init__(self, db_engine: AsyncEngine, session_maker, mode: str = "queue", max_batch: int = 50):
+        if mode not in ("queue", "direct"):
+            raise ValueError(f"Невідомий режим запису '{mode}'. Доступні: queue, direct")
+        self.engine = db_engine
+        self.session_maker = session_maker
+        self.mode = mode
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._connection: AsyncConnection | None = None
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.mode != "queue" or self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._connection = await self.engine.connect()
+        self._worker = asyncio.create_task(self._worker_loop())
+        logger.info(f"Координатор записів запущено (пачка до {self.max_batch} записів).")
+
+    async def stop(self):
+        """Дочікується виконання всіх поставлених у чергу записів і закриває з'єднання."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+        await self._connection.close()
+        self._connection = None
+        logger.info(f"Координатор записів зупинено. Пачок: {self.batches}, записів: {self.writes}.")
+
+    async def run(self, work: WriteWork[T]) -> T:
+        """Виконує роботу в транзакції та повертає її результат після коміту."""
+        if self.mode == "direct" or not self.running:
+            return await self._run_direct(work)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((work, future))
+        return await future
+
+    async def _run_direct(self, work: WriteWork[T]) -> T:
+        async with self.session_maker() as session:
+            result = await work(session)
+            await session.commit()
+            _run_after_commit_callbacks(session)
+            return result
+
+    async def _worker_loop(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._process_batch(batch)
+
+    async def _run_in_transaction(self, batch: list[tuple[WriteWork[Any], asyncio.Future]]) -> list[Any]:
+        """Виконує всі роботи пачки в одній транзакції. Будь-яка помилка відкочує всю пачку."""
+        # BEGIN IMMEDIATE одразу бере блокування на запис, щоб не ловити SQLITE_BUSY на середині пачки
+        await self._connection.exec_driver_sql("BEGIN IMMEDIATE")
+        session = AsyncSession(bind=self._connection, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            results = []
+            for work, _ in batch:
+                results.append(await work(session))
+            await session.commit()
+            # session.commit() лише звільняє SAVEPOINT: дані видно іншим з'єднанням після цього COMMIT
+            await self._connection.commit()
+            _run_after_commit_callbacks(session)
+            return results
+        except BaseException:
+            await self._connection.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def _process_batch(self, batch: list[tuple[WriteWork[Any], asyncio.Future]]):
+        try:
+            results = await self._run_in_transaction(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], error=e)
+                return
+            logger.warning(f"Пачку з {len(batch)} записів відкочено ({e}), виконую записи по одному.")
+            for item in batch:
+                await self._process_batch([item])
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, future), result in zip(batch, results):
+            self._resolve(future, result=result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, error: Exception | None = None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+write_coordinator = WriteCoordinator(engine, async_session_maker, mode=DB_WRITE_MODE, max_batch=DB_WRITE_BATCH_MAX)
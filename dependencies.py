@@ -6,6 +6,7 @@ from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import async_session_maker
+from bot_instances import BotRegistry, bot_registry
 
 security = HTTPBasic()
 
@@ -25,3 +26,8 @@ async def get_db_session() -> Generator[AsyncSession, None, None]:
     """Создает и предоставляет сессию базы данных для эндпоинта."""
     async with async_session_maker() as session:
         yield session
+
+async def get_bot_registry() -> BotRegistry:
+    """Спільні боти процесу; заодно підхоплює зміну токенів, збережену іншим воркером."""
+    await bot_registry.refresh()
+    return bot_registry
@@ -0,0 +1,84 @@
+# fan_out.py
+"""
+Розсилка одного сповіщення кільком отримувачам одночасно.
+
+fan_out() надсилає список Notice через чергу telegram_sender паралельно, не більше
+FANOUT_CONCURRENCY одночасно, і повертає DeliveryReport: що й кому доставлено, що ні
+і скільки це тривало. Помилка одного отримувача не зупиняє інших. Порядок і темп
+надсилання в межах чату й пріоритетів і далі визначає черга (send_scheduler.py).
+
+Використовується всіма сповіщеннями з кількома отримувачами: нове замовлення
+(адмін-чат і оператори на зміні), зміна статусу (адмін-чат, кур'єр, клієнт),
+призначення кур'єра (попередній і новий кур'єр, адмін-чат).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Iterable, Optional
+
+from aiogram import Bot
+
+from send_scheduler import telegram_sender, PRIORITY_STAFF
+
+logger = logging.getLogger(__name__)
+
+FANOUT_CONCURRENCY = int(getenv("FANOUT_CONCURRENCY", "8"))
+
+
+@dataclass(frozen=True)
+class Notice:
+    label: str  # для звіту й логу: "оператор 5", "адмін-чат"
+    bot: Bot
+    chat_id: int | str
+    text: str
+    priority: int = PRIORITY_STAFF
+    options: dict[str, Any] = field(default_factory=dict)  # reply_markup тощо
+
+
+@dataclass(frozen=True)
+class Delivery:
+    label: str
+    chat_id: int | str
+    result: Any = None
+    error: Optional[BaseException] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass(frozen=True)
+class DeliveryReport:
+    deliveries: tuple[Delivery, ...] = ()
+
+    @property
+    def delivered(self) -> list[Delivery]:
+        return [d for d in self.deliveries if d.ok]
+
+    @property
+    def failed(self) -> list[Delivery]:
+        return [d for d in self.deliveries if not d.ok]
+
+    def log_failures(self, context: str):
+        for delivery in self.failed:
+            logger.error(f"{context}: не вдалося надіслати ({delivery.label}, чат {delivery.chat_id}): {delivery.error}")
+
+
+async def fan_out(notices: Iterable[Notice], concurrency: int = FANOUT_CONCURRENCY) -> DeliveryReport:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def deliver(notice: Notice) -> Delivery:
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await telegram_sender.send_message(notice.bot, notice.chat_id, notice.text,
+                                                            priority=notice.priority, **notice.options)
+            except Exception as e:
+                return Delivery(notice.label, notice.chat_id, error=e, seconds=time.monotonic() - started)
+            return Delivery(notice.label, notice.chat_id, result=result, seconds=time.monotonic() - started)
+
+    return DeliveryReport(tuple(await asyncio.gather(*(deliver(notice) for notice in notices))))
@@ -0,0 +1,147 @@
+# fsm_storage.py
+"""
+Сховище станів FSM ботів у SQLite (таблиця fsm_states) замість MemoryStorage aiogram.
+
+Стан і дані кожного ключа (бот, чат, користувач) — один рядок з часом життя:
+кожен запис продовжує його на FSM_TTL_HOURS годин, а прострочені рядки не читаються
+і раз на FSM_SWEEP_MINUTES хвилин видаляються фоновим run_fsm_sweeper(). Тож покинуте
+оформлення замовлення не лежить у пам'яті вічно, переживає перезапуск і бачиться
+іншими процесами.
+
+Записи йдуть через write_coordinator (db_writer.py) і після коміту потрапляють у LRU
+процесу на FSM_CACHE_SIZE ключів, з якого й читаються наступні get_state / get_data
+того самого апдейту та діалогу. Запис LRU живе FSM_CACHE_SECONDS секунд — якщо апдейти
+одного чату можуть обробляти різні процеси (webhook за балансувальником), варто
+поставити FSM_CACHE_SECONDS=0, щоб кожне читання йшло в БД.
+"""
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Dict, Mapping, Optional
+
+import sqlalchemy as sa
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import FsmState, async_session_maker
+from db_writer import write_coordinator
+from memory_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+FSM_TTL_HOURS = float(getenv("FSM_TTL_HOURS", "24"))
+FSM_SWEEP_MINUTES = float(getenv("FSM_SWEEP_MINUTES", "30"))
+FSM_CACHE_SIZE = int(getenv("FSM_CACHE_SIZE", "4096"))
+FSM_CACHE_SECONDS = float(getenv("FSM_CACHE_SECONDS", "60"))
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+def _not_expired():
+    # expires_at пишеться функцією datetime() SQLite (UTC), тож порівнюємо з нею ж
+    return FsmState.expires_at > func.datetime("now")
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, ttl_hours: float = FSM_TTL_HOURS,
+                 cache_size: int = FSM_CACHE_SIZE, cache_seconds: float = FSM_CACHE_SECONDS):
+        self.ttl_seconds = int(ttl_hours * 3600)
+        self.cache: TTLCache[_Record] = TTLCache(cache_size, cache_seconds)
+
+    async def _read(self, key: str) -> _Record:
+        record = self.cache.get(key, _MISSING)
+        if record is _MISSING:
+            async with async_session_maker() as session:
+                row = (await session.execute(
+                    select(FsmState.state, FsmState.data).where(FsmState.key == key, _not_expired())
+                )).first()
+            record = _Record(row.state, json.loads(row.data)) if row else _Record()
+            self.cache.put(key, record)
+        return record
+
+    async def _write(self, key: str, values: Mapping[str, Any]):
+        """Змінює стан або дані ключа і продовжує його життя; порожній запис видаляється."""
+        expires_at = func.datetime("now", f"+{self.ttl_seconds} seconds")
+
+        async def save(write_session: AsyncSession) -> _Record:
+            # Прострочений рядок не має передати свій стан чи дані новому діалогу
+            await write_session.execute(sa.delete(FsmState).where(FsmState.key == key, ~_not_expired()))
+            stmt = sqlite_insert(FsmState).values(key=key, expires_at=expires_at, **values)
+            await write_session.execute(stmt.on_conflict_do_update(
+                index_elements=[FsmState.key], set_={**values, "expires_at": expires_at},
+            ))
+            row = (await write_session.execute(select(FsmState.state, FsmState.data).where(FsmState.key == key))).one()
+            if row.state is None and row.data == "{}":
+                await write_session.execute(sa.delete(FsmState).where(FsmState.key == key))
+            return _Record(row.state, json.loads(row.data))
+
+        self.cache.put(key, await write_coordinator.run(save))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = _key(key)
+        state = state.state if isinstance(state, State) else state
+        # state.clear() для користувача без стану (наприклад, /start) не потребує запису
+        if state is None and await self._read(key) == _Record():
+            return
+        await self._write(key, {"state": state})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._read(_key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = _key(key)
+        if not data and await self._read(key) == _Record():
+            return
+        await self._write(key, {"data": json.dumps(dict(data), ensure_ascii=False)})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._read(_key(key))).data)
+
+    async def close(self) -> None:
+        pass
+
+
+fsm_storage = SQLiteStorage()
+
+
+async def sweep_expired_states() -> int:
+    async def sweep(write_session: AsyncSession) -> int:
+        result = await write_session.execute(sa.delete(FsmState).where(~_not_expired()))
+        return result.rowcount
+
+    removed = await write_coordinator.run(sweep)
+    if removed:
+        logger.info(f"Видалено прострочених станів FSM: {removed}.")
+    return removed
+
+
+async def run_fsm_sweeper(interval_minutes: float = FSM_SWEEP_MINUTES):
+    """Фонове завдання для lifespan: періодично видаляє прострочені стани FSM."""
+    if interval_minutes <= 0:
+        return
+    while True:
+        try:
+            await sweep_expired_states()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Помилка очищення станів FSM: {e}", exc_info=True)
+        await asyncio.sleep(interval_minutes * 60)
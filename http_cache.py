@@ -0,0 +1,52 @@
+# http_cache.py
+"""
+Умовні GET-запити (ETag / Last-Modified / 304) для публічних API вітрини.
+
+Валідатори беруться з версій вмісту (cache_versions.py): ETag — сильний, з номера версії
+і короткого хешу самих байтів відповіді, тож він змінюється разом з вмістом навіть після
+відновлення БД з копії; Last-Modified — час, коли версію востаннє збільшили.
+Для запиту з If-None-Match (або, якщо його немає, з If-Modified-Since) і незмінним
+вмістом віддається 304 без тіла.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Меню (ціни, наявність страв) браузер перепитує при кожному відкритті сторінки — відповідь 304 дешева
+MENU_CACHE_CONTROL = "public, no-cache"
+# Інформаційні сторінки змінюються рідко: 5 хвилин без перепитування, далі — перевірка за ETag
+PAGE_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+
+
+def make_etag(prefix: str, version: int, body: bytes) -> str:
+    return f'"{prefix}{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional_response(request: Request, body: bytes, etag: str, last_modified: Optional[datetime],
+                         cache_control: str, media_type: str = "application/json") -> Response:
+    """Відповідь з валідаторами; 304 без тіла, якщо в клієнта та сама версія."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        last_modified = last_modified.replace(tzinfo=timezone.utc) if last_modified.tzinfo is None else last_modified
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,138 @@
+# index_advisor.py
+"""
+Перевірка планів частих запитів.
+
+    python index_advisor.py --orders 50000
+
+Створює тимчасову БД зі схемою з models.py, наповнює її великою кількістю замовлень,
+виконує ANALYZE і проганяє EXPLAIN QUERY PLAN для кожного запиту з queries.HOT_QUERIES.
+Якщо план хоча б одного запиту повністю сканує велику таблицю (SCAN без пошуку за індексом),
+скрипт завершується з кодом 1 — значить, бракує індексу або запит написано так,
+що індекс не використовується.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from models import Base, Order, OrderItem, OrderStatus, OrderStatusHistory, Role, Employee, create_engine_for_profile, normalize_phone
+from customer_stats import rebuild_customer_stats
+from queries import HOT_QUERIES
+
+# Довідники з кількома рядками: повний перегляд для них дешевший за індекс, їх не перевіряємо
+REFERENCE_TABLES = {"order_statuses", "roles", "settings", "menu_items", "categories"}
+
+CHUNK_SIZE = 5000
+
+
+async def seed_database(engine, orders_count: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(sa.insert(OrderStatus), [
+            {"id": 1, "name": "Новый"}, {"id": 2, "name": "В обработке"}, {"id": 3, "name": "Готов"},
+            {"id": 4, "name": "Доставлен", "is_completed_status": True},
+            {"id": 5, "name": "Отменен", "is_cancelled_status": True},
+        ])
+        await conn.execute(sa.insert(Role), [{"id": 1, "name": "Оператор"}, {"id": 2, "name": "Курьер", "can_be_assigned": True}])
+        await conn.execute(sa.insert(Employee), [
+            {"id": i, "full_name": f"Кур'єр {i}", "role_id": 2, "is_on_shift": True} for i in range(1, 51)
+        ])
+
+        rnd = random.Random(42)
+        now = datetime.now()
+        for start in range(1, orders_count + 1, CHUNK_SIZE):
+            ids = range(start, min(start + CHUNK_SIZE, orders_count + 1))
+            orders = []
+            for order_id in ids:
+                phone = f"+38050{rnd.randint(0, orders_count // 3):07d}"
+                # Більшість замовлень — давно завершені, як у реальній базі
+                status_id = rnd.choice([4] * 8 + [5, 1, 2, 3]) if order_id < orders_count * 0.98 else rnd.randint(1, 3)
+                courier_id = rnd.randint(1, 50)
+                orders.append({
+                    "id": order_id, "user_id": 100000 + rnd.randint(0, orders_count // 5),
+                    "products": "Борщ x 1", "total_price": 150, "customer_name": "Клієнт",
+                    "phone_number": phone, "phone_key": normalize_phone(phone), "status_id": status_id,
+                    "courier_id": courier_id, "completed_by_courier_id": courier_id if status_id == 4 else None,
+                    "created_at": now - timedelta(minutes=(orders_count - order_id) * 5),
+                })
+            await conn.execute(sa.insert(Order), orders)
+            await conn.execute(sa.insert(OrderItem), [
+                {"order_id": order_id, "product_id": None, "name": "Борщ", "price": 150, "quantity": 1} for order_id in ids
+            ])
+            await conn.execute(sa.insert(OrderStatusHistory), [
+                {"order_id": order_id, "status_id": 1, "actor_info": "seed"} for order_id in ids
+            ])
+    await rebuild_customer_stats(engine)
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+
+
+def full_scans(plan_rows, limited: bool) -> list[str]:
+    """
+    Повертає рядки плану з повним переглядом великих таблиць.
+    Перегляд у порядку індексу для запиту з LIMIT не рахується: він зупиняється після першої сторінки.
+    """
+    scans = []
+    for row in plan_rows:
+        detail = row[-1]
+        if not detail.startswith("SCAN "):
+            continue
+        if limited and " INDEX " in detail:
+            continue
+        table = detail.split()[1]
+        # Перегляд вже відібраних рядків підзапиту (anon_N у SQLAlchemy) — не перегляд таблиці
+        if table.startswith("anon_") or table.startswith("(subquery"):
+            continue
+        # Псевдоніми SQLAlchemy для JOIN мають суфікс: roles_1 -> roles
+        if re.sub(r"_\d+$", "", table) not in REFERENCE_TABLES:
+            scans.append(detail)
+    return scans
+
+
+async def check_plans(engine, verbose: bool) -> list[str]:
+    failed = []
+    async with engine.connect() as conn:
+        for name, build_query in HOT_QUERIES.items():
+            sql = str(build_query().compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan_rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")).all()
+            scans = full_scans(plan_rows, limited=" LIMIT " in sql)
+            print(f"{'FAIL' if scans else 'OK':<5} {name}")
+            if verbose or scans:
+                for row in plan_rows:
+                    print(f"      {row[-1]}")
+            if scans:
+                failed.append(name)
+    return failed
+
+
+async def run(args) -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine_for_profile(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'advisor.db')}", "bench")
+        await seed_database(engine, args.orders)
+        failed = await check_plans(engine, args.verbose)
+        await engine.dispose()
+
+    if failed:
+        print(f"\nПовний перегляд таблиці у запитах: {', '.join(failed)}")
+        return 1
+    print(f"\nУсі {len(HOT_QUERIES)} запитів використовують індекси.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевірка EXPLAIN QUERY PLAN для частих запитів crm_bot")
+    parser.add_argument("--orders", type=int, default=50000, help="Кількість замовлень у тестовій БД")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Показувати план кожного запиту")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# landing_page.py
+"""
+Готова головна сторінка сайту (/) в пам'яті процесу.
+
+Сторінка залежить лише від логотипу з налаштувань і пунктів меню сайту, тому рендериться
+з шаблону WEB_ORDER_HTML один раз на пару (logo_url, версія site_pages) і одразу
+стискається в gzip і, якщо встановлено пакет brotli, в br. Після збереження налаштувань
+або змін у /admin/menu/* ключ змінюється (settings_cache, site_pages), і наступний запит
+рендерить сторінку заново.
+
+Відповідь віддається в найкращому кодуванні з Accept-Encoding клієнта (br, gzip, без стиснення)
+з Vary: Accept-Encoding і ETag для кожного варіанта.
+"""
+
+import gzip
+import html
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from templates import WEB_ORDER_HTML
+from settings_cache import get_settings_snapshot
+from site_pages import get_site_pages
+from http_cache import make_etag, conditional_response
+
+try:
+    import brotli
+except ImportError:  # brotli необов'язковий: без нього віддаємо gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Сторінка змінюється лише з адмін-панелі, але браузер має побачити нове лого чи пункт меню одразу
+LANDING_CACHE_CONTROL = "public, no-cache"
+
+
+@dataclass(frozen=True)
+class LandingVariant:
+    body: bytes
+    etag: str
+    encoding: Optional[str]  # None — без стиснення
+
+
+@dataclass(frozen=True)
+class RenderedLanding:
+    key: tuple
+    variants: dict[str, LandingVariant]  # "br" (якщо є brotli), "gzip", "identity"
+
+    def variant(self, accept_encoding: str) -> LandingVariant:
+        """Варіант для заголовка Accept-Encoding клієнта."""
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return self.variants[encoding]
+        return self.variants["identity"]
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        try:
+            quality = float(params.strip()[2:]) if params.strip().lower().startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+_rendered: Optional[RenderedLanding] = None
+
+
+def _render(logo_url: Optional[str], pages) -> bytes:
+    logo_html = f'<img src="/{logo_url}" alt="Логотип" class="header-logo">' if logo_url else ''
+    menu_links_html = "".join(
+        [f'<a href="#" class="menu-popup-trigger" data-item-id="{page.id}">{html.escape(page.title)}</a>' for page in pages.website_pages]
+    )
+    return WEB_ORDER_HTML.format(logo_html=logo_html, menu_links_html=menu_links_html).encode("utf-8")
+
+
+async def get_landing_page(session: Optional[AsyncSession] = None) -> RenderedLanding:
+    global _rendered
+    settings = await get_settings_snapshot(session)
+    pages = await get_site_pages(session)
+    key = (settings.logo_url, pages.version)
+    if _rendered is None or _rendered.key != key:
+        body = _render(settings.logo_url, pages)
+        encoded = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli:
+            encoded["br"] = brotli.compress(body, quality=11)
+        _rendered = RenderedLanding(key, {
+            name: LandingVariant(data, make_etag(f"l{name}-", pages.version, data), None if name == "identity" else name)
+            for name, data in encoded.items()
+        })
+        logger.info("Головну сторінку перерендерено: " + ", ".join(f"{name} {len(data)} байт" for name, data in encoded.items()))
+    return _rendered
+
+
+def landing_response(request: Request, page: RenderedLanding) -> Response:
+    variant = page.variant(request.headers.get("accept-encoding", ""))
+    response = conditional_response(request, variant.body, variant.etag, None, LANDING_CACHE_CONTROL,
+                                    media_type="text/html; charset=utf-8")
+    response.headers["Vary"] = "Accept-Encoding"
+    if variant.encoding and response.status_code == 200:
+        response.headers["Content-Encoding"] = variant.encoding
+    return response
@@ -23,7 +23,6 @@ import uvicorn
 
 # --- Aiogram ---
 from aiogram import Bot, Dispatcher, F
-from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode, ChatAction
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, FSInputFile, ReplyKeyboardMarkup, KeyboardButton
@@ -39,30 +38,44 @@ import sqlalchemy as sa
 from sqlalchemy import func, and_
 
 # --- Локальні імпорти ---
-from templates import ADMIN_HTML_TEMPLATE, WEB_ORDER_HTML, ADMIN_EMPLOYEE_BODY, ADMIN_ROLES_BODY, ADMIN_REPORTS_BODY, ADMIN_ORDER_FORM_BODY, ADMIN_SETTINGS_BODY, ADMIN_MENU_BODY, ADMIN_ORDER_MANAGE_BODY
+from templates import ADMIN_HTML_TEMPLATE, ADMIN_EMPLOYEE_BODY, ADMIN_ROLES_BODY, ADMIN_REPORTS_BODY, ADMIN_ORDER_FORM_BODY, ADMIN_SETTINGS_BODY, ADMIN_MENU_BODY, ADMIN_ORDER_MANAGE_BODY
 from models import *
-from admin_handlers import register_admin_handlers, parse_products_string
+from admin_handlers import register_admin_handlers
+from queries import customer_orders_query, courier_report_query, order_load
+from order_items import add_order_item, replace_order_items, refresh_order_summary
+from migrations import run_migrations
+from customer_stats import order_snapshot, update_customer_stats
+from pagination import paginate_keyset, render_page_bar
+from archive import run_archiver, archive_needed
 from courier_handlers import register_courier_handlers
-from notification_manager import notify_new_order_to_staff
+from order_jobs import add_new_order_events
+from background_jobs import job_runner
+from outbox import outbox_dispatcher
+from bot_instances import BotRegistry, bot_registry
+from update_pool import PooledDispatcher, update_pool
 from admin_clients import router as clients_router
-from dependencies import get_db_session, check_credentials
+from dependencies import get_db_session, check_credentials, get_bot_registry
+from db_writer import write_coordinator
+from settings_cache import get_settings_snapshot, save_settings
+from reference_data import get_reference_data, commit_reference_data
+from menu_catalog import get_menu_catalog, commit_menu_catalog
+from site_pages import get_site_pages, commit_site_pages
+from http_cache import conditional_response, MENU_CACHE_CONTROL, PAGE_CACHE_CONTROL
+from landing_page import get_landing_page, landing_response
+from telegram_media import answer_photo_cached, forget_media
+from customer_lookup import find_customer, customer_info_limiter, retry_after_header
+from staff_identity import StaffMiddleware, forget_staff
+from bot_webhooks import router as webhook_router, register_webhook, webhook_enabled
+from fsm_storage import fsm_storage, run_fsm_sweeper
+from send_scheduler import telegram_sender
 # --- НОВИЙ ІМПОРТ для керування замовленнями ---
 from admin_order_management import router as admin_order_router
 # -----------------------------------------------
 
-# --- Інтеграція з R-Keeper ---
-try:
-    from r_keeper import RKeeperAPI
-except ImportError:
-    class RKeeperAPI:
-        def __init__(self, settings): pass
-        async def send_order(self, order, items):
-            logging.warning("r_keeper.py не знайдено, інтеграція з R-Keeper вимкнена.")
-            pass
-
 # --- КОНФІГУРАЦІЯ ---
 load_dotenv()
 PRODUCTS_PER_PAGE = 5
+WELCOME_PHOTO_URL = 'https://i.postimg.cc/4y2BL0ck/14e9a2ee-449d-4881-ac89-c2b42b51abc0.jpg'
 
 class CheckoutStates(StatesGroup):
     waiting_for_delivery_type = State()
@@ -74,8 +87,8 @@ class CheckoutStates(StatesGroup):
     waiting_for_specific_time = State()
 
 # --- TELEGRAM БОТИ ---
-dp = Dispatcher()
-dp_admin = Dispatcher()
+dp = PooledDispatcher(storage=fsm_storage)
+dp_admin = PooledDispatcher(storage=fsm_storage)
 
 async def get_main_reply_keyboard(session: AsyncSession):
     builder = ReplyKeyboardBuilder()
@@ -119,10 +132,9 @@ async def handle_dynamic_menu_item(message: Message, session: AsyncSession):
 @dp.message(CommandStart())
 async def command_start_handler(message: Message, state: FSMContext, session: AsyncSession):
     await state.clear()
-    welcome_photo_url = 'https://i.postimg.cc/4y2BL0ck/14e9a2ee-449d-4881-ac89-c2b42b51abc0.jpg'
     caption = f"Шановний {html.escape(message.from_user.full_name)}, ласкаво просимо до ресторану Дайберг! 👋\n\nМи раді вас бачити. Оберіть опцію:"
     keyboard = await get_main_reply_keyboard(session)
-    await message.answer_photo(photo=welcome_photo_url, caption=caption, reply_markup=keyboard)
+    await answer_photo_cached(message, session, WELCOME_PHOTO_URL, caption=caption, reply_markup=keyboard)
 
 
 @dp.message(F.text == "🍽️ Меню")
@@ -158,10 +170,9 @@ async def back_to_start_menu(callback: CallbackQuery, state: FSMContext, session
     except TelegramBadRequest as e:
         logging.warning(f"Не вдалося видалити повідомлення в back_to_start_menu: {e}")
 
-    welcome_photo_url = 'https://i.postimg.cc/4y2BL0ck/14e9a2ee-449d-4881-ac89-c2b42b51abc0.jpg'
     caption = f"Шановний {html.escape(callback.from_user.full_name)}, ласкаво просимо до ресторану Дайберг! 👋\n\nМи раді вас бачити. Оберіть опцію:"
     keyboard = await get_main_reply_keyboard(session)
-    await callback.message.answer_photo(photo=welcome_photo_url, caption=caption, reply_markup=keyboard)
+    await answer_photo_cached(callback.message, session, WELCOME_PHOTO_URL, caption=caption, reply_markup=keyboard)
     await callback.answer()
 
 async def show_my_orders(message_or_callback: Message | CallbackQuery, session: AsyncSession):
@@ -169,9 +180,7 @@ async def show_my_orders(message_or_callback: Message | CallbackQuery, session:
     message = message_or_callback.message if is_callback else message_or_callback
     user_id = message_or_callback.from_user.id
 
-    orders_result = await session.execute(
-        sa.select(Order).options(joinedload(Order.status)).where(Order.user_id == user_id).order_by(Order.id.desc())
-    )
+    orders_result = await session.execute(customer_orders_query(user_id))
     orders = orders_result.scalars().all()
 
     if not orders:
@@ -204,8 +213,7 @@ async def show_menu(message_or_callback: Message | CallbackQuery, session: Async
     message = message_or_callback.message if is_callback else message_or_callback
 
     keyboard = InlineKeyboardBuilder()
-    categories_result = await session.execute(sa.select(Category).order_by(Category.sort_order, Category.name))
-    categories = categories_result.scalars().all()
+    categories = (await get_menu_catalog(session)).categories
 
     if not categories:
         text = "Шановний клієнте, меню поки що порожнє. Зачекайте на оновлення!"
@@ -241,20 +249,13 @@ async def show_category_paginated(callback: CallbackQuery, session: AsyncSession
     category_id = int(parts[2])
     page = int(parts[3]) if len(parts) > 3 else 1
 
-    category = await session.get(Category, category_id)
+    catalog = await get_menu_catalog(session)
+    category = catalog.category(category_id)
     if not category:
         await callback.answer("Категорію не знайдено!", show_alert=True)
         return
 
-    offset = (page - 1) * PRODUCTS_PER_PAGE
-    query_total = sa.select(sa.func.count(Product.id)).where(Product.category_id == category_id, Product.is_active == True)
-    query_products = sa.select(Product).where(Product.category_id == category_id, Product.is_active == True).order_by(Product.name).offset(offset).limit(PRODUCTS_PER_PAGE)
-
-    total_products = await session.scalar(query_total)
-    total_pages = (total_products + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
-
-    products_result = await session.execute(query_products)
-    products_on_page = products_result.scalars().all()
+    products_on_page, total_pages = catalog.category_page(category, page, PRODUCTS_PER_PAGE)
 
     keyboard = InlineKeyboardBuilder()
     for product in products_on_page:
@@ -284,18 +285,13 @@ async def show_category_paginated(callback: CallbackQuery, session: AsyncSession
         else:
             logging.error(f"Неочікувана помилка TelegramBadRequest у show_category_paginated: {e}")
 
-async def get_photo_input(image_url: str):
-    if image_url and os.path.exists(image_url) and os.path.getsize(image_url) > 0:
-        return FSInputFile(image_url)
-    return None
-
 @dp.callback_query(F.data.startswith("show_product_"))
 async def show_product(callback: CallbackQuery, session: AsyncSession):
     await callback.answer("⏳ Завантаження...")
     product_id = int(callback.data.split("_")[2])
-    product = await session.get(Product, product_id)
+    product = (await get_menu_catalog(session)).product(product_id)
 
-    if not product or not product.is_active:
+    if not product:
         await callback.answer("Страву не знайдено або вона тимчасово недоступна!", show_alert=True)
         return
 
@@ -308,15 +304,13 @@ async def show_product(callback: CallbackQuery, session: AsyncSession):
     kb.add(InlineKeyboardButton(text="⬅️ Назад до страв", callback_data=f"show_category_{product.category_id}_1"))
     kb.adjust(1)
 
-    photo_input = await get_photo_input(product.image_url)
     try:
         await callback.message.delete()
     except TelegramBadRequest as e:
         logging.warning(f"Не вдалося видалити повідомлення в show_product: {e}")
 
-    if photo_input:
-        await callback.message.answer_photo(photo=photo_input, caption=text, reply_markup=kb.as_markup())
-    else:
+    sent = await answer_photo_cached(callback.message, session, product.image_url, caption=text, reply_markup=kb.as_markup())
+    if not sent:
         await callback.message.answer(text, reply_markup=kb.as_markup())
 
 @dp.callback_query(F.data.startswith("add_to_cart_"))
@@ -335,16 +329,15 @@ async def add_to_cart(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("Ця страва тимчасово недоступна.", show_alert=True)
         return
 
-    result = await session.execute(sa.select(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id))
-    cart_item = result.scalars().first()
-
-    if cart_item:
-        cart_item.quantity += 1
-    else:
-        cart_item = CartItem(user_id=user_id, product_id=product_id, quantity=1)
-        session.add(cart_item)
+    async def add_item(write_session: AsyncSession):
+        result = await write_session.execute(sa.select(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id))
+        cart_item = result.scalars().first()
+        if cart_item:
+            cart_item.quantity += 1
+        else:
+            write_session.add(CartItem(user_id=user_id, product_id=product_id, quantity=1))
 
-    await session.commit()
+    await write_coordinator.run(add_item)
     await callback.answer(f"✅ {html.escape(product.name)} додано до кошика!", show_alert=False)
 
 async def show_cart(message_or_callback: Message | CallbackQuery, session: AsyncSession):
@@ -405,28 +398,39 @@ async def show_cart_callback(callback: CallbackQuery, session: AsyncSession):
 async def change_quantity(callback: CallbackQuery, session: AsyncSession):
     await callback.answer("⏳ Оновлюю...")
     product_id, change = map(int, callback.data.split("_")[2:])
-    cart_item = await session.scalar(sa.select(CartItem).where(CartItem.user_id == callback.from_user.id, CartItem.product_id == product_id))
+    user_id = callback.from_user.id
 
-    if not cart_item: return
+    async def change_item(write_session: AsyncSession) -> bool:
+        cart_item = await write_session.scalar(sa.select(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id))
+        if not cart_item: return False
+        cart_item.quantity += change
+        if cart_item.quantity < 1:
+            await write_session.delete(cart_item)
+        return True
 
-    cart_item.quantity += change
-    if cart_item.quantity < 1:
-        await session.delete(cart_item)
-    await session.commit()
+    if not await write_coordinator.run(change_item): return
     await show_cart(callback, session)
 
 @dp.callback_query(F.data.startswith("delete_item_"))
 async def delete_from_cart(callback: CallbackQuery, session: AsyncSession):
     await callback.answer("⏳ Видаляю...")
     product_id = int(callback.data.split("_")[2])
-    await session.execute(sa.delete(CartItem).where(CartItem.user_id == callback.from_user.id, CartItem.product_id == product_id))
-    await session.commit()
+    user_id = callback.from_user.id
+
+    async def delete_item(write_session: AsyncSession):
+        await write_session.execute(sa.delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id))
+
+    await write_coordinator.run(delete_item)
     await show_cart(callback, session)
 
 @dp.callback_query(F.data == "clear_cart")
 async def clear_cart(callback: CallbackQuery, session: AsyncSession):
-    await session.execute(sa.delete(CartItem).where(CartItem.user_id == callback.from_user.id))
-    await session.commit()
+    user_id = callback.from_user.id
+
+    async def clear_items(write_session: AsyncSession):
+        await write_session.execute(sa.delete(CartItem).where(CartItem.user_id == user_id))
+
+    await write_coordinator.run(clear_items)
     await callback.answer("Кошик очищено!", show_alert=True)
     await show_menu(callback, session)
 
@@ -582,73 +586,68 @@ async def process_specific_time(message: Message, state: FSMContext, session: As
 async def finalize_order(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     user_id = data.get('user_id')
-    admin_bot = dp_admin.get("bot_instance")
 
-    cart_items_for_rkeeper = []
-    if user_id:
-        cart_items_res = await session.execute(
-            sa.select(CartItem).options(joinedload(CartItem.product)).where(CartItem.user_id == user_id)
+    async def save_order(write_session: AsyncSession) -> int:
+        order = Order(
+            user_id=data['user_id'], username=data.get('username'), products=data['products'],
+            total_price=data['total_price'], customer_name=data['customer_name'],
+            phone_number=data['phone_number'], address=data.get('address'),
+            is_delivery=data.get('is_delivery', True), delivery_time=data.get('delivery_time', 'Якнайшвидше')
         )
-        cart_items = cart_items_res.scalars().all()
-        for item in cart_items:
-            if item.product and item.product.r_keeper_id:
-                cart_items_for_rkeeper.append({
-                    "r_keeper_id": item.product.r_keeper_id,
-                    "quantity": item.quantity,
-                    "price": item.product.price
-                })
-
-    order = Order(
-        user_id=data['user_id'], username=data.get('username'), products=data['products'],
-        total_price=data['total_price'], customer_name=data['customer_name'],
-        phone_number=data['phone_number'], address=data.get('address'),
-        is_delivery=data.get('is_delivery', True), delivery_time=data.get('delivery_time', 'Якнайшвидше')
-    )
-    session.add(order)
-
-    if user_id:
-        customer = await session.get(Customer, user_id)
-        if not customer:
-            customer = Customer(user_id=user_id)
-            session.add(customer)
-        customer.name, customer.phone_number = data['customer_name'], data['phone_number']
-        if 'address' in data and data['address'] is not None:
-            customer.address = data.get('address')
-        await session.execute(sa.delete(CartItem).where(CartItem.user_id == user_id))
-
-    await session.commit()
-    await session.refresh(order)
-
-    try:
-        settings = await get_settings(session)
-        if settings.r_keeper_enabled and cart_items_for_rkeeper:
-            api = RKeeperAPI(settings)
-            await api.send_order(order, cart_items_for_rkeeper)
-    except Exception as e:
-        logging.error(f"Не вдалося надіслати замовлення #{order.id} в R-Keeper: {e}")
-
-    if admin_bot:
-        await notify_new_order_to_staff(admin_bot, order, session)
+        if user_id:
+            cart_res = await write_session.execute(sa.select(CartItem).where(CartItem.user_id == user_id))
+            for cart_item in cart_res.scalars().all():
+                if cart_item.product:
+                    add_order_item(order, cart_item.product, cart_item.quantity)
+            if order.items:
+                refresh_order_summary(order)
+        write_session.add(order)
+
+        if user_id:
+            customer = await write_session.get(Customer, user_id)
+            if not customer:
+                customer = Customer(user_id=user_id)
+                write_session.add(customer)
+            customer.name, customer.phone_number = data['customer_name'], data['phone_number']
+            if 'address' in data and data['address'] is not None:
+                customer.address = data.get('address')
+            await write_session.execute(sa.delete(CartItem).where(CartItem.user_id == user_id))
+
+        await update_customer_stats(write_session, order)
+        # Сповіщення персоналу й R-Keeper — подіями outbox у цій же транзакції
+        await add_new_order_events(write_session, order)
+        return order.id
+
+    await write_coordinator.run(save_order)
 
     await message.answer("Шановний клієнте, ваше замовлення оформлено! Дякуємо за вибір ресторану Дайберг. Смачного!")
 
     await state.clear()
     await command_start_handler(message, state, session)
 
+async def run_bots(client_dp: Dispatcher, admin_dp: Dispatcher, bot: Bot, admin_bot: Bot):
+    polling = [("client", client_dp, bot), ("admin", admin_dp, admin_bot)]
+    if webhook_enabled():
+        polling = [(name, d, b) for name, d, b in polling if not await register_webhook(name, d, b)]
+        if not polling:
+            logging.info("Боти працюють через webhook.")
+            return
+        # getUpdates не працює, поки в бота встановлено webhook
+        for _, _, b in polling:
+            await b.delete_webhook()
+    else:
+        for _, _, b in polling:
+            await b.delete_webhook(drop_pending_updates=True)
+
+    logging.info("Запускаємо ботів...")
+    # Сесію ботів закриває bot_registry у lifespan, а не polling. З update_pool апдейти
+    # лише ставляться в чергу, тож polling передає їх по одному, щоб зберегти порядок у чаті
+    await asyncio.gather(*(d.start_polling(b, close_bot_session=False, handle_as_tasks=not update_pool.running)
+                           for _, d, b in polling))
+
 async def start_bot(client_dp: Dispatcher, admin_dp: Dispatcher):
     try:
         async with async_session_maker() as session:
-            settings = await get_settings(session)
-            if not all([settings.client_bot_token, settings.admin_bot_token]):
-                logging.warning("Токени ботів не встановлені в базі даних. Боти не будуть запущені.")
-                return
-
-            bot = Bot(token=settings.client_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-            admin_bot = Bot(token=settings.admin_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-
-            admin_dp["client_bot"] = bot
-            admin_dp["bot_instance"] = admin_bot
-            client_dp["admin_bot_instance"] = admin_bot
             client_dp["session_factory"] = async_session_maker
             admin_dp["session_factory"] = async_session_maker
 
@@ -664,32 +663,68 @@ async def start_bot(client_dp: Dispatcher, admin_dp: Dispatcher):
         client_dp.message.middleware(DbSessionMiddleware(session_pool=async_session_maker))
         admin_dp.callback_query.middleware(DbSessionMiddleware(session_pool=async_session_maker))
         admin_dp.message.middleware(DbSessionMiddleware(session_pool=async_session_maker))
-
-        await bot.delete_webhook(drop_pending_updates=True)
-        await admin_bot.delete_webhook(drop_pending_updates=True)
-
-        logging.info("Запускаємо ботів...")
-        await asyncio.gather(
-            client_dp.start_polling(bot),
-            admin_dp.start_polling(admin_bot)
-        )
+        admin_dp.update.outer_middleware(StaffMiddleware(session_pool=async_session_maker))
     except Exception as e:
         logging.critical(f"Не вдалося запустити ботів: {e}", exc_info=True)
+        return
+
+    # Боти беруться з bot_registry; після зміни токенів на /admin/settings polling перезапускається з новими
+    while True:
+        task = None
+        if bot_registry.ready:
+            task = asyncio.create_task(run_bots(client_dp, admin_dp, bot_registry.bot, bot_registry.admin_bot))
+        else:
+            logging.warning("Токени ботів не встановлені в базі даних. Боти не будуть запущені.")
+        try:
+            await bot_registry.wait_changed()
+        finally:
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logging.critical(f"Не вдалося запустити ботів: {e}", exc_info=True)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.info("Запуск...")
     os.makedirs("static/images", exist_ok=True)
     os.makedirs("static/favicons", exist_ok=True)
-    await create_db_tables()
+    await run_migrations()
+    await write_coordinator.start()
+    await telegram_sender.start()
+    await bot_registry.start()
+    await job_runner.start()
+    await outbox_dispatcher.start()
+    await update_pool.start()
     bot_task = asyncio.create_task(start_bot(dp, dp_admin))
+    archiver_task = asyncio.create_task(run_archiver())
+    fsm_sweeper_task = asyncio.create_task(run_fsm_sweeper())
     yield
     logging.info("Зупинка...")
     bot_task.cancel()
+    archiver_task.cancel()
+    fsm_sweeper_task.cancel()
     try:
         await bot_task
     except asyncio.CancelledError:
         logging.info("Завдання бота успішно скасовано.")
+    for task in (archiver_task, fsm_sweeper_task):
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # Нових апдейтів уже немає — дообробляємо ті, що в черзі пулу
+    await update_pool.stop()
+    # Спершу дочищуються фонові завдання: вони ще надсилають повідомлення й пишуть у БД.
+    # Недоставлені події outbox лишаються в БД і будуть доставлені після запуску
+    await outbox_dispatcher.stop()
+    await job_runner.stop()
+    await telegram_sender.stop()
+    await bot_registry.close()
+    await write_coordinator.stop()
 
 app = FastAPI(lifespan=lifespan)
 os.makedirs("static", exist_ok=True)
@@ -697,6 +732,7 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(clients_router)
 # --- ПІДКЛЮЧЕННЯ НОВОГО РОУТЕРА ---
 app.include_router(admin_order_router)
+app.include_router(webhook_router)
 # ------------------------------------
 
 class DbSessionMiddleware:
@@ -708,47 +744,32 @@ class DbSessionMiddleware:
 
 # --- FastAPI ендпоінти ---
 @app.get("/", response_class=HTMLResponse)
-async def get_web_ordering_page(session: AsyncSession = Depends(get_db_session)):
-    settings = await get_settings(session)
-    logo_html = f'<img src="/{settings.logo_url}" alt="Логотип" class="header-logo">' if settings.logo_url else ''
-
-    menu_items_res = await session.execute(
-        sa.select(MenuItem).where(MenuItem.show_on_website == True).order_by(MenuItem.sort_order)
-    )
-    menu_items = menu_items_res.scalars().all()
-    menu_links_html = "".join(
-        [f'<a href="#" class="menu-popup-trigger" data-item-id="{item.id}">{html.escape(item.title)}</a>' for item in menu_items]
-    )
-
-    return HTMLResponse(content=WEB_ORDER_HTML.format(logo_html=logo_html, menu_links_html=menu_links_html))
+async def get_web_ordering_page(request: Request, session: AsyncSession = Depends(get_db_session)):
+    return landing_response(request, await get_landing_page(session))
 
 
 @app.get("/api/page/{item_id}", response_class=JSONResponse)
-async def get_menu_page_content(item_id: int, session: AsyncSession = Depends(get_db_session)):
-    menu_item = await session.get(MenuItem, item_id)
-    if not menu_item or not menu_item.show_on_website:
+async def get_menu_page_content(item_id: int, request: Request, session: AsyncSession = Depends(get_db_session)):
+    site_pages = await get_site_pages(session)
+    page = site_pages.website_page(item_id)
+    if not page:
         raise HTTPException(status_code=404, detail="Сторінку не знайдено")
-    return {"title": menu_item.title, "content": menu_item.content}
+    return conditional_response(request, page.page_json, page.etag, site_pages.updated_at, PAGE_CACHE_CONTROL)
 
 
 @app.get("/api/menu")
-async def get_menu_data(session: AsyncSession = Depends(get_db_session)):
-    categories_res = await session.execute(sa.select(Category).order_by(Category.sort_order, Category.name))
-    products_res = await session.execute(sa.select(Product).where(Product.is_active == True))
-
-    categories = [{"id": c.id, "name": c.name} for c in categories_res.scalars().all()]
-    products = [{"id": p.id, "name": p.name, "description": p.description, "price": p.price, "image_url": p.image_url, "category_id": p.category_id} for p in products_res.scalars().all()]
-
-    return {"categories": categories, "products": products}
+async def get_menu_data(request: Request, session: AsyncSession = Depends(get_db_session)):
+    catalog = await get_menu_catalog(session)
+    return conditional_response(request, catalog.menu_json, catalog.etag, catalog.updated_at, MENU_CACHE_CONTROL)
 
 @app.get("/api/customer_info/{phone_number}")
-async def get_customer_info(phone_number: str, session: AsyncSession = Depends(get_db_session)):
-    result = await session.execute(
-        sa.select(Order).where(Order.phone_number == phone_number).order_by(Order.id.desc()).limit(1)
-    )
-    last_order = result.scalars().first()
-    if last_order:
-        return {"customer_name": last_order.customer_name, "phone_number": last_order.phone_number, "address": last_order.address}
+async def get_customer_info(phone_number: str, request: Request, session: AsyncSession = Depends(get_db_session)):
+    wait = customer_info_limiter.acquire(request.client.host if request.client else None)
+    if wait:
+        raise HTTPException(status_code=429, detail="Забагато запитів, спробуйте пізніше", headers=retry_after_header(wait))
+    customer = await find_customer(session, normalize_phone(phone_number))
+    if customer:
+        return {"customer_name": customer.customer_name, "phone_number": customer.phone_number, "address": customer.address}
     raise HTTPException(status_code=404, detail="Клієнта не знайдено")
 
 @app.post("/api/place_order")
@@ -757,47 +778,40 @@ async def place_web_order(order_data: dict = Body(...), session: AsyncSession =
     if not items:
         raise HTTPException(status_code=400, detail="Кошик порожній")
 
-    total_price = sum(item['price'] * item['quantity'] for item in items)
-    products_str = ", ".join([f"{item['name']} x {item['quantity']}" for item in items])
-
     is_delivery = order_data.get('is_delivery', True)
     address = order_data.get('address') if is_delivery else None
 
-    order = Order(
-        customer_name=order_data.get('customer_name'), phone_number=order_data.get('phone_number'),
-        address=address, products=products_str, total_price=total_price,
-        is_delivery=is_delivery, delivery_time=order_data.get('delivery_time', "Якнайшвидше")
-    )
-    session.add(order)
-    await session.commit()
-    await session.refresh(order)
-
-    admin_bot = dp_admin.get("bot_instance")
-    if admin_bot:
-        await notify_new_order_to_staff(admin_bot, order, session)
-
-    try:
-        settings = await get_settings(session)
-        if settings.r_keeper_enabled:
-            product_ids = [item['id'] for item in items]
-            products_res = await session.execute(sa.select(Product).where(Product.id.in_(product_ids)))
-            products_map = {str(p.id): p for p in products_res.scalars().all()}
-            items_for_rkeeper = [
-                {"r_keeper_id": products_map.get(str(item['id'])).r_keeper_id, "quantity": item['quantity'], "price": item['price']}
-                for item in items if products_map.get(str(item['id'])) and products_map.get(str(item['id'])).r_keeper_id
-            ]
-            if items_for_rkeeper:
-                api = RKeeperAPI(settings)
-                await api.send_order(order, items_for_rkeeper)
-    except Exception as e:
-        logging.error(f"Не вдалося надіслати веб-замовлення #{order.id} в R-Keeper: {e}")
+    async def save_order(write_session: AsyncSession) -> int | None:
+        # Назва та ціна позицій беруться з БД, а не з кошика браузера
+        product_ids = [int(item['id']) for item in items]
+        products_res = await write_session.execute(sa.select(Product).where(Product.id.in_(product_ids), Product.is_active == True))
+        products_map = {p.id: p for p in products_res.scalars().all()}
 
-    return JSONResponse(content={"message": "Замовлення успішно розміщено", "order_id": order.id})
+        order = Order(
+            customer_name=order_data.get('customer_name'), phone_number=order_data.get('phone_number'),
+            address=address, is_delivery=is_delivery, delivery_time=order_data.get('delivery_time', "Якнайшвидше")
+        )
+        for item in items:
+            if (product := products_map.get(int(item['id']))) and int(item['quantity']) > 0:
+                add_order_item(order, product, int(item['quantity']))
+        if not order.items:
+            return None
+        refresh_order_summary(order)
+        write_session.add(order)
+        await update_customer_stats(write_session, order)
+        await add_new_order_events(write_session, order)
+        return order.id
+
+    order_id = await write_coordinator.run(save_order)
+    if order_id is None:
+        raise HTTPException(status_code=400, detail="Товари з кошика більше недоступні")
+
+    return JSONResponse(content={"message": "Замовлення успішно розміщено", "order_id": order_id})
 
 # --- ВЕБ АДМІН-ПАНЕЛЬ ---
 @app.get("/admin", response_class=HTMLResponse)
 async def admin_dashboard(session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    orders_res = await session.execute(sa.select(Order).order_by(Order.id.desc()).limit(5))
+    orders_res = await session.execute(sa.select(Order).options(*order_load("list")).order_by(Order.id.desc()).limit(5))
     orders_count = await session.scalar(sa.select(sa.func.count(Order.id)))
     products_count = await session.scalar(sa.select(sa.func.count(Product.id)))
 
@@ -811,18 +825,16 @@ async def admin_dashboard(session: AsyncSession = Depends(get_db_session), usern
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Головна панель", body=body, main_active="active", **{k: "" for k in ["clients_active", "categories_active", "products_active", "orders_active", "statuses_active", "settings_active", "employees_active", "reports_active", "menu_active"]}))
 
 @app.get("/admin/products", response_class=HTMLResponse)
-async def admin_products(page: int = Query(1, ge=1), q: str = Query(None, alias="search"), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    per_page = 10; offset = (page - 1) * per_page
-
-    query = sa.select(Product).options(joinedload(Product.category)).order_by(Product.id.desc())
+async def admin_products(cursor: str = Query(None), q: str = Query(None, alias="search"), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
+    query = sa.select(Product)
     if q:
         query = query.where(Product.name.ilike(f"%{q}%"))
 
-    total = await session.scalar(sa.select(sa.func.count()).select_from(query.subquery()))
-    products_res = await session.execute(query.limit(per_page).offset(offset))
-    products = products_res.scalars().all()
-
-    pages = (total // per_page) + (1 if total % per_page else 0)
+    page = await paginate_keyset(
+        session, query, [Product.id], per_page=10, cursor=cursor,
+        load_options=[joinedload(Product.category)], count_table=None if q else Product.__table__,
+    )
+    products = page.items
 
     product_rows = "".join([f"""
     <tr>
@@ -840,7 +852,7 @@ async def admin_products(page: int = Query(1, ge=1), q: str = Query(None, alias=
 
     categories_res = await session.execute(sa.select(Category))
     category_options = "".join([f'<option value="{c.id}">{html.escape(c.name)}</option>' for c in categories_res.scalars().all()])
-    pagination = f"<div class='pagination'>{' '.join([f'<a href=\"/admin/products?page={i}{f'&search={q}' if q else ''}\" class=\"{'active' if i == page else ''}\">{i}</a>' for i in range(1, pages+1)])}</div>"
+    pagination = render_page_bar(page, "/admin/products", {"search": q})
 
     body = f"""
     <div class="card"><h2>📝 Додати нову страву</h2><form action="/admin/add_product" method="post" enctype="multipart/form-data">
@@ -858,7 +870,7 @@ async def admin_products(page: int = Query(1, ge=1), q: str = Query(None, alias=
         </form>
         <table><thead><tr><th>ID</th><th>Назва</th><th>Ціна</th><th>Категорія</th><th>Статус</th><th>Дії</th></tr></thead><tbody>
         {product_rows or "<tr><td colspan='6'>Немає страв</td></tr>"}
-        </tbody></table>{pagination if pages > 1 else ''}
+        </tbody></table>{pagination}
     </div>"""
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Управління стравами", body=body, products_active="active", **{k: "" for k in ["clients_active", "main_active", "categories_active", "orders_active", "statuses_active", "settings_active", "employees_active", "reports_active", "menu_active"]}))
 
@@ -878,7 +890,7 @@ async def add_product(name: str=Form(...), price: int=Form(...), description: st
             logging.error(f"Не вдалося зберегти зображення: {e}")
 
     session.add(Product(name=name, price=price, description=description, image_url=image_url, category_id=category_id, r_keeper_id=r_keeper_id))
-    await session.commit()
+    await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/products", status_code=303)
 
 @app.get("/admin/edit_product/{product_id}", response_class=HTMLResponse)
@@ -928,6 +940,7 @@ async def edit_product(product_id: int, name: str=Form(...), price: int=Form(...
     product.r_keeper_id = r_keeper_id
 
     if image and image.filename:
+        await forget_media(session, product.image_url)
         if product.image_url and os.path.exists(product.image_url):
             os.remove(product.image_url)
 
@@ -936,7 +949,7 @@ async def edit_product(product_id: int, name: str=Form(...), price: int=Form(...
         async with aiofiles.open(path, 'wb') as f: await f.write(await image.read())
         product.image_url = path
 
-    await session.commit()
+    await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/products", status_code=303)
 
 @app.get("/admin/product/toggle_active/{product_id}")
@@ -944,17 +957,18 @@ async def toggle_product_active(product_id: int, session: AsyncSession = Depends
     product = await session.get(Product, product_id)
     if product:
         product.is_active = not product.is_active
-        await session.commit()
+        await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/products", status_code=303)
 
 @app.get("/admin/delete_product/{product_id}")
 async def delete_product(product_id: int, session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
     product = await session.get(Product, product_id)
     if product:
+        await forget_media(session, product.image_url)
         if product.image_url and os.path.exists(product.image_url):
             os.remove(product.image_url)
         await session.delete(product)
-        await session.commit()
+        await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/products", status_code=303)
 
 @app.get("/admin/categories", response_class=HTMLResponse)
@@ -993,7 +1007,7 @@ async def admin_categories(session: AsyncSession = Depends(get_db_session), user
 @app.post("/admin/add_category")
 async def add_category(name: str = Form(...), sort_order: int = Form(100), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
     session.add(Category(name=name, sort_order=sort_order))
-    await session.commit()
+    await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/categories", status_code=303)
 
 @app.post("/admin/edit_category/{cat_id}")
@@ -1002,7 +1016,7 @@ async def edit_category(cat_id: int, name: str = Form(...), sort_order: int = Fo
     if category:
         category.name = name
         category.sort_order = sort_order
-        await session.commit()
+        await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/categories", status_code=303)
 
 @app.get("/admin/delete_category/{cat_id}")
@@ -1010,7 +1024,7 @@ async def delete_category(cat_id: int, session: AsyncSession = Depends(get_db_se
     category = await session.get(Category, cat_id)
     if category:
         await session.delete(category)
-        await session.commit()
+        await commit_menu_catalog(session)
     return RedirectResponse(url="/admin/categories", status_code=303)
 
 @app.get("/admin/menu", response_class=HTMLResponse)
@@ -1057,7 +1071,7 @@ async def add_menu_item(title: str = Form(...), content: str = Form(...), sort_o
     new_item = MenuItem(title=title.strip(), content=content, sort_order=sort_order,
                         show_on_website=show_on_website, show_in_telegram=show_in_telegram)
     session.add(new_item)
-    await session.commit()
+    await commit_site_pages(session)
     return RedirectResponse(url="/admin/menu", status_code=303)
 
 @app.post("/admin/menu/edit/{item_id}")
@@ -1072,7 +1086,7 @@ async def edit_menu_item(item_id: int, title: str = Form(...), content: str = Fo
     item.sort_order = sort_order
     item.show_on_website = show_on_website
     item.show_in_telegram = show_in_telegram
-    await session.commit()
+    await commit_site_pages(session)
     return RedirectResponse(url="/admin/menu", status_code=303)
 
 @app.get("/admin/menu/delete/{item_id}")
@@ -1080,23 +1094,22 @@ async def delete_menu_item(item_id: int, session: AsyncSession = Depends(get_db_
     item = await session.get(MenuItem, item_id)
     if item:
         await session.delete(item)
-        await session.commit()
+        await commit_site_pages(session)
     return RedirectResponse(url="/admin/menu", status_code=303)
 
 # --- ОНОВЛЕНИЙ РОУТ ДЛЯ ЗАМОВЛЕНЬ ---
 @app.get("/admin/orders", response_class=HTMLResponse)
-async def admin_orders(page: int = Query(1, ge=1), q: str = Query(None, alias="search"), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    per_page = 15
-    offset = (page - 1) * per_page
-    query = sa.select(Order).options(joinedload(Order.status)).order_by(Order.id.desc())
+async def admin_orders(cursor: str = Query(None), q: str = Query(None, alias="search"), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
+    query = sa.select(Order)
     if q:
         search_term = q.replace('#', '')
         query = query.where(sa.or_(Order.id.like(f"%{search_term}%"), Order.customer_name.ilike(f"%{q}%"), Order.phone_number.ilike(f"%{q}%")))
 
-    total = await session.scalar(sa.select(sa.func.count()).select_from(query.subquery()))
-    orders_res = await session.execute(query.limit(per_page).offset(offset))
-    orders = orders_res.scalars().all()
-    pages = (total // per_page) + (1 if total % per_page else 0)
+    page = await paginate_keyset(
+        session, query, [Order.id], per_page=15, cursor=cursor,
+        load_options=order_load("list"), count_table=None if q else Order.__table__,
+    )
+    orders = page.items
 
     rows = "".join([f"""
     <tr>
@@ -1112,7 +1125,7 @@ async def admin_orders(page: int = Query(1, ge=1), q: str = Query(None, alias="s
         </td>
     </tr>""" for o in orders])
 
-    pagination = f"<div class='pagination'>{' '.join([f'<a href=\"/admin/orders?page={i}{f'&search={q}' if q else ''}\" class=\"{'active' if i == page else ''}\">{i}</a>' for i in range(1, pages+1)])}</div>"
+    pagination = render_page_bar(page, "/admin/orders", {"search": q})
 
     body = f"""
     <div class="card">
@@ -1126,7 +1139,7 @@ async def admin_orders(page: int = Query(1, ge=1), q: str = Query(None, alias="s
         </form>
         <table><thead><tr><th>ID</th><th>Клієнт</th><th>Телефон</th><th>Сума</th><th>Статус</th><th>Склад</th><th>Дії</th></tr></thead><tbody>
         {rows or "<tr><td colspan='7'>Немає замовлень</td></tr>"}
-        </tbody></table>{pagination if pages > 1 else ''}
+        </tbody></table>{pagination}
     </div>"""
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Замовлення", body=body, orders_active="active", **{k: "" for k in ["clients_active", "main_active", "products_active", "categories_active", "statuses_active", "settings_active", "employees_active", "reports_active", "menu_active"]}))
 # ----------------------------------------
@@ -1241,7 +1254,7 @@ async def add_status(
         is_cancelled_status=bool(is_cancelled_status)
     )
     session.add(new_status)
-    await session.commit()
+    await commit_reference_data(session)
     return RedirectResponse(url="/admin/statuses", status_code=303)
 
 @app.post("/admin/edit_status/{status_id}")
@@ -1262,7 +1275,7 @@ async def edit_status(
     elif field in ["notify_customer", "visible_to_operator", "visible_to_courier", "is_completed_status", "is_cancelled_status"]:
         setattr(status_to_edit, field, value.lower() == 'true')
 
-    await session.commit()
+    await commit_reference_data(session)
     return RedirectResponse(url="/admin/statuses", status_code=303)
 
 
@@ -1272,7 +1285,7 @@ async def delete_status(status_id: int, session: AsyncSession = Depends(get_db_s
     if status_to_delete:
         try:
             await session.delete(status_to_delete)
-            await session.commit()
+            await commit_reference_data(session)
         except IntegrityError:
             return RedirectResponse(url="/admin/statuses?error=in_use", status_code=302)
     return RedirectResponse(url="/admin/statuses", status_code=303)
@@ -1304,7 +1317,7 @@ async def admin_roles(session: AsyncSession = Depends(get_db_session), username:
 async def add_role(name: str = Form(...), can_manage_orders: Optional[bool] = Form(False), can_be_assigned: Optional[bool] = Form(False), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
     new_role = Role(name=name, can_manage_orders=bool(can_manage_orders), can_be_assigned=bool(can_be_assigned))
     session.add(new_role)
-    await session.commit()
+    await commit_reference_data(session)
     return RedirectResponse(url="/admin/roles", status_code=303)
 
 @app.get("/admin/edit_role/{role_id}", response_class=HTMLResponse)
@@ -1338,7 +1351,7 @@ async def edit_role(role_id: int, name: str = Form(...), can_manage_orders: Opti
         role.name = name
         role.can_manage_orders = bool(can_manage_orders)
         role.can_be_assigned = bool(can_be_assigned)
-        await session.commit()
+        await commit_reference_data(session)
     return RedirectResponse(url="/admin/roles", status_code=303)
 
 @app.get("/admin/delete_role/{role_id}")
@@ -1347,7 +1360,7 @@ async def delete_role(role_id: int, session: AsyncSession = Depends(get_db_sessi
     if role:
         try:
             await session.delete(role)
-            await session.commit()
+            await commit_reference_data(session)
         except IntegrityError:
             raise HTTPException(status_code=400, detail="Неможливо видалити роль, оскільки до неї прив'язані співробітники.")
     return RedirectResponse(url="/admin/roles", status_code=303)
@@ -1382,13 +1395,13 @@ async def admin_employees(session: AsyncSession = Depends(get_db_session), usern
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Співробітники", body=body, employees_active="active", **{k: "" for k in ["clients_active", "main_active", "products_active", "categories_active", "orders_active", "statuses_active", "settings_active", "reports_active", "menu_active"]}))
 
 @app.post("/admin/add_employee")
-async def add_employee(full_name: str = Form(...), phone_number: str = Form(None), role_id: int = Form(...), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    new_employee = Employee(full_name=full_name, phone_number=phone_number or None, role_id=role_id)
-    session.add(new_employee)
+async def add_employee(full_name: str = Form(...), phone_number: str = Form(None), role_id: int = Form(...), username: str = Depends(check_credentials)):
+    async def save_employee(write_session: AsyncSession):
+        write_session.add(Employee(full_name=full_name, phone_number=phone_number or None, role_id=role_id))
+
     try:
-        await session.commit()
+        await write_coordinator.run(save_employee)
     except IntegrityError:
-        await session.rollback()
         raise HTTPException(status_code=400, detail="Співробітник з таким номером телефону вже існує.")
     return RedirectResponse(url="/admin/employees", status_code=303)
 
@@ -1416,25 +1429,31 @@ async def get_edit_employee_form(employee_id: int, session: AsyncSession = Depen
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title="Редагування співробітника", body=body, employees_active="active", **{k: "" for k in ["clients_active", "main_active", "products_active", "categories_active", "orders_active", "statuses_active", "settings_active", "reports_active", "menu_active"]}))
 
 @app.post("/admin/edit_employee/{employee_id}")
-async def edit_employee(employee_id: int, full_name: str = Form(...), phone_number: str = Form(None), role_id: int = Form(...), session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    employee = await session.get(Employee, employee_id)
-    if employee:
+async def edit_employee(employee_id: int, full_name: str = Form(...), phone_number: str = Form(None), role_id: int = Form(...), username: str = Depends(check_credentials)):
+    async def save_employee(write_session: AsyncSession) -> Optional[int]:
+        employee = await write_session.get(Employee, employee_id)
+        if not employee: return None
         employee.full_name = full_name
         employee.phone_number = phone_number or None
         employee.role_id = role_id
-        try:
-            await session.commit()
-        except IntegrityError:
-            await session.rollback()
-            raise HTTPException(status_code=400, detail="Співробітник з таким номером телефону вже існує.")
+        return employee.telegram_user_id
+
+    try:
+        telegram_user_id = await write_coordinator.run(save_employee)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Співробітник з таким номером телефону вже існує.")
+    forget_staff(telegram_user_id)
     return RedirectResponse(url="/admin/employees", status_code=303)
 
 @app.get("/admin/delete_employee/{employee_id}")
-async def delete_employee(employee_id: int, session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    employee = await session.get(Employee, employee_id)
-    if employee:
-        await session.delete(employee)
-        await session.commit()
+async def delete_employee(employee_id: int, username: str = Depends(check_credentials)):
+    async def remove_employee(write_session: AsyncSession) -> Optional[int]:
+        employee = await write_session.get(Employee, employee_id)
+        if not employee: return None
+        await write_session.delete(employee)
+        return employee.telegram_user_id
+
+    forget_staff(await write_coordinator.run(remove_employee))
     return RedirectResponse(url="/admin/employees", status_code=303)
 
 @app.get("/admin/reports", response_class=HTMLResponse)
@@ -1460,29 +1479,11 @@ async def report_couriers(
     date_to = datetime.strptime(date_to_str, "%Y-%m-%d").date() if date_to_str else date.today()
     date_from = datetime.strptime(date_from_str, "%Y-%m-%d").date() if date_from_str else date_to - timedelta(days=7)
 
-    completed_status_res = await session.execute(
-        sa.select(OrderStatus.id).where(OrderStatus.is_completed_status == True).limit(1)
-    )
-    completed_status_id = completed_status_res.scalar_one_or_none()
+    completed_status_id = (await get_reference_data(session)).completed_status_id
 
     if completed_status_id:
-        report_query = (
-            sa.select(
-                Employee.full_name,
-                func.count(Order.id).label("completed_orders")
-            )
-            .join(Employee, Order.completed_by_courier_id == Employee.id)
-            .where(
-                and_(
-                    func.date(Order.created_at) >= date_from,
-                    func.date(Order.created_at) <= date_to,
-                    Order.status_id == completed_status_id
-                )
-            )
-            .group_by(Employee.full_name)
-            .order_by(func.count(Order.id).desc())
-        )
-        result = await session.execute(report_query)
+        include_archive = await archive_needed(session, date_from)
+        result = await session.execute(courier_report_query(date_from, date_to, completed_status_id, include_archive))
         report_data = result.all()
 
     report_rows = "".join([f'<tr><td>{html.escape(row.full_name)}</td><td>{row.completed_orders}</td></tr>' for row in report_data])
@@ -1532,7 +1533,7 @@ async def save_admin_settings(session: AsyncSession = Depends(get_db_session), u
                                r_keeper_station_code: str = Form(""), r_keeper_payment_type: str = Form(""),
                                apple_touch_icon: UploadFile = File(None), favicon_32x32: UploadFile = File(None),
                                favicon_16x16: UploadFile = File(None), favicon_ico: UploadFile = File(None),
-                               site_webmanifest: UploadFile = File(None)):
+                               site_webmanifest: UploadFile = File(None), bots: BotRegistry = Depends(get_bot_registry)):
     settings = await get_settings(session)
     settings.client_bot_token=client_bot_token
     settings.admin_bot_token=admin_bot_token
@@ -1570,7 +1571,9 @@ async def save_admin_settings(session: AsyncSession = Depends(get_db_session), u
             except Exception as e:
                 logging.error(f"Не вдалося зберегти favicon {filename}: {e}")
 
-    await session.commit()
+    await save_settings(session, settings)
+    # Нові токени починають діяти одразу, без перезапуску застосунку
+    await bots.refresh(await get_settings_snapshot(session))
     return RedirectResponse(url="/admin/settings?saved=true", status_code=303)
 
 async def get_settings(session: AsyncSession) -> Settings:
@@ -1614,17 +1617,13 @@ async def get_add_order_form(username: str = Depends(check_credentials)):
 
 @app.get("/admin/order/edit/{order_id}", response_class=HTMLResponse)
 async def get_edit_order_form(order_id: int, session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
-    order = await session.get(Order, order_id)
+    order = await session.get(Order, order_id, options=order_load("items"))
     if not order: raise HTTPException(404, "Замовлення не знайдено")
 
-    products_dict = parse_products_string(order.products)
-    initial_items = {}
-    if products_dict:
-        products_res = await session.execute(sa.select(Product).where(Product.name.in_(list(products_dict.keys()))))
-        db_products_map = {p.name: p for p in products_res.scalars().all()}
-        for name, quantity in products_dict.items():
-            if p := db_products_map.get(name):
-                initial_items[p.id] = {"name": p.name, "price": p.price, "quantity": quantity}
+    initial_items = {
+        item.product_id: {"name": item.name, "price": item.price, "quantity": item.quantity}
+        for item in order.items if item.product_id is not None
+    }
 
     initial_data = {
         "items": initial_items,
@@ -1650,77 +1649,55 @@ async def get_edit_order_form(order_id: int, session: AsyncSession = Depends(get
     return HTMLResponse(ADMIN_HTML_TEMPLATE.format(title=f"Редагування замовлення #{order.id}", body=body, orders_active="active", **{k: "" for k in ["clients_active", "main_active", "products_active", "categories_active", "statuses_active", "settings_active", "employees_active", "reports_active", "menu_active"]}))
 
 
-async def _process_and_save_order(order: Order, data: dict, session: AsyncSession):
+async def _process_and_save_order(order_id: Optional[int], data: dict, session: AsyncSession):
     """
     Обробляє та зберігає дані замовлення, отримані з веб-інтерфейсу адміністратора.
     Використовує ID товарів для надійного пошуку та перерахунку.
+    Якщо order_id не передано, створюється нове замовлення.
     """
-    is_new_order = order.id is None
+    is_new_order = order_id is None
     actor_info = "Адміністративна панель"
+    items_from_js = data.get("items", {})
 
-    order.customer_name = data.get("customer_name")
-    order.phone_number = data.get("phone_number")
-    order.is_delivery = data.get("delivery_type") == "delivery"
-    order.address = data.get("address") if order.is_delivery else None
+    async def save_order(write_session: AsyncSession) -> int:
+        order = Order() if is_new_order else await write_session.get(Order, order_id, options=order_load("items"))
+        before = None if is_new_order else await order_snapshot(write_session, order)
 
-    items_from_js = data.get("items", {})
+        order.customer_name = data.get("customer_name")
+        order.phone_number = data.get("phone_number")
+        order.is_delivery = data.get("delivery_type") == "delivery"
+        order.address = data.get("address") if order.is_delivery else None
 
-    if not items_from_js:
-        order.products = ""
-        order.total_price = 0
-    else:
         product_ids = [int(pid) for pid in items_from_js.keys()]
-        if not product_ids:
-            order.products = ""
-            order.total_price = 0
-        else:
-            products_res = await session.execute(sa.select(Product).where(Product.id.in_(product_ids)))
+        db_products_map = {}
+        if product_ids:
+            products_res = await write_session.execute(sa.select(Product).where(Product.id.in_(product_ids)))
             db_products_map = {p.id: p for p in products_res.scalars().all()}
 
-            total_price = 0
-            product_strings = []
-
-            for pid_str, item_data in items_from_js.items():
-                pid = int(pid_str)
-                if product := db_products_map.get(pid):
-                    quantity = int(item_data.get('quantity', 0))
-                    if quantity > 0:
-                        total_price += product.price * quantity
-                        product_strings.append(f"{product.name} x {quantity}")
-
-            order.products = ", ".join(product_strings)
-            order.total_price = total_price
-
-    if is_new_order:
-        session.add(order)
-        if not order.status_id:
-            order.status_id = 1
-
-    await session.commit()
-    await session.refresh(order)
-
-    if is_new_order:
-        history_entry = OrderStatusHistory(
-            order_id=order.id,
-            status_id=order.status_id,
-            actor_info=actor_info
-        )
-        session.add(history_entry)
-        await session.commit()
+        replace_order_items(order, [
+            (db_products_map[int(pid_str)], int(item_data.get('quantity', 0)))
+            for pid_str, item_data in items_from_js.items() if int(pid_str) in db_products_map
+        ])
+        refresh_order_summary(order)
 
-        admin_bot = dp_admin.get("bot_instance")
-        if admin_bot:
-            try:
-                await notify_new_order_to_staff(admin_bot, order, session)
-                logging.info(f"Сповіщення для нового веб-адмін замовлення #{order.id} надіслано успішно.")
-            except Exception as e:
-                logging.error(f"Не вдалося надіслати сповіщення для нового веб-адмін замовлення #{order.id}: {e}")
+        if is_new_order:
+            if not order.status_id:
+                order.status_id = 1
+            write_session.add(order)
+            await write_session.flush()
+            write_session.add(OrderStatusHistory(order_id=order.id, status_id=order.status_id, actor_info=actor_info))
+            # Замовлення з адмінки не відправляються в R-Keeper — лише сповіщення персоналу
+            await add_new_order_events(write_session, order, r_keeper=False)
+
+        await update_customer_stats(write_session, order, before)
+        return order.id
+
+    await write_coordinator.run(save_order)
 
 @app.post("/api/admin/order/new", response_class=JSONResponse)
 async def api_create_order(request: Request, session: AsyncSession = Depends(get_db_session), username: str = Depends(check_credentials)):
     data = await request.json()
-    new_order = Order()
-    await _process_and_save_order(new_order, data, session)
+    await _process_and_save_order(None, data, session)
     return JSONResponse(content={"message": "Замовлення створено успішно", "redirect_url": "/admin/orders"})
 
 @app.post("/api/admin/order/edit/{order_id}", response_class=JSONResponse)
@@ -1728,7 +1705,7 @@ async def api_update_order(order_id: int, request: Request, session: AsyncSessio
     data = await request.json()
     order = await session.get(Order, order_id)
     if not order: raise HTTPException(404, "Замовлення не знайдено")
-    await _process_and_save_order(order, data, session)
+    await _process_and_save_order(order.id, data, session)
     return JSONResponse(content={"message": "Замовлення оновлено успішно", "redirect_url": "/admin/orders"})
 
 
@@ -0,0 +1,118 @@
+# menu_catalog.py
+"""
+Знімок меню (категорії й активні страви) в пам'яті процесу.
+
+/api/menu і клієнтський бот (категорії, сторінки страв, картка страви) читають
+MenuCatalog через get_menu_catalog() замість запитів до categories і products.
+Знімок незмінний: страви кожної категорії вже відсортовані, а JSON для /api/menu
+серіалізовано один раз при завантаженні версії (menu_json).
+
+Маршрути адмін-панелі, що змінюють страви чи категорії, зберігають зміни через
+commit_menu_catalog(): версія меню (cache_versions, "menu_catalog") збільшується в тій самій
+транзакції, і кожен воркер перечитує знімок при наступному зверненні.
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Category, Product
+from cache_versions import VersionedCache, bump_version, read_version_info
+from http_cache import make_etag
+
+MENU_CACHE = "menu_catalog"
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    id: int
+    name: str
+    description: Optional[str]
+    price: int
+    image_url: Optional[str]
+    category_id: int
+
+
+@dataclass(frozen=True)
+class CatalogCategory:
+    id: int
+    name: str
+    products: tuple[CatalogProduct, ...]  # активні страви за назвою, як у боті
+
+
+@dataclass(frozen=True)
+class MenuCatalog:
+    version: int
+    categories: tuple[CatalogCategory, ...]  # за sort_order і назвою
+    products: Mapping[int, CatalogProduct]  # лише активні страви
+    menu_json: bytes  # готова відповідь /api/menu
+    etag: str
+    updated_at: Optional[datetime]  # UTC, коли версію востаннє збільшили
+
+    def category(self, category_id: int) -> Optional[CatalogCategory]:
+        return next((c for c in self.categories if c.id == category_id), None)
+
+    def product(self, product_id: int) -> Optional[CatalogProduct]:
+        return self.products.get(product_id)
+
+    def category_page(self, category: CatalogCategory, page: int, per_page: int) -> tuple[tuple[CatalogProduct, ...], int]:
+        """Страви сторінки page і кількість сторінок."""
+        total_pages = (len(category.products) + per_page - 1) // per_page
+        offset = (page - 1) * per_page
+        return category.products[offset:offset + per_page], total_pages
+
+
+def _serialize_menu(categories: list, products: list[CatalogProduct]) -> bytes:
+    payload = {
+        "categories": [{"id": c.id, "name": c.name} for c in categories],
+        "products": [{"id": p.id, "name": p.name, "description": p.description, "price": p.price,
+                      "image_url": p.image_url, "category_id": p.category_id} for p in products],
+    }
+    # Той самий формат, що дає JSONResponse
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+async def _load_menu_catalog(session: AsyncSession) -> MenuCatalog:
+    version, updated_at = await read_version_info(session, MENU_CACHE)
+    categories = (await session.execute(
+        select(Category.id, Category.name).order_by(Category.sort_order, Category.name)
+    )).all()
+    products = [
+        CatalogProduct(*row) for row in (await session.execute(
+            select(Product.id, Product.name, Product.description, Product.price, Product.image_url, Product.category_id)
+            .where(Product.is_active == True)
+            .order_by(Product.id)
+        )).all()
+    ]
+
+    menu_json = _serialize_menu(categories, products)
+    by_category: dict[int, list[CatalogProduct]] = {}
+    for product in sorted(products, key=lambda p: p.name):
+        by_category.setdefault(product.category_id, []).append(product)
+    return MenuCatalog(
+        version=version,
+        categories=tuple(CatalogCategory(c.id, c.name, tuple(by_category.get(c.id, ()))) for c in categories),
+        products=MappingProxyType({p.id: p for p in products}),
+        menu_json=menu_json,
+        etag=make_etag("m", version, menu_json),
+        updated_at=updated_at,
+    )
+
+
+menu_catalog_cache: VersionedCache[MenuCatalog] = VersionedCache(MENU_CACHE, _load_menu_catalog)
+
+
+async def get_menu_catalog(session: Optional[AsyncSession] = None) -> MenuCatalog:
+    return await menu_catalog_cache.get(session)
+
+
+async def commit_menu_catalog(session: AsyncSession):
+    """Комітить зміни страв або категорій і скидає знімок меню (у цьому процесі — одразу)."""
+    await bump_version(session, MENU_CACHE)
+    await session.commit()
+    menu_catalog_cache.invalidate()
@@ -0,0 +1,335 @@
+# migrations.py
+"""
+Версійовані міграції схеми БД.
+
+Поточна версія зберігається в таблиці schema_version. При старті run_migrations()
+одним запитом читає версію і, якщо вона дорівнює останній у MIGRATIONS, нічого не робить.
+Інакше виконує всі новіші міграції по черзі. Кожна міграція починається з BEGIN IMMEDIATE
+(блокування на запис) і повторного читання версії в тій самій транзакції: якщо її вже
+застосував інший воркер, що стартував одночасно, міграція пропускається. Кроки міграції
+й запис її номера виконуються в цій транзакції на тому ж з'єднанні.
+
+Правила для нових міграцій:
+- міграцію додають у кінець MIGRATIONS з наступним номером, старі не змінюють;
+- міграція 1 створює таблиці за поточними моделями, тому наступні міграції мають бути
+  ідемпотентними (add_column / add_index перевіряють наявність самі);
+- великі перенесення даних робляться через backfill_in_chunks: кожна порція — окрема коротка
+  транзакція з BEGIN IMMEDIATE, тож інші записи не чекають на блокування всієї таблиці,
+  а перерваний прогін продовжується з того ж місця. Між порціями блокування відпускається,
+  тож інший воркер може почати ту саму міграцію — тому кроки й мають бути ідемпотентними.
+
+    python migrations.py           # застосувати міграції
+    python migrations.py --status  # показати поточну і останню версію
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex
+
+from models import (Base, engine, Order, OrderItem, OrderStatus, Product, Role, Settings, CustomerStats,
+                    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory, CacheVersion, TelegramMedia, FsmState,
+                    OutboxEvent, normalize_phone)
+from order_items import parse_products_string
+from customer_stats import fill_customer_stats
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 500
+
+schema_version_table = sa.Table(
+    "schema_version", sa.MetaData(),
+    sa.Column("version", sa.Integer, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def _begin_immediate(conn: AsyncConnection):
+    """Починає транзакцію одразу з блокуванням на запис: інший воркер чекає, а не ловить SQLITE_BUSY посередині."""
+    await conn.begin()
+    await conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+# --- Допоміжні кроки міграцій ---
+# Крок отримує з'єднання, на якому run_migrations вже відкрив транзакцію з блокуванням на запис.
+
+def add_index(index: sa.Index) -> Callable[[AsyncConnection], Awaitable[None]]:
+    """Крок міграції, що створює індекс, якщо його ще немає (у т.ч. індекс за виразом)."""
+    async def apply(conn: AsyncConnection):
+        await conn.execute(CreateIndex(index, if_not_exists=True))
+    return apply
+
+
+def drop_index(name: str) -> Callable[[AsyncConnection], Awaitable[None]]:
+    """Крок міграції, що видаляє застарілий індекс, якщо він є."""
+    async def apply(conn: AsyncConnection):
+        await conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    return apply
+
+
+def create_table(table: sa.Table) -> Callable[[AsyncConnection], Awaitable[None]]:
+    """Крок міграції, що створює нову таблицю разом з її індексами, якщо її ще немає."""
+    async def apply(conn: AsyncConnection):
+        await conn.run_sync(table.create, checkfirst=True)
+    return apply
+
+
+def steps(*apply_steps: Callable[[AsyncConnection], Awaitable[None]]) -> Callable[[AsyncConnection], Awaitable[None]]:
+    """Об'єднує кілька кроків в одну міграцію; кроки виконуються по черзі."""
+    async def apply(conn: AsyncConnection):
+        for step in apply_steps:
+            await step(conn)
+    return apply
+
+
+def add_column(table: sa.Table, column_name: str) -> Callable[[AsyncConnection], Awaitable[None]]:
+    """Крок міграції, що додає колонку моделі до існуючої таблиці, якщо її ще немає."""
+    async def apply(conn: AsyncConnection):
+        column = table.c[column_name]
+        existing = {row[1] for row in (await conn.exec_driver_sql(f"PRAGMA table_info({table.name})")).all()}
+        if column.name in existing:
+            return
+        column_type = column.type.compile(dialect=conn.dialect)
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+        if column.server_default is not None:
+            default = column.server_default.arg
+            ddl += f" DEFAULT {default.text if hasattr(default, 'text') else repr(default)}"
+        if not column.nullable and column.server_default is not None:
+            ddl += " NOT NULL"
+        await conn.exec_driver_sql(ddl)
+    return apply
+
+
+async def backfill_in_chunks(
+    conn: AsyncConnection,
+    select_chunk: Callable[[Any, int], sa.Select],
+    apply_chunk: Callable[[AsyncConnection, list[sa.Row]], Awaitable[None]],
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+) -> int:
+    """
+    Переносить дані порціями. select_chunk(last_key, limit) має повертати рядки, відсортовані
+    за ключем у першій колонці (зазвичай id) і лише ті, що ще не оброблені; last_key для першої
+    порції — None. apply_chunk(conn, rows) виконується в тій самій транзакції, що й вибірка порції.
+    Після кожної порції транзакція комітиться, а наступна знову починається з BEGIN IMMEDIATE;
+    решта кроків міграції продовжується в останній з них. Повертає кількість оброблених рядків.
+    """
+    last_key = None
+    processed = 0
+    while True:
+        rows = (await conn.execute(select_chunk(last_key, chunk_size))).all()
+        if not rows:
+            break
+        await apply_chunk(conn, rows)
+        await conn.commit()
+        processed += len(rows)
+        last_key = rows[-1][0]
+        # Між порціями віддаємо керування, щоб інші записи встигли взяти блокування
+        await asyncio.sleep(0)
+        await _begin_immediate(conn)
+    return processed
+
+
+# --- Міграції ---
+
+async def create_initial_schema(conn: AsyncConnection):
+    # Транзакція з блокуванням на запис (run_migrations): воркери, що стартують одночасно, не задублюють довідники
+    await conn.run_sync(Base.metadata.create_all)
+
+    if not (await conn.execute(sa.select(OrderStatus.id).limit(1))).first():
+        statuses = [
+            # name, visible_to_operator, visible_to_courier, is_completed_status, is_cancelled_status
+            ("Новый", True, False, False, False),
+            ("В обработке", True, False, False, False),
+            ("Готов", True, True, False, False),
+            ("Доставлен", True, True, True, False),
+            ("Отменен", True, False, False, True),
+        ]
+        await conn.execute(sa.insert(OrderStatus), [
+            {"name": name, "visible_to_operator": operator, "visible_to_courier": courier,
+             "is_completed_status": completed, "is_cancelled_status": cancelled}
+            for name, operator, courier, completed, cancelled in statuses
+        ])
+
+    if not (await conn.execute(sa.select(Role.id).limit(1))).first():
+        await conn.execute(sa.insert(Role), [
+            {"name": "Администратор", "can_manage_orders": True, "can_be_assigned": False},
+            {"name": "Оператор", "can_manage_orders": True, "can_be_assigned": False},
+            {"name": "Курьер", "can_manage_orders": False, "can_be_assigned": True},
+        ])
+
+    # Рядок налаштувань створюється тут, щоб паралельні запити не вставляли його одночасно
+    if not (await conn.execute(sa.select(Settings.id).where(Settings.id == 1))).first():
+        await conn.execute(sa.insert(Settings).values(
+            id=1, client_bot_token=getenv("CLIENT_BOT_TOKEN", ""),
+            admin_bot_token=getenv("ADMIN_BOT_TOKEN", ""), admin_chat_id=getenv("ADMIN_CHAT_ID", "")
+        ))
+
+
+async def backfill_order_items(conn: AsyncConnection):
+    """
+    Переносить склад старих замовлень з рядка Order.products у order_items.
+    Товари зіставляються за назвою; якщо товар вже видалено, позиція зберігається
+    з назвою, без product_id і з ціною 0. Суми замовлень не перераховуються.
+    """
+    products_res = await conn.execute(sa.select(Product.id, Product.name, Product.price).order_by(Product.is_active.desc(), Product.id))
+    products_by_name = {}
+    for row in products_res.all():
+        products_by_name.setdefault(row.name, row)
+
+    def select_chunk(last_id, limit):
+        return (
+            sa.select(Order.id, Order.products)
+            .where(Order.id > (last_id or 0), Order.products != "", ~sa.exists().where(OrderItem.order_id == Order.id))
+            .order_by(Order.id)
+            .limit(limit)
+        )
+
+    async def apply_chunk(chunk_conn: AsyncConnection, rows):
+        new_items = []
+        for order_id, products_str in rows:
+            for name, quantity in parse_products_string(products_str).items():
+                product = products_by_name.get(name)
+                new_items.append({
+                    "order_id": order_id,
+                    "product_id": product.id if product else None,
+                    "name": name,
+                    "price": product.price if product else 0,
+                    "quantity": quantity,
+                })
+        if new_items:
+            await chunk_conn.execute(sa.insert(OrderItem), new_items)
+
+    migrated = await backfill_in_chunks(conn, select_chunk, apply_chunk)
+    if migrated:
+        logger.info(f"Склад {migrated} замовлень перенесено до order_items.")
+
+
+async def backfill_order_phone_keys(conn: AsyncConnection):
+    """Заповнює orders.phone_key для замовлень, створених до появи колонки."""
+    def select_chunk(last_id, limit):
+        return (
+            sa.select(Order.id, Order.phone_number)
+            .where(Order.id > (last_id or 0), Order.phone_key.is_(None), Order.phone_number.isnot(None))
+            .order_by(Order.id)
+            .limit(limit)
+        )
+
+    async def apply_chunk(chunk_conn: AsyncConnection, rows):
+        await chunk_conn.execute(
+            sa.update(Order.__table__).where(Order.__table__.c.id == sa.bindparam("order_id")).values(phone_key=sa.bindparam("key")),
+            [{"order_id": order_id, "key": normalize_phone(phone)} for order_id, phone in rows],
+        )
+
+    await backfill_in_chunks(conn, select_chunk, apply_chunk)
+
+
+def _index(table: sa.Table, name: str) -> sa.Index:
+    return next(index for index in table.indexes if index.name == name)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "Початкова схема і довідники", create_initial_schema),
+    Migration(2, "Перенесення складу замовлень у order_items", backfill_order_items),
+    Migration(3, "Індекс orders (status_id, id)", add_index(_index(Order.__table__, "ix_orders_status_id_id"))),
+    Migration(4, "Індекс orders (courier_id, status_id)", add_index(_index(Order.__table__, "ix_orders_courier_id_status_id"))),
+    Migration(5, "Індекс orders (user_id, id)", add_index(_index(Order.__table__, "ix_orders_user_id_id"))),
+    Migration(6, "Індекс orders (status_id, date(created_at))", add_index(_index(Order.__table__, "ix_orders_status_id_created_date"))),
+    Migration(7, "Канонічний телефон orders.phone_key", steps(
+        add_column(Order.__table__, "phone_key"),
+        backfill_order_phone_keys,
+        add_index(_index(Order.__table__, "ix_orders_phone_key")),
+    )),
+    Migration(8, "Таблиця customer_stats", steps(
+        create_table(CustomerStats.__table__),
+        fill_customer_stats,
+    )),
+    Migration(9, "Індекс customer_stats (order_count, last_order_id) для пагінації за курсором", steps(
+        drop_index("ix_customer_stats_order_count"),
+        add_index(_index(CustomerStats.__table__, "ix_customer_stats_order_count_last_id")),
+    )),
+    Migration(10, "Архівні таблиці замовлень", steps(
+        create_table(ArchivedOrder.__table__),
+        create_table(ArchivedOrderItem.__table__),
+        create_table(ArchivedOrderStatusHistory.__table__),
+    )),
+    Migration(11, "Таблиця cache_versions для узгодження кешів між воркерами", create_table(CacheVersion.__table__)),
+    Migration(12, "Час зміни версії кешу cache_versions.updated_at", add_column(CacheVersion.__table__, "updated_at")),
+    Migration(13, "Таблиця telegram_media (file_id завантажених фото)", create_table(TelegramMedia.__table__)),
+    Migration(14, "Таблиця fsm_states (стани FSM ботів)", create_table(FsmState.__table__)),
+    Migration(15, "Таблиця outbox (побічні дії після коміту)", create_table(OutboxEvent.__table__)),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# --- Запуск ---
+
+async def get_schema_version(db_engine: AsyncEngine = engine) -> int:
+    """Поточна версія схеми; 0 — міграції ще не запускались."""
+    try:
+        async with db_engine.connect() as conn:
+            return (await conn.scalar(sa.select(schema_version_table.c.version))) or 0
+    except OperationalError:
+        return 0
+
+
+async def _locked_schema_version(conn: AsyncConnection) -> int:
+    """Версія схеми всередині транзакції з блокуванням на запис (таблиця створюється за потреби)."""
+    await conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    return (await conn.scalar(sa.select(schema_version_table.c.version))) or 0
+
+
+async def _set_schema_version(conn: AsyncConnection, version: int):
+    if (await conn.execute(sa.update(schema_version_table).values(version=version))).rowcount == 0:
+        await conn.execute(sa.insert(schema_version_table).values(version=version))
+
+
+async def run_migrations(db_engine: AsyncEngine = engine) -> int:
+    """Застосовує нові міграції та повертає версію схеми після запуску."""
+    current = await get_schema_version(db_engine)
+    if current >= LATEST_VERSION:
+        return current
+
+    async with db_engine.connect() as conn:
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+            await _begin_immediate(conn)
+            # Перечитуємо під блокуванням: інший воркер міг застосувати міграцію, поки ми чекали
+            current = await _locked_schema_version(conn)
+            if migration.version > current:
+                logger.info(f"Міграція {migration.version}: {migration.description}...")
+                await migration.apply(conn)
+                await _set_schema_version(conn, migration.version)
+                current = migration.version
+            await conn.commit()
+    logger.info(f"Схему БД оновлено до версії {current}.")
+    return current
+
+
+async def _main(args):
+    if args.status:
+        print(f"Версія схеми: {await get_schema_version()}, остання: {LATEST_VERSION}")
+    else:
+        print(f"Версія схеми: {await run_migrations()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Міграції схеми БД crm_bot")
+    parser.add_argument("--status", action="store_true", help="Лише показати версію схеми")
+    asyncio.run(_main(parser.parse_args()))
@@ -6,17 +6,70 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import event, text, func, ForeignKey
 from typing import Optional
 from datetime import datetime
+from os import getenv
+from dotenv import load_dotenv
 
-DATABASE_URL = "sqlite+aiosqlite:///./shop.db"
-engine = create_async_engine(DATABASE_URL)
+load_dotenv()
 
-def enable_foreign_keys_sync(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+DATABASE_URL = getenv("DATABASE_URL", "sqlite+aiosqlite:///./shop.db")
+DB_PROFILE = getenv("DB_PROFILE", "prod")
 
+# Профили настроек SQLite. PRAGMA применяются к каждому новому соединению в указанном порядке:
+# busy_timeout идёт первым, чтобы переключение journal_mode тоже ждало блокировку, а не падало.
+ENGINE_PROFILES: dict[str, dict[str, str | int]] = {
+    # Старое поведение (rollback-журнал, только внешние ключи) — для сравнения в bench.py
+    "legacy": {
+        "foreign_keys": "ON",
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+    "dev": {
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8000,
+        "temp_store": "MEMORY",
+    },
+    "prod": {
+        "busy_timeout": 10000,
+        "foreign_keys": "ON",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # Для нагрузочных прогонов на одноразовой БД: без fsync, долговечность не гарантируется
+    "bench": {
+        "busy_timeout": 10000,
+        "foreign_keys": "ON",
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+
+def create_engine_for_profile(url: str, profile: str):
+    """Создаёт async-движок, который настраивает каждое соединение по профилю из ENGINE_PROFILES."""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД '{profile}'. Доступные: {', '.join(ENGINE_PROFILES)}")
+    pragmas = ENGINE_PROFILES[profile]
+
+    def apply_pragmas_sync(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    profiled_engine = create_async_engine(url)
+    event.listens_for(profiled_engine.sync_engine, "connect")(apply_pragmas_sync)
+    return profiled_engine
+
+engine = create_engine_for_profile(DATABASE_URL, DB_PROFILE)
 sync_engine = engine.sync_engine
-event.listens_for(sync_engine, "connect")(enable_foreign_keys_sync)
 
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -89,6 +142,15 @@ class OrderStatus(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    # Составные индексы под частые выборки (список запросов — queries.HOT_QUERIES, проверка — index_advisor.py)
+    __table_args__ = (
+        # Активные заказы оператора: status_id IN (...) ORDER BY id
+        sa.Index('ix_orders_status_id_id', 'status_id', 'id'),
+        # Заказы курьера: courier_id = ? AND status_id NOT IN (...)
+        sa.Index('ix_orders_courier_id_status_id', 'courier_id', 'status_id'),
+        # "Мои заказы" клиента: user_id = ? ORDER BY id
+        sa.Index('ix_orders_user_id_id', 'user_id', 'id'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[Optional[int]] = mapped_column(sa.BigInteger, nullable=True)
     username: Mapped[Optional[str]] = mapped_column(sa.String(100), nullable=True)
@@ -96,9 +158,12 @@ class Order(Base):
     total_price: Mapped[int] = mapped_column()
     customer_name: Mapped[str] = mapped_column(sa.String(100), nullable=True)
     phone_number: Mapped[str] = mapped_column(sa.String(20), nullable=True, index=True)
+    phone_key: Mapped[Optional[str]] = mapped_column(sa.String(20), nullable=True, index=True, comment="Телефон в каноническом виде (normalize_phone), заполняется автоматически")
     address: Mapped[str] = mapped_column(sa.String(255), nullable=True)
     status_id: Mapped[int] = mapped_column(sa.ForeignKey('order_statuses.id'), default=1, nullable=False)
-    status: Mapped["OrderStatus"] = relationship("OrderStatus", back_populates="orders", lazy='selectin')
+    # status и history по умолчанию не загружаются (lazy='raise'): запрос сам выбирает профиль загрузки
+    # из queries.ORDER_LOAD_PROFILES, а случайное обращение без него сразу падает, а не делает лишний SELECT
+    status: Mapped["OrderStatus"] = relationship("OrderStatus", back_populates="orders", lazy='raise')
     is_delivery: Mapped[bool] = mapped_column(default=True)
     delivery_time: Mapped[str] = mapped_column(sa.String(50), nullable=True, default="Как можно скорее")
     courier_id: Mapped[Optional[int]] = mapped_column(sa.ForeignKey('employees.id', ondelete="SET NULL"), nullable=True)
@@ -108,7 +173,38 @@ class Order(Base):
 
     # НОВЫЕ СВЯЗИ
     completed_by_courier: Mapped[Optional["Employee"]] = relationship("Employee", foreign_keys="Order.completed_by_courier_id")
-    history: Mapped[list["OrderStatusHistory"]] = relationship("OrderStatusHistory", back_populates="order", cascade="all, delete-orphan", lazy='selectin')
+    history: Mapped[list["OrderStatusHistory"]] = relationship("OrderStatusHistory", back_populates="order", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    items: Mapped[list["OrderItem"]] = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan", lazy='raise', order_by="OrderItem.id")
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Канонический вид телефона: только цифры, украинские номера без кода страны дополняются "38"."""
+    if not phone:
+        return None
+    digits = "".join(ch for ch in phone if ch.isdigit())
+    if len(digits) == 10 and digits.startswith("0"):
+        digits = "38" + digits
+    return digits or None
+
+@event.listens_for(Order.phone_number, "set")
+def _sync_order_phone_key(target, value, oldvalue, initiator):
+    target.phone_key = normalize_phone(value)
+
+# Отчёт по курьерам фильтрует по статусу и date(created_at) — индекс по тому же выражению
+sa.Index('ix_orders_status_id_created_date', Order.status_id, func.date(Order.created_at))
+
+# Позиции заказа. Название и цена копируются из товара в момент добавления,
+# поэтому последующие правки меню не меняют уже оформленные заказы.
+# Order.products остаётся текстовой сводкой для списков и уведомлений и пересобирается из позиций.
+class OrderItem(Base):
+    __tablename__ = 'order_items'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey('orders.id', ondelete="CASCADE"), nullable=False, index=True)
+    product_id: Mapped[Optional[int]] = mapped_column(ForeignKey('products.id', ondelete="SET NULL"), nullable=True)
+    name: Mapped[str] = mapped_column(sa.String(100), nullable=False)
+    price: Mapped[int] = mapped_column(nullable=False, comment="Цена за единицу на момент заказа")
+    quantity: Mapped[int] = mapped_column(nullable=False, default=1)
+
+    order: Mapped["Order"] = relationship("Order", back_populates="items")
 
 # НОВАЯ ТАБЛИЦА ДЛЯ ИСТОРИИ СТАТУСОВ
 class OrderStatusHistory(Base):
@@ -120,7 +216,7 @@ class OrderStatusHistory(Base):
     timestamp: Mapped[datetime] = mapped_column(sa.DateTime, default=func.now(), server_default=func.now(), nullable=False)
 
     order: Mapped["Order"] = relationship("Order", back_populates="history")
-    status: Mapped["OrderStatus"] = relationship("OrderStatus", back_populates="history_entries", lazy='selectin')
+    status: Mapped["OrderStatus"] = relationship("OrderStatus", back_populates="history_entries", lazy='raise')
 
 
 class Customer(Base):
@@ -130,6 +226,79 @@ class Customer(Base):
     phone_number: Mapped[str] = mapped_column(sa.String(20), nullable=True)
     address: Mapped[str] = mapped_column(sa.String(255), nullable=True)
 
+# Агрегаты по клиентам для /admin/clients. Обновляются при создании, правке и отмене заказа
+# (customer_stats.update_customer_stats), полностью пересчитываются командой "python customer_stats.py rebuild".
+# Отменённые заказы не входят в order_count и total_spent.
+class CustomerStats(Base):
+    __tablename__ = 'customer_stats'
+    __table_args__ = (
+        sa.Index('ix_customer_stats_order_count_last_id', 'order_count', 'last_order_id'),
+    )
+    phone_key: Mapped[str] = mapped_column(sa.String(20), primary_key=True)
+    phone_number: Mapped[str] = mapped_column(sa.String(20), nullable=False, comment="Телефон в том виде, как в последнем заказе")
+    customer_name: Mapped[Optional[str]] = mapped_column(sa.String(100), nullable=True)
+    address: Mapped[Optional[str]] = mapped_column(sa.String(255), nullable=True)
+    order_count: Mapped[int] = mapped_column(default=0, server_default=text("0"), nullable=False)
+    total_spent: Mapped[int] = mapped_column(default=0, server_default=text("0"), nullable=False)
+    first_order_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime, nullable=True)
+    last_order_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime, nullable=True)
+    last_order_id: Mapped[int] = mapped_column(nullable=False)
+
+# Архив завершённых и отменённых заказов (archive.py). Колонки повторяют orders, order_items
+# и order_status_history с теми же именами и id, поэтому строки переносятся через INSERT ... SELECT.
+# Новая колонка в одной из рабочих таблиц добавляется и в её архив. Внешних ключей нет:
+# архив не должен мешать удалять статусы, сотрудников и товары.
+class ArchivedOrder(Base):
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        sa.Index('ix_orders_archive_phone_key_id', 'phone_key', 'id'),
+        # Граница архива: max(created_at)
+        sa.Index('ix_orders_archive_created_at', 'created_at'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    user_id: Mapped[Optional[int]] = mapped_column(sa.BigInteger, nullable=True)
+    username: Mapped[Optional[str]] = mapped_column(sa.String(100), nullable=True)
+    products: Mapped[str] = mapped_column()
+    total_price: Mapped[int] = mapped_column()
+    customer_name: Mapped[str] = mapped_column(sa.String(100), nullable=True)
+    phone_number: Mapped[str] = mapped_column(sa.String(20), nullable=True)
+    phone_key: Mapped[Optional[str]] = mapped_column(sa.String(20), nullable=True)
+    address: Mapped[str] = mapped_column(sa.String(255), nullable=True)
+    status_id: Mapped[int] = mapped_column(nullable=False)
+    is_delivery: Mapped[bool] = mapped_column(default=True)
+    delivery_time: Mapped[str] = mapped_column(sa.String(50), nullable=True)
+    courier_id: Mapped[Optional[int]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime)
+    completed_by_courier_id: Mapped[Optional[int]] = mapped_column(nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(sa.DateTime, server_default=func.now())
+
+    status: Mapped["OrderStatus"] = relationship("OrderStatus", primaryjoin="foreign(ArchivedOrder.status_id) == OrderStatus.id", viewonly=True, lazy='selectin')
+    completed_by_courier: Mapped[Optional["Employee"]] = relationship("Employee", primaryjoin="foreign(ArchivedOrder.completed_by_courier_id) == Employee.id", viewonly=True)
+    history: Mapped[list["ArchivedOrderStatusHistory"]] = relationship("ArchivedOrderStatusHistory", primaryjoin="ArchivedOrder.id == foreign(ArchivedOrderStatusHistory.order_id)", viewonly=True, order_by="ArchivedOrderStatusHistory.id")
+    items: Mapped[list["ArchivedOrderItem"]] = relationship("ArchivedOrderItem", primaryjoin="ArchivedOrder.id == foreign(ArchivedOrderItem.order_id)", viewonly=True, order_by="ArchivedOrderItem.id")
+
+# Отчёт по курьерам за старые периоды читает и архив — индекс по тому же выражению, что и в orders
+sa.Index('ix_orders_archive_status_id_created_date', ArchivedOrder.status_id, func.date(ArchivedOrder.created_at))
+
+class ArchivedOrderItem(Base):
+    __tablename__ = 'order_items_archive'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(nullable=False, index=True)
+    product_id: Mapped[Optional[int]] = mapped_column(nullable=True)
+    name: Mapped[str] = mapped_column(sa.String(100), nullable=False)
+    price: Mapped[int] = mapped_column(nullable=False)
+    quantity: Mapped[int] = mapped_column(nullable=False, default=1)
+
+class ArchivedOrderStatusHistory(Base):
+    __tablename__ = 'order_status_history_archive'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(nullable=False, index=True)
+    status_id: Mapped[int] = mapped_column(nullable=False)
+    actor_info: Mapped[str] = mapped_column(sa.String(255), nullable=False)
+    timestamp: Mapped[datetime] = mapped_column(sa.DateTime, nullable=False)
+
+    status: Mapped["OrderStatus"] = relationship("OrderStatus", primaryjoin="foreign(ArchivedOrderStatusHistory.status_id) == OrderStatus.id", viewonly=True, lazy='selectin')
+
 class CartItem(Base):
     __tablename__ = 'cart_items'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -152,26 +321,50 @@ class Settings(Base):
     r_keeper_station_code: Mapped[Optional[str]] = mapped_column(sa.String(50), nullable=True)
     r_keeper_payment_type: Mapped[Optional[str]] = mapped_column(sa.String(50), nullable=True)
 
-async def create_db_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    async with async_session_maker() as session:
-        result_status = await session.execute(sa.select(OrderStatus).limit(1))
-        if not result_status.scalars().first():
-            default_statuses = {
-                "Новый": {"visible_to_operator": True, "visible_to_courier": False},
-                "В обработке": {"visible_to_operator": True, "visible_to_courier": False},
-                "Готов": {"visible_to_operator": True, "visible_to_courier": True},
-                "Доставлен": {"visible_to_operator": True, "visible_to_courier": True, "is_completed_status": True},
-                "Отменен": {"visible_to_operator": True, "visible_to_courier": False, "is_cancelled_status": True}
-            }
-            for name, props in default_statuses.items():
-                session.add(OrderStatus(name=name, **props))
-
-        result_roles = await session.execute(sa.select(Role).limit(1))
-        if not result_roles.scalars().first():
-            session.add(Role(name="Администратор", can_manage_orders=True, can_be_assigned=False))
-            session.add(Role(name="Оператор", can_manage_orders=True, can_be_assigned=False))
-            session.add(Role(name="Курьер", can_manage_orders=False, can_be_assigned=True))
-
-        await session.commit()
\ No newline at end of file
+# Версии кэшей в памяти процесса (cache_versions.py). Запись, меняющая закэшированные данные,
+# увеличивает версию в той же транзакции; остальные воркеры uvicorn сверяют версию
+# не чаще раза в CACHE_CHECK_SECONDS и перечитывают данные, если она изменилась.
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+    name: Mapped[str] = mapped_column(sa.String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(default=0, server_default=text("0"), nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime, nullable=True, comment="Время последнего изменения (UTC), для Last-Modified")
+
+# file_id фото, уже загруженных в Telegram (telegram_media.py), чтобы не загружать файл повторно.
+# source — путь к файлу или URL, content_hash — sha256 содержимого файла (для URL пусто).
+# file_id действителен только для бота, который его получил, поэтому id бота входит в ключ.
+class TelegramMedia(Base):
+    __tablename__ = 'telegram_media'
+    source: Mapped[str] = mapped_column(sa.String(500), primary_key=True)
+    content_hash: Mapped[str] = mapped_column(sa.String(64), primary_key=True, default="", server_default=text("''"))
+    bot_id: Mapped[int] = mapped_column(sa.BigInteger, primary_key=True)
+    file_id: Mapped[str] = mapped_column(sa.String(255), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime, default=func.now(), server_default=func.now())
+
+# Состояния FSM ботов (оформление заказа, редактирование заказа, вход сотрудников).
+# key — StorageKey aiogram в виде строки, data — JSON. Просроченные строки удаляет fsm_storage.run_fsm_sweeper.
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+    key: Mapped[str] = mapped_column(sa.String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(sa.String(255), nullable=True)
+    data: Mapped[str] = mapped_column(sa.Text, nullable=False, default="{}", server_default=text("'{}'"))
+    expires_at: Mapped[datetime] = mapped_column(sa.DateTime, nullable=False, index=True)
+
+# Outbox: побочные действия после коммита (уведомления, отправка в R-Keeper) записываются
+# в той же транзакции, что и заказ или смена статуса, и доставляются outbox.outbox_dispatcher.
+# kind — тип события, payload — JSON. status: pending → sent или failed (попытки исчерпаны).
+# available_at — когда строку можно забрать: время следующей попытки или конец аренды текущей.
+class OutboxEvent(Base):
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        sa.Index('ix_outbox_status_available_at', 'status', 'available_at'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(sa.String(50), nullable=False)
+    payload: Mapped[str] = mapped_column(sa.Text, nullable=False, default="{}", server_default=text("'{}'"))
+    status: Mapped[str] = mapped_column(sa.String(10), nullable=False, default="pending", server_default=text("'pending'"))
+    attempts: Mapped[int] = mapped_column(default=0, server_default=text("0"), nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(sa.Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime, default=func.now(), server_default=func.now())
+    available_at: Mapped[datetime] = mapped_column(sa.DateTime, default=func.now(), server_default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime, nullable=True)
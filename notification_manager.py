@@ -6,16 +6,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from urllib.parse import quote_plus
 
-from models import Order, Settings, OrderStatus, Employee, Role
+from models import Order, Employee
+from settings_cache import get_settings_snapshot
+from reference_data import get_reference_data
+from send_scheduler import PRIORITY_STAFF, PRIORITY_CUSTOMER, PRIORITY_LOG
+from fan_out import Notice, DeliveryReport, fan_out
 
 logger = logging.getLogger(__name__)
 
 
-async def notify_new_order_to_staff(admin_bot: Bot, order: Order, session: AsyncSession):
+async def notify_new_order_to_staff(admin_bot: Bot, order: Order, session: AsyncSession) -> DeliveryReport:
     """
-    Надсилає сповіщення про НОВЕ замовлення в загальний чат і всім операторам на зміні.
+    Надсилає сповіщення про НОВЕ замовлення в загальний чат і всім операторам на зміні
+    (одночасно, через fan_out) і повертає звіт доставки.
     """
-    settings = await session.get(Settings, 1)
+    settings = await get_settings_snapshot(session)
 
     # Генеруємо текст та клавіатуру для керування
     status_name = order.status.name if order.status else 'Невідомий'
@@ -32,60 +37,52 @@ async def notify_new_order_to_staff(admin_bot: Bot, order: Order, session: Async
                   f"<b>Статус:</b> {status_name}")
 
     kb_admin = InlineKeyboardBuilder()
-    statuses_res = await session.execute(
-        select(OrderStatus).where(OrderStatus.visible_to_operator == True).order_by(OrderStatus.id)
-    )
+    reference = await get_reference_data(session)
     status_buttons = [
         InlineKeyboardButton(text=s.name, callback_data=f"change_order_status_{order.id}_{s.id}")
-        for s in statuses_res.scalars().all()
+        for s in reference.operator_statuses
     ]
     for i in range(0, len(status_buttons), 2):
         kb_admin.row(*status_buttons[i:i+2])
     kb_admin.row(InlineKeyboardButton(text="👤 Призначити кур'єра", callback_data=f"select_courier_{order.id}"))
     kb_admin.row(InlineKeyboardButton(text="✏️ Редагувати замовлення", callback_data=f"edit_order_{order.id}"))
 
-    # 1. Відправка в загальний адмін-чат (як лог)
+    notices = []
+    # 1. Загальний адмін-чат (як лог)
     if settings and settings.admin_chat_id:
-        try:
-            await admin_bot.send_message(
-                settings.admin_chat_id,
-                "✅ <b>Отримано нове замовлення!</b>\n\n" + admin_text,
-                reply_markup=kb_admin.as_markup()
-            )
-        except Exception as e:
-            logger.error(f"Не вдалося відправити нове замовлення в адмін-чат {settings.admin_chat_id}: {e}")
-
-    # 2. Пошук та відправка всім операторам на зміні
-    operator_roles_res = await session.execute(select(Role.id).where(Role.can_manage_orders == True))
-    operator_role_ids = operator_roles_res.scalars().all()
+        notices.append(Notice("адмін-чат", admin_bot, settings.admin_chat_id,
+                              "✅ <b>Отримано нове замовлення!</b>\n\n" + admin_text,
+                              PRIORITY_LOG, {"reply_markup": kb_admin.as_markup()}))
 
+    # 2. Усі оператори на зміні
+    operator_role_ids = reference.operator_role_ids
+    operators = []
     if not operator_role_ids:
         logger.warning("У системі немає ролей для керування замовленнями.")
-        return
-
-    operators_on_shift_res = await session.execute(
-        select(Employee).where(
-            Employee.role_id.in_(operator_role_ids),
-            Employee.is_on_shift == True,
-            Employee.telegram_user_id.is_not(None)
+    else:
+        operators_on_shift_res = await session.execute(
+            select(Employee).where(
+                Employee.role_id.in_(operator_role_ids),
+                Employee.is_on_shift == True,
+                Employee.telegram_user_id.is_not(None)
+            )
         )
-    )
-    operators = operators_on_shift_res.scalars().all()
-
-    if not operators:
-        logger.warning(f"Нове замовлення #{order.id}, але немає операторів на зміні.")
-        if settings and settings.admin_chat_id:
-            try:
-                await admin_bot.send_message(settings.admin_chat_id, "❗️<b>УВАГА: Немає операторів на зміні для обробки замовлення!</b>❗️")
-            except Exception: pass
-        return
+        operators = operators_on_shift_res.scalars().all()
+        if not operators:
+            logger.warning(f"Нове замовлення #{order.id}, але немає операторів на зміні.")
+            if settings and settings.admin_chat_id:
+                notices.append(Notice("адмін-чат", admin_bot, settings.admin_chat_id,
+                                      "❗️<b>УВАГА: Немає операторів на зміні для обробки замовлення!</b>❗️", PRIORITY_LOG))
 
     notification_text = "🔔 <b>Нове замовлення для обробки!</b>\n\n" + admin_text
-    for operator in operators:
-        try:
-            await admin_bot.send_message(operator.telegram_user_id, notification_text, reply_markup=kb_admin.as_markup())
-        except Exception as e:
-            logger.error(f"Не вдалося відправити замовлення оператору {operator.id} ({operator.telegram_user_id}): {e}")
+    notices += [
+        Notice(f"оператор {operator.id}", admin_bot, operator.telegram_user_id, notification_text,
+               PRIORITY_STAFF, {"reply_markup": kb_admin.as_markup()})
+        for operator in operators
+    ]
+    report = await fan_out(notices)
+    report.log_failures(f"Нове замовлення #{order.id}")
+    return report
 
 
 async def notify_all_parties_on_status_change(
@@ -95,14 +92,15 @@ async def notify_all_parties_on_status_change(
     admin_bot: Bot,
     client_bot: Bot | None,
     session: AsyncSession
-):
+) -> DeliveryReport:
     """
     Централізована функція для надсилання всіх сповіщень при зміні статусу.
     """
     await session.refresh(order, ['status', 'courier'])
-    settings = await session.get(Settings, 1)
+    settings = await get_settings_snapshot(session)
     new_status = order.status
 
+    notices = []
     # 1. Сповіщення в головний АДМІН-ЧАТ
     if settings and settings.admin_chat_id:
         log_message = (
@@ -110,23 +108,18 @@ async def notify_all_parties_on_status_change(
             f"<b>Ким:</b> {html.quote(actor_info)}\n"
             f"<b>Статус:</b> `{html.quote(old_status_name)}` → `{html.quote(new_status.name)}`"
         )
-        try:
-            await admin_bot.send_message(settings.admin_chat_id, log_message)
-        except Exception as e:
-            logger.error(f"Не вдалося відправити лог про зміну статусу в адмін-чат {settings.admin_chat_id}: {e}")
+        notices.append(Notice("адмін-чат", admin_bot, settings.admin_chat_id, log_message, PRIORITY_LOG))
 
-    # 2. Сповіщення призначеному КУР'ЄРУ (якщо він є і статус для нього видимий)
+    # 2. Сповіщення призначеному КУР'ЄРУ (якщо він є і статус змінив оператор)
     if order.courier and order.courier.telegram_user_id and "Оператор" in actor_info:
         courier_text = f"❗️ Статус вашого замовлення #{order.id} було змінено оператором на: <b>{new_status.name}</b>"
-        try:
-            await admin_bot.send_message(order.courier.telegram_user_id, courier_text)
-        except Exception as e:
-            logger.error(f"Не вдалося сповістити кур'єра {order.courier.telegram_user_id}: {e}")
+        notices.append(Notice("кур'єр", admin_bot, order.courier.telegram_user_id, courier_text, PRIORITY_STAFF))
 
     # 3. Сповіщення КЛІЄНТУ (якщо потрібно)
     if new_status.notify_customer and order.user_id and client_bot:
         client_text = f"Статус вашого замовлення #{order.id} змінено на: <b>{new_status.name}</b>"
-        try:
-            await client_bot.send_message(order.user_id, client_text)
-        except Exception as e:
-            logger.error(f"Не вдалося сповістити клієнта {order.user_id}: {e}")
\ No newline at end of file
+        notices.append(Notice("клієнт", client_bot, order.user_id, client_text, PRIORITY_CUSTOMER))
+
+    report = await fan_out(notices)
+    report.log_failures(f"Зміна статусу замовлення #{order.id}")
+    return report
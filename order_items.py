@@ -0,0 +1,90 @@
+# order_items.py
+"""
+Робота зі складом замовлення через таблицю order_items.
+
+Усі зміни складу йдуть через order.items (Order.items — lazy='raise', тож збережене замовлення
+читають з профілем "items": queries.get_order(session, order_id, "items")),
+після чого refresh_order_summary() перераховує суму та текстове зведення Order.products,
+яку показують списки й сповіщення. Пошук позиції — за product_id, без розбору рядків.
+"""
+
+import logging
+from typing import Iterable
+
+from models import Order, OrderItem, Product
+
+logger = logging.getLogger(__name__)
+
+def find_order_item(order: Order, product_id: int) -> OrderItem | None:
+    return next((item for item in order.items if item.product_id == product_id), None)
+
+
+def add_order_item(order: Order, product: Product, quantity: int = 1) -> OrderItem:
+    """Додає товар до замовлення або збільшує кількість вже наявної позиції."""
+    item = find_order_item(order, product.id)
+    if item:
+        item.quantity += quantity
+    else:
+        item = OrderItem(product_id=product.id, name=product.name, price=product.price, quantity=quantity)
+        order.items.append(item)
+    return item
+
+
+def change_item_quantity(order: Order, product_id: int, delta: int) -> bool:
+    """Змінює кількість позиції; позиція з кількістю 0 і менше видаляється."""
+    item = find_order_item(order, product_id)
+    if not item:
+        return False
+    item.quantity += delta
+    if item.quantity <= 0:
+        order.items.remove(item)
+    return True
+
+
+def remove_order_item(order: Order, product_id: int) -> bool:
+    item = find_order_item(order, product_id)
+    if not item:
+        return False
+    order.items.remove(item)
+    return True
+
+
+def replace_order_items(order: Order, lines: Iterable[tuple[Product, int]]):
+    """
+    Замінює склад замовлення на переданий список (товар, кількість).
+    Для товарів, що вже були в замовленні, зберігається ціна на момент замовлення.
+    """
+    old_items = {item.product_id: item for item in order.items if item.product_id is not None}
+    new_items = []
+    for product, quantity in lines:
+        if quantity <= 0:
+            continue
+        if item := old_items.pop(product.id, None):
+            item.quantity = quantity
+        else:
+            item = OrderItem(product_id=product.id, name=product.name, price=product.price, quantity=quantity)
+        new_items.append(item)
+    order.items = new_items
+
+
+def build_products_summary(items: Iterable[OrderItem]) -> str:
+    return ", ".join(f"{item.name} x {item.quantity}" for item in items)
+
+
+def refresh_order_summary(order: Order):
+    """Перераховує суму та текстове зведення замовлення за його позиціями."""
+    order.products = build_products_summary(order.items)
+    order.total_price = sum(item.price * item.quantity for item in order.items)
+
+
+def parse_products_string(products_str: str) -> dict[str, int]:
+    """Розбирає старий формат 'Назва x Кількість, ...' на словник (потрібно лише для перенесення даних)."""
+    if not products_str: return {}
+    products_dict = {}
+    for part in products_str.split(', '):
+        try:
+            name, quantity_str = part.rsplit(' x ', 1)
+            products_dict[name] = products_dict.get(name, 0) + int(quantity_str)
+        except ValueError:
+            logger.warning(f"Не вдалося розібрати частину рядка товарів: {part}")
+    return products_dict
@@ -0,0 +1,114 @@
+# order_jobs.py
+"""
+Побічні дії замовлень, що доставляються через outbox (outbox.py).
+
+У транзакції, що створює замовлення або змінює його статус, обробник додає подію:
+- add_new_order_events() — нове замовлення: сповіщення адмін-чату й операторів на зміні
+  і (якщо інтеграцію ввімкнено) відправка в R-Keeper. Позиції для R-Keeper беруться
+  із збережених order_items (ціна на момент замовлення) і r_keeper_id страв;
+- add_status_change_event() — зміна статусу: адмін-чат, кур'єр, клієнт.
+
+Обробники подій нижче отримують лише id замовлення й прості значення і самі відкривають
+сесію БД. Боти беруться з bot_registry; поки адмін-бот не налаштований, обробник падає,
+і подія повториться пізніше. Сповіщення повторюється, лише якщо його не отримав
+жоден адресат: повтор надсилає його всім адресатам знову.
+"""
+
+import logging
+
+from aiogram import Bot
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot_instances import bot_registry
+from models import async_session_maker, Order, OrderItem, Product
+from queries import get_order
+from notification_manager import notify_new_order_to_staff, notify_all_parties_on_status_change
+from settings_cache import get_settings_snapshot
+from fan_out import DeliveryReport
+from outbox import add_outbox_event, outbox_handler
+
+try:
+    from r_keeper import RKeeperAPI
+except ImportError:
+    class RKeeperAPI:
+        def __init__(self, settings): pass
+        async def send_order(self, order, items):
+            logging.warning("r_keeper.py не знайдено, інтеграція з R-Keeper вимкнена.")
+
+logger = logging.getLogger(__name__)
+
+NEW_ORDER = "new_order"
+R_KEEPER_ORDER = "r_keeper_order"
+STATUS_CHANGED = "status_changed"
+
+
+async def add_new_order_events(write_session: AsyncSession, order: Order, r_keeper: bool = True):
+    """Додає події нового замовлення в транзакцію write_session; r_keeper=False — без R-Keeper (замовлення з адмінки)."""
+    await write_session.flush()
+    add_outbox_event(write_session, NEW_ORDER, order_id=order.id)
+    if r_keeper and (await get_settings_snapshot(write_session)).r_keeper_enabled:
+        add_outbox_event(write_session, R_KEEPER_ORDER, order_id=order.id)
+
+
+def add_status_change_event(write_session: AsyncSession, order_id: int, old_status_name: str, actor_info: str):
+    add_outbox_event(write_session, STATUS_CHANGED, order_id=order_id,
+                     old_status_name=old_status_name, actor_info=actor_info)
+
+
+async def _admin_bot() -> Bot:
+    await bot_registry.refresh()
+    if bot_registry.admin_bot is None:
+        raise RuntimeError("адмін-бот не налаштований")
+    return bot_registry.admin_bot
+
+
+def _raise_if_undelivered(report: DeliveryReport):
+    if report.failed and not report.delivered:
+        raise RuntimeError(f"жодному з {len(report.failed)} адресатів не доставлено: {report.failed[0].error}")
+
+
+@outbox_handler(NEW_ORDER)
+async def notify_new_order_job(payload: dict):
+    admin_bot = await _admin_bot()
+    async with async_session_maker() as session:
+        order = await get_order(session, payload["order_id"], "notify")
+        if order:
+            _raise_if_undelivered(await notify_new_order_to_staff(admin_bot, order, session))
+
+
+@outbox_handler(STATUS_CHANGED)
+async def notify_status_change_job(payload: dict):
+    admin_bot = await _admin_bot()
+    async with async_session_maker() as session:
+        order = await session.get(Order, payload["order_id"])
+        if order:
+            _raise_if_undelivered(await notify_all_parties_on_status_change(
+                order=order,
+                old_status_name=payload["old_status_name"],
+                actor_info=payload["actor_info"],
+                admin_bot=admin_bot,
+                client_bot=bot_registry.bot,
+                session=session
+            ))
+
+
+async def r_keeper_items(session: AsyncSession, order_id: int) -> list[dict]:
+    """Позиції замовлення у форматі RKeeperAPI.send_order; страви без r_keeper_id пропускаються."""
+    rows = (await session.execute(
+        select(Product.r_keeper_id, OrderItem.quantity, OrderItem.price)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id == order_id, Product.r_keeper_id.is_not(None), Product.r_keeper_id != "")
+        .order_by(OrderItem.id)
+    )).all()
+    return [{"r_keeper_id": row.r_keeper_id, "quantity": row.quantity, "price": row.price} for row in rows]
+
+
+@outbox_handler(R_KEEPER_ORDER)
+async def send_order_to_r_keeper_job(payload: dict):
+    async with async_session_maker() as session:
+        settings = await get_settings_snapshot(session)
+        order = await session.get(Order, payload["order_id"])
+        items = await r_keeper_items(session, order.id) if order else []
+    if items and await RKeeperAPI(settings).send_order(order, items) is False:
+        raise RuntimeError(f"R-Keeper не прийняв замовлення #{order.id}")
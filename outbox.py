@@ -0,0 +1,229 @@
+# outbox.py
+"""
+Transactional outbox: побічні дії після коміту, що не губляться при перезапуску.
+
+Обробник, що змінює замовлення, додає подію в таблицю outbox тією ж транзакцією
+(add_outbox_event(write_session, kind, **payload) всередині роботи write_coordinator).
+Якщо транзакцію відкочено — події немає; якщо процес упав одразу після коміту —
+подія лишилась у БД і буде доставлена після запуску.
+
+outbox_dispatcher (запускається в lifespan):
+- забирає до OUTBOX_BATCH_SIZE готових подій одним записом: attempts += 1, а
+  available_at зсувається на OUTBOX_LEASE_SECONDS (оренда — інший процес чи наступна
+  ітерація не візьмуть ту саму подію, а якщо процес упаде, подія знову стане доступною);
+- виконує обробник кожної події через job_runner (background_jobs.py);
+- успіх позначає status='sent'; після помилки наступна спроба — через
+  OUTBOX_RETRY_SECONDS * 2^(спроба-1) секунд (не більше OUTBOX_RETRY_MAX_SECONDS),
+  після OUTBOX_MAX_ATTEMPTS спроб — status='failed' з текстом останньої помилки;
+- прокидається одразу після коміту транзакції з новою подією, інакше опитує таблицю
+  раз на OUTBOX_POLL_SECONDS; доставлені події старші за OUTBOX_KEEP_DAYS днів видаляє.
+
+Доставка щонайменше один раз: обробник може виконатись повторно (наприклад, процес
+упав після надсилання, але до позначки sent), тож повтор не має ламати дані.
+Обробники реєструються декоратором @outbox_handler(kind) (див. order_jobs.py).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import OutboxEvent
+from db_writer import write_coordinator, run_after_commit
+from background_jobs import job_runner
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_LEASE_SECONDS = int(getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_SECONDS = float(getenv("OUTBOX_RETRY_SECONDS", "5"))
+OUTBOX_RETRY_MAX_SECONDS = float(getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+OUTBOX_KEEP_DAYS = float(getenv("OUTBOX_KEEP_DAYS", "7"))
+
+OutboxHandler = Callable[[dict[str, Any]], Awaitable[None]]
+
+_handlers: dict[str, OutboxHandler] = {}
+
+
+def outbox_handler(kind: str):
+    """Реєструє обробник подій типу kind; він отримує payload події як dict."""
+    def register(func: OutboxHandler) -> OutboxHandler:
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def add_outbox_event(session: AsyncSession, kind: str, **payload):
+    """Додає подію в поточну транзакцію; викликається лише всередині роботи write_coordinator."""
+    session.add(OutboxEvent(kind=kind, payload=json.dumps(payload, ensure_ascii=False)))
+    run_after_commit(session, "outbox_wake", outbox_dispatcher.wake)
+
+
+def _now(seconds: float = 0):
+    # Час у outbox пишеться функцією datetime() SQLite (UTC), тож порівнюємо з нею ж
+    return func.datetime("now", f"{int(seconds):+d} seconds")
+
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_SECONDS * 2 ** max(0, attempts - 1))
+
+
+@dataclass(frozen=True)
+class _Claimed:
+    id: int
+    kind: str
+    payload: str
+    attempts: int
+
+
+@dataclass
+class OutboxStats:
+    claimed: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"claimed": self.claimed, "sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.stats = OutboxStats()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._pruned_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Диспетчер outbox запущено (пачка до {self.batch_size} подій).")
+
+    async def stop(self):
+        """Перестає забирати нові події; вже забрані дочищує job_runner.stop()."""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"Диспетчер outbox зупинено: {self.metrics()}")
+
+    def metrics(self) -> dict[str, Any]:
+        return self.stats.snapshot()
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.dispatch_batch()
+                await self._prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Помилка диспетчера outbox: {e}", exc_info=True)
+                claimed = 0
+            if claimed >= self.batch_size:
+                continue  # у черзі, ймовірно, є ще події
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def dispatch_batch(self) -> int:
+        """Забирає пачку готових подій і ставить їх доставку в job_runner; повертає кількість."""
+        async def claim(write_session: AsyncSession) -> list[_Claimed]:
+            ids = (await write_session.execute(
+                select(OutboxEvent.id)
+                .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= _now())
+                .order_by(OutboxEvent.available_at, OutboxEvent.id).limit(self.batch_size)
+            )).scalars().all()
+            if not ids:
+                return []
+            rows = await write_session.execute(
+                sa.update(OutboxEvent).where(OutboxEvent.id.in_(ids))
+                .values(attempts=OutboxEvent.attempts + 1, available_at=_now(OUTBOX_LEASE_SECONDS))
+                .returning(OutboxEvent.id, OutboxEvent.kind, OutboxEvent.payload, OutboxEvent.attempts)
+            )
+            return sorted((_Claimed(*row) for row in rows), key=lambda event: ids.index(event.id))
+
+        events = await write_coordinator.run(claim)
+        self.stats.claimed += len(events)
+        for event in events:
+            await job_runner.enqueue(f"outbox:{event.kind}", self._deliver, event)
+        return len(events)
+
+    async def _deliver(self, event: _Claimed):
+        try:
+            handler = _handlers.get(event.kind)
+            if handler is None:
+                raise LookupError(f"немає обробника для події '{event.kind}'")
+            await handler(json.loads(event.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._record_failure(event, e)
+            return
+        await write_coordinator.run(self._update(event.id, status="sent", sent_at=_now(), last_error=None))
+        self.stats.sent += 1
+
+    async def _record_failure(self, event: _Claimed, error: Exception):
+        error_text = f"{type(error).__name__}: {error}"
+        if event.attempts >= self.max_attempts:
+            await write_coordinator.run(self._update(event.id, status="failed", last_error=error_text))
+            self.stats.failed += 1
+            logger.error(f"Подію outbox #{event.id} ({event.kind}) не доставлено після {event.attempts} спроб: {error_text}")
+            return
+        delay = retry_delay(event.attempts)
+        await write_coordinator.run(self._update(event.id, available_at=_now(delay), last_error=error_text))
+        self.stats.retried += 1
+        logger.warning(f"Подія outbox #{event.id} ({event.kind}), спроба {event.attempts}: {error_text}. Повтор через {delay:g} с.")
+
+    @staticmethod
+    def _update(event_id: int, **values):
+        async def save(write_session: AsyncSession):
+            await write_session.execute(sa.update(OutboxEvent).where(OutboxEvent.id == event_id).values(**values))
+        return save
+
+    async def _prune(self):
+        if OUTBOX_KEEP_DAYS <= 0 or time.monotonic() - self._pruned_at < 3600:
+            return
+        self._pruned_at = time.monotonic()
+
+        async def prune(write_session: AsyncSession) -> int:
+            result = await write_session.execute(sa.delete(OutboxEvent).where(
+                OutboxEvent.status == "sent", OutboxEvent.sent_at < _now(-OUTBOX_KEEP_DAYS * 86400)
+            ))
+            return result.rowcount
+
+        removed = await write_coordinator.run(prune)
+        if removed:
+            logger.info(f"Видалено доставлених подій outbox: {removed}.")
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,204 @@
+# pagination.py
+"""
+Пагінація за ключем (keyset) для списків адмін-панелі.
+
+Замість OFFSET сторінка вибирається умовою "ключ сортування менший (або більший)
+за курсор", тож SQLite одразу стає на потрібне місце індексу і читає per_page + 1 рядків —
+сотая сторінка коштує стільки ж, скільки перша.
+
+Курсор (?cursor=...) — значення ключа сортування крайнього рядка сторінки, напрям
+і номер сторінки, закодовані в base64. Сусідні сторінки для панелі пагінації
+знаходяться короткими запитами лише за ключовими колонками від країв поточної сторінки,
+тому COUNT(*) по всій таблиці не потрібен. Загальну кількість можна показати
+приблизно (approximate_count) — за діапазоном rowid, без перегляду таблиці.
+"""
+
+import base64
+import binascii
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+from urllib.parse import urlencode
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+PAGE_WINDOW = 2  # скільки сторінок показувати з кожного боку від поточної
+
+_AFTER, _BEFORE = "a", "b"
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    page: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    has_prev: bool = False
+    # (номер сторінки, курсор) сусідніх сторінок; курсор None — перша сторінка
+    window: list[tuple[int, Optional[str]]] = field(default_factory=list)
+    approx_total: Optional[int] = None
+    per_page: int = 0
+
+
+def encode_cursor(values: Sequence[Any], direction: str, page: int) -> str:
+    raw = json.dumps({"k": list(values), "d": direction, "p": page}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], keys_count: int) -> Optional[dict]:
+    """Розбирає курсор; для пошкодженого або чужого курсора повертає None (перша сторінка)."""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["d"] not in (_AFTER, _BEFORE) or len(data["k"]) != keys_count or int(data["p"]) < 2:
+            raise ValueError("bad cursor")
+        return data
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Некоректний курсор пагінації '{cursor}': {e}")
+        return None
+
+
+def _key_values(row, keys: Sequence[sa.ColumnElement]) -> list:
+    return [getattr(row, key.key) for key in keys]
+
+
+def _beyond(keys: Sequence[sa.ColumnElement], values: Sequence[Any], forward: bool, descending: bool):
+    """Умова "рядок лежить далі за курсор" у напрямку обходу (порівняння кортежів SQLite)."""
+    lhs = sa.tuple_(*keys) if len(keys) > 1 else keys[0]
+    rhs = sa.tuple_(*values) if len(keys) > 1 else values[0]
+    return lhs < rhs if forward == descending else lhs > rhs
+
+
+def _ordered(query: sa.Select, keys: Sequence[sa.ColumnElement], forward: bool, descending: bool) -> sa.Select:
+    desc = forward == descending
+    return query.order_by(None).order_by(*[key.desc() if desc else key.asc() for key in keys])
+
+
+async def approximate_count(session: AsyncSession, table: sa.Table) -> int:
+    """
+    Приблизна кількість рядків за діапазоном rowid — два пошуки по B-дереву замість COUNT(*).
+    Після видалень завищує результат, тому показується як "≈".
+    """
+    row = (await session.execute(sa.text(f"SELECT min(rowid), max(rowid) FROM {table.name}"))).one()
+    return 0 if row[0] is None else row[1] - row[0] + 1
+
+
+async def paginate_keyset(
+    session: AsyncSession,
+    query: sa.Select,
+    keys: Sequence[sa.ColumnElement],
+    per_page: int,
+    cursor: Optional[str] = None,
+    *,
+    descending: bool = True,
+    load_options: Sequence = (),
+    count_table: Optional[sa.Table] = None,
+    window: int = PAGE_WINDOW,
+) -> KeysetPage:
+    """
+    Повертає сторінку запиту query (без ORDER BY і LIMIT — їх задає пагінація).
+    keys — колонки ключа сортування, останньою має йти унікальна (зазвичай id);
+    усі сортуються в одному напрямку. load_options (joinedload тощо) застосовуються
+    лише до вибірки самих рядків. count_table — таблиця для приблизної кількості
+    (передавати лише для списку без фільтрів).
+    """
+    keys = list(keys)
+    state = decode_cursor(cursor, len(keys))
+    items_query = query.options(*load_options)
+
+    async def fetch(values, forward: bool, limit: int, only_keys: bool = False) -> list:
+        stmt = query.with_only_columns(*keys) if only_keys else items_query
+        if values is not None:
+            stmt = stmt.where(_beyond(keys, values, forward, descending))
+        result = await session.execute(_ordered(stmt, keys, forward, descending).limit(limit))
+        return result.all() if only_keys else list(result.unique().scalars().all())
+
+    page_no, items, has_next = 1, [], False
+    if state and state["d"] == _BEFORE:
+        rows = await fetch(state["k"], False, per_page + 1)
+        if len(rows) > per_page:
+            page_no, items, has_next = state["p"], rows[:per_page][::-1], True
+        else:
+            # Попереду лишилось менше повної сторінки (рядки видалено або додано) — це вже перша сторінка
+            state = None
+    elif state:
+        rows = await fetch(state["k"], True, per_page + 1)
+        page_no, items, has_next = state["p"], rows[:per_page], len(rows) > per_page
+    if not state:
+        rows = await fetch(None, True, per_page + 1)
+        items, has_next = rows[:per_page], len(rows) > per_page
+
+    page = KeysetPage(items=items, page=page_no, has_prev=page_no > 1, per_page=per_page)
+    if items:
+        first, last = _key_values(items[0], keys), _key_values(items[-1], keys)
+        if has_next:
+            page.next_cursor = encode_cursor(last, _AFTER, page_no + 1)
+        if page.has_prev:
+            page.prev_cursor = None if page_no == 2 else encode_cursor(first, _BEFORE, page_no - 1)
+        page.window = await _page_window(fetch, page, first, last, has_next, window)
+    if count_table is not None:
+        page.approx_total = await approximate_count(session, count_table)
+    return page
+
+
+async def _page_window(fetch, page: KeysetPage, first: list, last: list, has_next: bool, window: int):
+    """Курсори сторінок page-window..page+window: кожна наступна починається після per_page рядків попередньої."""
+    per_page = page.per_page
+    pages: list[tuple[int, Optional[str]]] = []
+
+    behind_needed = min(window, page.page - 1)
+    if behind_needed:
+        behind = await fetch(first, False, (behind_needed - 1) * per_page, only_keys=True) if behind_needed > 1 else []
+        for step in range(behind_needed, 0, -1):
+            number = page.page - step
+            if number == 1:
+                pages.append((1, None))
+            elif step == 1:
+                pages.append((number, page.prev_cursor))
+            elif len(behind) >= (step - 1) * per_page:
+                pages.append((number, encode_cursor(list(behind[(step - 1) * per_page - 1]), _BEFORE, number)))
+
+    pages.append((page.page, None))
+
+    if has_next:
+        ahead = await fetch(last, True, (window - 1) * per_page + 1, only_keys=True) if window > 1 else []
+        pages.append((page.page + 1, page.next_cursor))
+        for step in range(2, window + 1):
+            if len(ahead) <= (step - 1) * per_page:
+                break
+            pages.append((page.page + step, encode_cursor(list(ahead[(step - 1) * per_page - 1]), _AFTER, page.page + step)))
+    return pages
+
+
+def render_page_bar(page: KeysetPage, base_url: str, params: Optional[dict] = None) -> str:
+    """HTML панелі пагінації: ‹ попередня, вікно номерів сторінок, наступна ›, приблизна кількість."""
+    if not page.has_prev and not page.next_cursor:
+        return ""
+    params = {k: v for k, v in (params or {}).items() if v}
+
+    def url(cursor: Optional[str]) -> str:
+        query = urlencode({**params, "cursor": cursor} if cursor else params)
+        return f"{base_url}?{query}" if query else base_url
+
+    links = []
+    if page.has_prev:
+        links.append(f'<a href="{url(page.prev_cursor)}" title="Попередня">‹</a>')
+    window_numbers = [number for number, _ in page.window]
+    if page.has_prev and 1 not in window_numbers:
+        links.append(f'<a href="{url(None)}">1</a><span>…</span>')
+    for number, cursor in page.window:
+        if number == page.page:
+            links.append(f'<a class="active">{number}</a>')
+        else:
+            links.append(f'<a href="{url(cursor)}">{number}</a>')
+    if page.next_cursor:
+        links.append(f'<a href="{url(page.next_cursor)}" title="Наступна">›</a>')
+    if page.approx_total is not None:
+        pages_total = max(1, -(-page.approx_total // page.per_page))
+        links.append(f'<span style="align-self: center; color: #6b7280;">≈ {page.approx_total} записів, ~{pages_total} стор.</span>')
+    return f"<div class='pagination'>{''.join(links)}</div>"
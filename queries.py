@@ -0,0 +1,180 @@
+# queries.py
+"""
+Часті запити до замовлень, зібрані в одному місці.
+
+Обробники будують запити через ці функції, а HOT_QUERIES містить ті самі запити
+з типовими параметрами — за цим реєстром index_advisor.py перевіряє EXPLAIN QUERY PLAN.
+Додаючи новий частий запит до orders, додайте його і до реєстру.
+"""
+
+from datetime import date, timedelta
+from typing import Callable
+
+from sqlalchemy import Select, select, func, and_, or_, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, raiseload
+
+from models import Order, OrderStatus, OrderStatusHistory, Employee, CustomerStats, ArchivedOrder
+
+
+# Профілі завантаження зв'язків замовлення. Order.status, Order.history і Order.items за замовчуванням
+# не завантажуються (lazy='raise'), тож кожен запит обирає профіль явно:
+# "list"   — рядки списків: статус і кур'єр тим самим JOIN, позиції не потрібні;
+#            роль кур'єра теж через JOIN, інакше Employee.role (selectin) дає окремий SELECT;
+# "detail" — сторінка замовлення чи клієнта: також історія статусів і позиції;
+# "notify" — тексти сповіщень і картка замовлення в боті: статус, кур'єр, позиції;
+# "items"  — зміна складу (order_items.py) і екрани редагування складу: лише позиції.
+ORDER_LOAD_PROFILES: dict[str, tuple] = {
+    "list": (
+        joinedload(Order.status),
+        joinedload(Order.courier).joinedload(Employee.role),
+        raiseload(Order.items),
+    ),
+    "detail": (
+        joinedload(Order.status),
+        joinedload(Order.courier).joinedload(Employee.role),
+        joinedload(Order.completed_by_courier).joinedload(Employee.role),
+        selectinload(Order.history).joinedload(OrderStatusHistory.status),
+        selectinload(Order.items),
+    ),
+    "notify": (
+        joinedload(Order.status),
+        joinedload(Order.courier).joinedload(Employee.role),
+        selectinload(Order.items),
+    ),
+    "items": (
+        selectinload(Order.items),
+    ),
+}
+
+
+def order_load(profile: str) -> tuple:
+    return ORDER_LOAD_PROFILES[profile]
+
+
+async def get_order(session: AsyncSession, order_id: int, profile: str, refresh: bool = False) -> Order | None:
+    """Замовлення за id з профілем завантаження; refresh — перечитати, якщо воно вже є в сесії."""
+    return await session.get(Order, order_id, options=order_load(profile), populate_existing=refresh)
+
+
+def final_status_ids_query() -> Select:
+    return select(OrderStatus.id).where(or_(OrderStatus.is_completed_status == True, OrderStatus.is_cancelled_status == True))
+
+
+def active_status_ids_query() -> Select:
+    return select(OrderStatus.id).where(OrderStatus.is_completed_status == False, OrderStatus.is_cancelled_status == False)
+
+
+def operator_active_orders_query(active_status_ids: list[int]) -> Select:
+    # Фільтр IN за активними статусами, а не NOT IN за фінальними: NOT IN не може використати індекс.
+    # "id + 0" у сортуванні не дає планувальнику обрати повний перегляд таблиці в порядку rowid:
+    # статистика ANALYZE не знає, що активних замовлень лише кілька відсотків.
+    return (
+        select(Order).options(*order_load("list"))
+        .where(Order.status_id.in_(active_status_ids))
+        .order_by((Order.id + 0).desc())
+    )
+
+
+def courier_active_orders_query(courier_id: int, final_status_ids: list[int]) -> Select:
+    return (
+        select(Order).options(*order_load("list"))
+        .where(Order.courier_id == courier_id, Order.status_id.not_in(final_status_ids))
+        .order_by(Order.id.desc())
+    )
+
+
+def customer_orders_query(user_id: int) -> Select:
+    return select(Order).options(*order_load("list")).where(Order.user_id == user_id).order_by(Order.id.desc())
+
+
+def client_orders_query(phone_key: str) -> Select:
+    return (
+        select(Order)
+        .where(Order.phone_key == phone_key)
+        .options(*order_load("detail"))
+        .order_by(Order.id.desc())
+    )
+
+
+def customer_profile_query(phone_key: str) -> Select:
+    """Ім'я, телефон і остання адреса клієнта — один рядок customer_stats за первинним ключем."""
+    return (
+        select(CustomerStats.customer_name, CustomerStats.phone_number, CustomerStats.address)
+        .where(CustomerStats.phone_key == phone_key)
+    )
+
+
+# Ключ сортування списку клієнтів: last_order_id унікальний, тож він же й ключ для курсора пагінації
+CLIENTS_LIST_KEYS = [CustomerStats.order_count, CustomerStats.last_order_id]
+
+
+def clients_list_query(search: str | None = None) -> Select:
+    """
+    Список клієнтів з customer_stats. Пошук за телефоном — за початком канонічного номера
+    (діапазон по первинному ключу), за ім'ям — за входженням підрядка.
+    """
+    query = select(CustomerStats).order_by(*[key.desc() for key in CLIENTS_LIST_KEYS])
+    if not search:
+        return query
+    if search.strip().lstrip("+").replace(" ", "").replace("-", "").isdigit():
+        phone_prefix = "".join(ch for ch in search if ch.isdigit())
+        if phone_prefix.startswith("0"):
+            phone_prefix = "38" + phone_prefix
+        # ":" — наступний символ після "9", тож діапазон охоплює всі номери з цим початком
+        return query.where(CustomerStats.phone_key >= phone_prefix, CustomerStats.phone_key < phone_prefix + ":")
+    return query.where(CustomerStats.customer_name.ilike(f"%{search}%"))
+
+
+def archived_client_orders_query(phone_key: str) -> Select:
+    return (
+        select(ArchivedOrder)
+        .where(ArchivedOrder.phone_key == phone_key)
+        .options(
+            joinedload(ArchivedOrder.completed_by_courier),
+            selectinload(ArchivedOrder.history),
+        )
+        .order_by(ArchivedOrder.id.desc())
+    )
+
+
+def courier_report_query(date_from: date, date_to: date, completed_status_id: int, include_archive: bool = False) -> Select:
+    """Кількість виконаних замовлень по кур'єрах; include_archive — період сягає архіву (archive.archive_needed)."""
+    def completed_orders(model) -> Select:
+        return select(model.completed_by_courier_id.label("courier_id")).where(
+            and_(
+                model.status_id == completed_status_id,
+                func.date(model.created_at) >= date_from,
+                func.date(model.created_at) <= date_to,
+            )
+        )
+
+    source = (union_all(completed_orders(Order), completed_orders(ArchivedOrder)) if include_archive else completed_orders(Order)).subquery()
+    return (
+        select(
+            Employee.full_name,
+            func.count().label("completed_orders")
+        )
+        .select_from(source)
+        .join(Employee, source.c.courier_id == Employee.id)
+        .group_by(Employee.full_name)
+        .order_by(func.count().desc())
+    )
+
+
+# Реєстр частих запитів з типовими параметрами для index_advisor.py
+HOT_QUERIES: dict[str, Callable[[], Select]] = {
+    "operator_active_orders": lambda: operator_active_orders_query([1, 2, 3]),
+    "courier_active_orders": lambda: courier_active_orders_query(1, [4, 5]),
+    "customer_orders": lambda: customer_orders_query(100001),
+    "client_orders": lambda: client_orders_query("380501234567"),
+    "customer_profile": lambda: customer_profile_query("380501234567"),
+    "clients_list": lambda: clients_list_query().limit(20),
+    "clients_search_phone": lambda: clients_list_query("050123").limit(20),
+    "clients_list_deep_page": lambda: clients_list_query()
+        .where(tuple_(*CLIENTS_LIST_KEYS) < tuple_(3, 40000)).limit(21),
+    "orders_list_deep_page": lambda: select(Order).where(Order.id < 20000).order_by(Order.id.desc()).limit(16),
+    "archived_client_orders": lambda: archived_client_orders_query("380501234567"),
+    "courier_report": lambda: courier_report_query(date.today() - timedelta(days=7), date.today(), 4),
+    "courier_report_with_archive": lambda: courier_report_query(date.today() - timedelta(days=365), date.today(), 4, include_archive=True),
+}
@@ -0,0 +1,188 @@
+# query_budget.py
+"""
+Перевірка кількості SQL-запитів на екран.
+
+    python query_budget.py [-v]
+
+Створює тимчасову БД (міграції + кілька десятків замовлень з позиціями та історією),
+викликає обробники адмін-панелі та ботів напряму з сесією цієї БД і рахує запити,
+що дійшли до SQLite. Якщо екран виконав більше запитів, ніж дозволено в _screens(),
+скрипт завершується з кодом 1.
+
+Бюджет не залежить від кількості рядків на екрані: зайвий SELECT на кожне замовлення (N+1)
+або забутий профіль завантаження (queries.ORDER_LOAD_PROFILES) одразу його перевищить.
+Змінюючи екран, оновіть його бюджет тут.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Awaitable, Callable
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import (Order, OrderItem, OrderStatusHistory, Employee, Category, Product,
+                    create_engine_for_profile, normalize_phone)
+from migrations import run_migrations
+from customer_stats import rebuild_customer_stats
+from reference_data import reference_cache
+
+ORDERS_COUNT = 40
+CLIENT_PHONE = "+380501110001"
+COURIER_TG_ID, OPERATOR_TG_ID, CUSTOMER_TG_ID = 500, 501, 900
+
+
+class ChatMessage:
+    """Мінімальна заміна повідомлення aiogram: обробники читають from_user.id і відповідають."""
+    def __init__(self, user_id: int):
+        self.from_user = SimpleNamespace(id=user_id)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class ChatBot:
+    """Мінімальна заміна Bot для екранів, що редагують повідомлення."""
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+async def change_order_items(session: AsyncSession):
+    """Запис складу, як у admin_handlers.admin_modify_item: позиції, знімок клієнта, зведення."""
+    from queries import get_order
+    from order_items import change_item_quantity, refresh_order_summary
+    from customer_stats import order_snapshot, update_customer_stats
+
+    order = await get_order(session, 1, "items")
+    before = await order_snapshot(session, order)
+    change_item_quantity(order, 1, 1)
+    refresh_order_summary(order)
+    await update_customer_stats(session, order, before)
+    await session.rollback()
+
+
+def _screens() -> dict[str, tuple[int, Callable[[AsyncSession], Awaitable]]]:
+    """Екран -> (бюджет запитів, виклик обробника). Імпорт main — тут, бо він будує застосунок."""
+    import main
+    from admin_clients import admin_clients_list, admin_client_detail
+    from admin_order_management import get_manage_order_page
+    from admin_handlers import _display_edit_items_menu
+    from courier_handlers import show_courier_orders, show_operator_orders
+    from staff_identity import StaffMember
+    from reference_data import RoleInfo
+
+    courier = StaffMember(1, COURIER_TG_ID, "Кур'єр", RoleInfo(3, "Кур'єр", False, True), True)
+
+    admin = "admin"
+    return {
+        "/admin": (3, lambda s: main.admin_dashboard(session=s, username=admin)),
+        "/admin/orders": (3, lambda s: main.admin_orders(cursor=None, q=None, session=s, username=admin)),
+        "/admin/orders?search": (2, lambda s: main.admin_orders(cursor=None, q="Клієнт", session=s, username=admin)),
+        "/admin/products": (4, lambda s: main.admin_products(cursor=None, q=None, session=s, username=admin)),
+        "/admin/clients": (3, lambda s: admin_clients_list(cursor=None, q=None, session=s, username=admin)),
+        "/admin/client/{phone}": (5, lambda s: admin_client_detail(phone_number=CLIENT_PHONE, session=s, username=admin)),
+        "/admin/order/manage/{id}": (5, lambda s: get_manage_order_page(order_id=1, session=s, username=admin)),
+        "/admin/order/edit/{id}": (2, lambda s: main.get_edit_order_form(order_id=1, session=s, username=admin)),
+        "/admin/reports/couriers": (2, lambda s: main.report_couriers(date_from_str=None, date_to_str=None, session=s, username=admin)),
+        "bot: мої замовлення": (1, lambda s: main.show_my_orders(ChatMessage(CUSTOMER_TG_ID), s)),
+        # співробітника визначає StaffMiddleware з кешу (staff_identity.py) ще до обробника
+        "bot: замовлення кур'єра": (1, lambda s: show_courier_orders(ChatMessage(COURIER_TG_ID), s, courier)),
+        "bot: активні замовлення оператора": (1, lambda s: show_operator_orders(ChatMessage(OPERATOR_TG_ID), s)),
+        "bot: склад замовлення": (2, lambda s: _display_edit_items_menu(ChatBot(), 1, 1, 1, s)),
+        "запис: зміна складу замовлення": (7, change_order_items),
+    }
+
+
+async def seed_database(engine):
+    await run_migrations(engine)
+    now = datetime.now()
+    async with engine.begin() as conn:
+        await conn.execute(sa.insert(Employee), [
+            {"id": 1, "full_name": "Кур'єр", "role_id": 3, "telegram_user_id": COURIER_TG_ID, "is_on_shift": True},
+            {"id": 2, "full_name": "Оператор", "role_id": 2, "telegram_user_id": OPERATOR_TG_ID, "is_on_shift": True},
+        ])
+        await conn.execute(sa.insert(Category).values(id=1, name="Супи"))
+        await conn.execute(sa.insert(Product), [
+            {"id": i, "name": f"Страва {i}", "price": 100 + i, "category_id": 1} for i in range(1, 16)
+        ])
+        orders = []
+        for order_id in range(1, ORDERS_COUNT + 1):
+            phone = CLIENT_PHONE if order_id % 2 else f"+38050{order_id:07d}"
+            orders.append({
+                "id": order_id, "user_id": CUSTOMER_TG_ID, "products": "Страва 1 x 1", "total_price": 101,
+                "customer_name": "Клієнт", "phone_number": phone, "address": "вул. Тестова, 1", "phone_key": normalize_phone(phone),
+                "status_id": order_id % 5 + 1, "courier_id": 1, "completed_by_courier_id": 1,
+                "created_at": now - timedelta(hours=order_id),
+            })
+        await conn.execute(sa.insert(Order), orders)
+        await conn.execute(sa.insert(OrderItem), [
+            {"order_id": order_id, "product_id": 1, "name": "Страва 1", "price": 101, "quantity": 1}
+            for order_id in range(1, ORDERS_COUNT + 1)
+        ])
+        await conn.execute(sa.insert(OrderStatusHistory), [
+            {"order_id": order_id, "status_id": status_id, "actor_info": "seed"}
+            for order_id in range(1, ORDERS_COUNT + 1) for status_id in (1, 2)
+        ])
+    await rebuild_customer_stats(engine)
+
+
+async def check_budgets(engine, verbose: bool) -> list[str]:
+    statements: list[str] = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Довідники статусів і ролей живуть у пам'яті процесу (reference_data.py) і в робочому
+    # режимі вже завантажені — прогріваємо їх заздалегідь і не звіряємо версію під час замірів
+    reference_cache.check_seconds = float("inf")
+    async with AsyncSession(engine) as session:
+        await reference_cache.get(session)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+    failed = []
+    for name, (budget, call) in _screens().items():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            statements.clear()
+            await call(session)
+            used = len(statements)
+        print(f"{'FAIL' if used > budget else 'OK':<5} {used:>2}/{budget:<2} {name}")
+        if verbose or used > budget:
+            for statement in statements:
+                print(f"      {' '.join(statement.split())[:160]}")
+        if used > budget:
+            failed.append(name)
+    event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+    return failed
+
+
+async def run(args) -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine_for_profile(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'budget.db')}", "bench")
+        await seed_database(engine)
+        failed = await check_budgets(engine, args.verbose)
+        await engine.dispose()
+
+    if failed:
+        print(f"\nПеревищено бюджет запитів: {', '.join(failed)}")
+        return 1
+    print("\nУсі екрани вкладаються в бюджет запитів.")
+    return 0
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Перевірка кількості SQL-запитів на екран crm_bot")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Показувати всі запити кожного екрана")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
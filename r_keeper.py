@@ -6,7 +6,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 # FIX: Змінено імпорт з 'main' на 'models' для кращої структури та уникнення циклічних імпортів.
-from models import Order, Settings
+from models import Order
+from settings_cache import SettingsSnapshot
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +17,7 @@ class RKeeperAPI:
     """
     Класс для взаимодействия с API R-Keeper.
     """
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: SettingsSnapshot):
         self.api_url = settings.r_keeper_api_url
         self.user = settings.r_keeper_user
         self.password = settings.r_keeper_password
@@ -49,27 +50,29 @@ class RKeeperAPI:
             logger.error(f"Authentication failed for R-Keeper. Status: {e.response.status_code}, Body: {e.response.text}")
             return None
 
-    async def send_order(self, order: Order, items: List[Dict[str, Any]]):
+    async def send_order(self, order: Order, items: List[Dict[str, Any]]) -> bool:
         """
         Отправляет заказ в R-Keeper.
 
         :param order: Объект заказа из нашей БД.
         :param items: Список словарей с деталями товаров в заказе. 
                       Каждый словарь должен содержать 'r_keeper_id', 'quantity', 'price'.
+        :return: False, если заказ не удалось отправить (стоит повторить позже),
+                 True — отправлен или отправлять нечего.
         """
         if not self.enabled:
             logger.info("R-Keeper integration is disabled. Skipping order sending.")
-            return
+            return True
 
         if not all([self.api_url, self.station_code, self.payment_type]):
             logger.error("R-Keeper API URL, station code, or payment type not configured. Cannot send order.")
-            return
+            return False
 
         async with httpx.AsyncClient() as client:
             # ПРЕДПОЛОЖЕНИЕ: Для каждого запроса нужен свежий токен. 
             # Если токен долгоживущий, можно оптимизировать.
             if not await self._get_auth_token(client):
-                return
+                return False
 
             headers = {"Authorization": f"Bearer {self.token}"}
 
@@ -106,17 +109,19 @@ class RKeeperAPI:
             # Проверяем, есть ли что отправлять (вдруг ни у одного товара не было r_keeper_id)
             if not order_data["items"]:
                 logger.warning(f"Order #{order.id} has no items with R-Keeper IDs. Skipping sending to R-Keeper.")
-                return
+                return True
 
             try:
                 order_url = f"{self.api_url}/orders"
                 response = await client.post(order_url, json=order_data, headers=headers)
                 response.raise_for_status()
                 logger.info(f"Order #{order.id} successfully sent to R-Keeper. Response: {response.json()}")
+                return True
             except httpx.RequestError as e:
                 logger.error(f"Failed to connect to R-Keeper to send order #{order.id}: {e}")
             except httpx.HTTPStatusError as e:
                 logger.error(f"Failed to send order #{order.id} to R-Keeper. Status: {e.response.status_code}, Body: {e.response.text}")
+            return False
 
 # REMOVED: Видалено невикористовувану функцію send_order_to_rkeeper
 # Вона дублювала логіку, яка вже є в main.py, і ніколи не викликалася.
@@ -0,0 +1,104 @@
+# reference_data.py
+"""
+Довідники статусів замовлень і ролей у пам'яті процесу: незмінний знімок ReferenceData
+з наперед порахованими наборами id. Скидається маршрутами статусів і ролей через commit_reference_data().
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import OrderStatus, Role
+from cache_versions import VersionedCache, bump_version
+
+REFERENCE_CACHE = "reference_data"
+
+
+@dataclass(frozen=True)
+class StatusInfo:
+    id: int
+    name: str
+    notify_customer: bool
+    visible_to_operator: bool
+    visible_to_courier: bool
+    is_completed_status: bool
+    is_cancelled_status: bool
+
+
+@dataclass(frozen=True)
+class RoleInfo:
+    id: int
+    name: str
+    can_manage_orders: bool
+    can_be_assigned: bool
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    statuses: tuple[StatusInfo, ...]  # за id, як у списках і клавіатурах
+    roles: tuple[RoleInfo, ...]
+    final_status_ids: frozenset[int]
+    active_status_ids: frozenset[int]
+    completed_status_ids: frozenset[int]
+    cancelled_status_ids: frozenset[int]
+    operator_statuses: tuple[StatusInfo, ...]
+    courier_statuses: tuple[StatusInfo, ...]
+    operator_role_ids: frozenset[int]
+    courier_role_ids: frozenset[int]
+
+    @classmethod
+    def build(cls, statuses: list[StatusInfo], roles: list[RoleInfo]) -> "ReferenceData":
+        statuses = sorted(statuses, key=lambda s: s.id)
+        roles = sorted(roles, key=lambda r: r.id)
+        return cls(
+            statuses=tuple(statuses),
+            roles=tuple(roles),
+            final_status_ids=frozenset(s.id for s in statuses if s.is_completed_status or s.is_cancelled_status),
+            active_status_ids=frozenset(s.id for s in statuses if not (s.is_completed_status or s.is_cancelled_status)),
+            completed_status_ids=frozenset(s.id for s in statuses if s.is_completed_status),
+            cancelled_status_ids=frozenset(s.id for s in statuses if s.is_cancelled_status),
+            operator_statuses=tuple(s for s in statuses if s.visible_to_operator),
+            courier_statuses=tuple(s for s in statuses if s.visible_to_courier),
+            operator_role_ids=frozenset(r.id for r in roles if r.can_manage_orders),
+            courier_role_ids=frozenset(r.id for r in roles if r.can_be_assigned),
+        )
+
+    def status(self, status_id: Optional[int]) -> Optional[StatusInfo]:
+        return next((s for s in self.statuses if s.id == status_id), None)
+
+    def role(self, role_id: Optional[int]) -> Optional[RoleInfo]:
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    @property
+    def completed_status_id(self) -> Optional[int]:
+        """Основний статус "виконано" для звітів — з найменшим id."""
+        return min(self.completed_status_ids, default=None)
+
+
+async def _load_reference_data(session: AsyncSession) -> ReferenceData:
+    statuses = (await session.execute(select(
+        OrderStatus.id, OrderStatus.name, OrderStatus.notify_customer, OrderStatus.visible_to_operator,
+        OrderStatus.visible_to_courier, OrderStatus.is_completed_status, OrderStatus.is_cancelled_status,
+    ))).all()
+    roles = (await session.execute(select(Role.id, Role.name, Role.can_manage_orders, Role.can_be_assigned))).all()
+    return ReferenceData.build(
+        [StatusInfo(*(bool(v) if i > 1 else v for i, v in enumerate(row))) for row in statuses],
+        [RoleInfo(*(bool(v) if i > 1 else v for i, v in enumerate(row))) for row in roles],
+    )
+
+
+reference_cache: VersionedCache[ReferenceData] = VersionedCache(REFERENCE_CACHE, _load_reference_data)
+
+
+async def get_reference_data(session: Optional[AsyncSession] = None) -> ReferenceData:
+    """Поточні статуси й ролі лише для читання."""
+    return await reference_cache.get(session)
+
+
+async def commit_reference_data(session: AsyncSession):
+    """Комітить зміни статусів або ролей і скидає знімок (у цьому процесі — одразу)."""
+    await bump_version(session, REFERENCE_CACHE)
+    await session.commit()
+    reference_cache.invalidate()
@@ -0,0 +1,234 @@
+# send_scheduler.py
+"""
+Єдина черга вихідних повідомлень ботів у Telegram.
+
+Усі сповіщення (нове замовлення, зміна статусу, призначення кур'єра) надсилаються через
+telegram_sender.send_message(...) замість bot.send_message(...). Викликач так само чекає
+результату (Message) або винятку, але саме надсилання планує черга:
+
+- пріоритети: PRIORITY_STAFF (кур'єри й оператори) → PRIORITY_CUSTOMER (клієнти)
+  → PRIORITY_LOG (лог у загальний адмін-чат); у межах пріоритету — за порядком постановки;
+- загальний ліміт кожного бота — token bucket на SEND_RATE повідомлень на секунду
+  з запасом SEND_BURST (Telegram дозволяє близько 30 на секунду);
+- пауза між повідомленнями в один чат: SEND_CHAT_INTERVAL секунд для особистих чатів
+  і SEND_GROUP_INTERVAL для груп (у групу — не більше 20 повідомлень на хвилину).
+  Повідомлення в «зайнятий» чат відкладається, не блокуючи інші чати;
+- TelegramRetryAfter: чат ставиться на паузу на retry_after секунд, і повідомлення
+  надсилається повторно; мережеві помилки та 5xx — повтор з паузою 1, 2, 4... секунд.
+  Спроб — не більше SEND_MAX_RETRIES, далі викликач отримує виняток.
+
+Лічильники (надіслано, помилок, повторів, час у черзі) — telegram_sender.metrics();
+підсумок пишеться в лог при зупинці. Поки черга не запущена (скрипти, тести),
+повідомлення надсилаються напряму.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Message
+
+from memory_utils import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+SEND_RATE = float(getenv("SEND_RATE", "25"))
+SEND_BURST = float(getenv("SEND_BURST", "25"))
+SEND_CHAT_INTERVAL = float(getenv("SEND_CHAT_INTERVAL", "1"))
+SEND_GROUP_INTERVAL = float(getenv("SEND_GROUP_INTERVAL", "3"))
+SEND_WORKERS = int(getenv("SEND_WORKERS", "4"))
+SEND_MAX_RETRIES = int(getenv("SEND_MAX_RETRIES", "3"))
+SEND_DRAIN_SECONDS = float(getenv("SEND_DRAIN_SECONDS", "10"))
+
+PRIORITY_STAFF = 0
+PRIORITY_CUSTOMER = 1
+PRIORITY_LOG = 2
+
+
+@dataclass
+class SendStats:
+    submitted: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    retry_after: int = 0  # з них через TelegramRetryAfter
+    max_queue: int = 0
+    total_wait: float = 0.0  # секунд у черзі для надісланих
+    max_wait: float = 0.0
+
+    def snapshot(self, queued: int = 0) -> dict[str, Any]:
+        return {
+            "submitted": self.submitted, "sent": self.sent, "failed": self.failed,
+            "retried": self.retried, "retry_after": self.retry_after,
+            "queued": queued, "max_queue": self.max_queue,
+            "avg_wait": round(self.total_wait / self.sent, 3) if self.sent else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    bot: Bot = field(compare=False)
+    method: TelegramMethod = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+    @property
+    def chat(self) -> str:
+        return f"{self.bot.id}:{self.method.chat_id}"
+
+
+def _chat_interval(chat_id: Any) -> float:
+    return SEND_GROUP_INTERVAL if str(chat_id).startswith("-") else SEND_CHAT_INTERVAL
+
+
+class SendScheduler:
+    def __init__(self, rate: float = SEND_RATE, burst: float = SEND_BURST,
+                 workers: int = SEND_WORKERS, max_retries: int = SEND_MAX_RETRIES):
+        self.limiter = RateLimiter(rate, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.stats = SendStats()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._limiter_lock: Optional[asyncio.Lock] = None
+        self._tasks: list[asyncio.Task] = []
+        self._jobs: dict[int, _Job] = {}  # seq -> ще не завершені (у черзі, відкладені або в роботі)
+        self._chat_ready: dict[str, float] = {}  # чат -> коли в нього можна писати (monotonic)
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._limiter_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        logger.info(f"Черга повідомлень Telegram запущена ({self.workers} воркери, {self.limiter.rate:g}/с).")
+
+    async def stop(self, timeout: float = SEND_DRAIN_SECONDS):
+        """Дає до timeout секунд на надсилання того, що вже в черзі, і зупиняє воркери."""
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        while self._jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.cancel()
+        if self._jobs:
+            logger.warning(f"Черга повідомлень зупинена, не надіслано: {len(self._jobs)}.")
+        self._jobs.clear()
+        logger.info(f"Черга повідомлень Telegram зупинена: {self.metrics()}")
+
+    def metrics(self) -> dict[str, Any]:
+        return self.stats.snapshot(queued=len(self._jobs))
+
+    async def send(self, bot: Bot, method: TelegramMethod, priority: int = PRIORITY_STAFF) -> Any:
+        """Надсилає метод (SendMessage тощо) через чергу і повертає відповідь Telegram."""
+        self.stats.submitted += 1
+        if not self.running:
+            try:
+                result = await bot(method)
+            except Exception:
+                self.stats.failed += 1
+                raise
+            self.stats.sent += 1
+            return result
+        job = _Job(priority, next(self._seq), bot, method, asyncio.get_running_loop().create_future(), time.monotonic())
+        self._jobs[job.seq] = job
+        self._queue.put_nowait(job)
+        self.stats.max_queue = max(self.stats.max_queue, self._queue.qsize())
+        return await job.future
+
+    async def send_message(self, bot: Bot, chat_id: int | str, text: str,
+                           priority: int = PRIORITY_STAFF, **kwargs) -> Message:
+        return await self.send(bot, SendMessage(chat_id=chat_id, text=text, **kwargs), priority)
+
+    def _requeue(self, job: _Job, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._release, job)
+
+    def _release(self, job: _Job):
+        if self.running and not job.future.done():
+            self._queue.put_nowait(job)
+
+    def _finish(self, job: _Job, result: Any = None, error: Optional[BaseException] = None):
+        self._jobs.pop(job.seq, None)
+        if job.future.done():
+            return
+        if error is not None:
+            self.stats.failed += 1
+            job.future.set_exception(error)
+        else:
+            wait = time.monotonic() - job.enqueued_at
+            self.stats.sent += 1
+            self.stats.total_wait += wait
+            self.stats.max_wait = max(self.stats.max_wait, wait)
+            job.future.set_result(result)
+
+    async def _worker_loop(self):
+        while True:
+            job: _Job = await self._queue.get()
+            if job.future.done():  # викликача скасовано
+                self._jobs.pop(job.seq, None)
+                continue
+            now = time.monotonic()
+            ready_at = self._chat_ready.get(job.chat, 0.0)
+            if ready_at > now:
+                self._requeue(job, ready_at - now)
+                continue
+            # Чат позначається зайнятим до очікування ліміту, щоб інший воркер не взяв наступне повідомлення в нього
+            self._mark_chat(job.chat, now + _chat_interval(job.method.chat_id))
+            # Lock — щоб токени діставались воркерам у порядку, в якому вони взяли повідомлення з черги
+            async with self._limiter_lock:
+                while (wait := self.limiter.acquire(job.bot.id)) > 0:
+                    await asyncio.sleep(wait)
+            await self._deliver(job)
+
+    def _mark_chat(self, chat: str, ready_at: float):
+        self._chat_ready[chat] = max(ready_at, self._chat_ready.get(chat, 0.0))
+        if len(self._chat_ready) > 10000:
+            now = time.monotonic()
+            self._chat_ready = {c: t for c, t in self._chat_ready.items() if t > now}
+
+    async def _deliver(self, job: _Job):
+        try:
+            result = await job.bot(job.method)
+        except TelegramRetryAfter as e:
+            self.stats.retry_after += 1
+            self._mark_chat(job.chat, time.monotonic() + e.retry_after)
+            self._retry(job, e.retry_after, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self._retry(job, 2 ** job.attempts, e)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, result=result)
+
+    def _retry(self, job: _Job, delay: float, error: Exception):
+        if job.attempts >= self.max_retries:
+            self._finish(job, error=error)
+            return
+        job.attempts += 1
+        self.stats.retried += 1
+        logger.warning(f"Повідомлення в чат {job.method.chat_id} не надіслано ({error}), повтор #{job.attempts} через {delay} с.")
+        self._requeue(job, delay)
+
+
+telegram_sender = SendScheduler()
@@ -0,0 +1,57 @@
+# settings_cache.py
+"""
+Налаштування (таблиця settings) в пам'яті процесу: незмінний знімок SettingsSnapshot
+(get_settings_snapshot). Скидається лише через save_settings() зі сторінки /admin/settings.
+"""
+
+from dataclasses import dataclass, fields
+from os import getenv
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Settings
+from cache_versions import VersionedCache, bump_version
+
+SETTINGS_CACHE = "settings"
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    client_bot_token: Optional[str] = None
+    admin_bot_token: Optional[str] = None
+    admin_chat_id: Optional[str] = None
+    logo_url: Optional[str] = None
+    r_keeper_enabled: bool = False
+    r_keeper_api_url: Optional[str] = None
+    r_keeper_user: Optional[str] = None
+    r_keeper_password: Optional[str] = None
+    r_keeper_station_code: Optional[str] = None
+    r_keeper_payment_type: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, settings: Optional[Settings]) -> "SettingsSnapshot":
+        if settings is None:
+            # Рядок settings ще не створено — ті самі значення, з якими його створить get_settings()
+            return cls(client_bot_token=getenv("CLIENT_BOT_TOKEN", ""), admin_bot_token=getenv("ADMIN_BOT_TOKEN", ""),
+                       admin_chat_id=getenv("ADMIN_CHAT_ID", ""))
+        return cls(**{field.name: getattr(settings, field.name) for field in fields(cls)})
+
+
+async def _load_settings(session: AsyncSession) -> SettingsSnapshot:
+    return SettingsSnapshot.from_model(await session.get(Settings, 1))
+
+
+settings_cache: VersionedCache[SettingsSnapshot] = VersionedCache(SETTINGS_CACHE, _load_settings)
+
+
+async def get_settings_snapshot(session: Optional[AsyncSession] = None) -> SettingsSnapshot:
+    """Поточні налаштування лише для читання."""
+    return await settings_cache.get(session)
+
+
+async def save_settings(session: AsyncSession, settings: Settings):
+    """Комітить змінений об'єкт Settings і одразу оновлює знімок (write-through)."""
+    version = await bump_version(session, SETTINGS_CACHE)
+    await session.commit()
+    settings_cache.store(SettingsSnapshot.from_model(settings), version)
@@ -0,0 +1,76 @@
+# site_pages.py
+"""
+Інформаційні сторінки (таблиця menu_items) в пам'яті процесу: готовий JSON для /api/page/{id}
+з ETag і Last-Modified. Скидається маршрутами /admin/menu/* через commit_site_pages().
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import MenuItem
+from cache_versions import VersionedCache, bump_version, read_version_info
+from http_cache import make_etag
+
+PAGES_CACHE = "site_pages"
+
+
+@dataclass(frozen=True)
+class SitePage:
+    id: int
+    title: str
+    sort_order: int
+    show_on_website: bool
+    show_in_telegram: bool
+    page_json: bytes  # готова відповідь /api/page/{id}
+    etag: str
+
+
+@dataclass(frozen=True)
+class SitePages:
+    version: int
+    updated_at: Optional[datetime]  # UTC, коли версію востаннє збільшили
+    pages: Mapping[int, SitePage]  # за sort_order
+
+    def website_page(self, page_id: int) -> Optional[SitePage]:
+        page = self.pages.get(page_id)
+        return page if page and page.show_on_website else None
+
+    @property
+    def website_pages(self) -> list[SitePage]:
+        return [page for page in self.pages.values() if page.show_on_website]
+
+
+async def _load_site_pages(session: AsyncSession) -> SitePages:
+    version, updated_at = await read_version_info(session, PAGES_CACHE)
+    rows = (await session.execute(
+        select(MenuItem.id, MenuItem.title, MenuItem.content, MenuItem.sort_order,
+               MenuItem.show_on_website, MenuItem.show_in_telegram)
+        .order_by(MenuItem.sort_order)
+    )).all()
+    pages = {}
+    for row in rows:
+        page_json = json.dumps({"title": row.title, "content": row.content},
+                               ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        pages[row.id] = SitePage(row.id, row.title, row.sort_order, bool(row.show_on_website), bool(row.show_in_telegram),
+                                 page_json, make_etag(f"p{row.id}-", version, page_json))
+    return SitePages(version, updated_at, MappingProxyType(pages))
+
+
+site_pages_cache: VersionedCache[SitePages] = VersionedCache(PAGES_CACHE, _load_site_pages)
+
+
+async def get_site_pages(session: Optional[AsyncSession] = None) -> SitePages:
+    return await site_pages_cache.get(session)
+
+
+async def commit_site_pages(session: AsyncSession):
+    """Комітить зміни пунктів меню і скидає знімок сторінок (у цьому процесі — одразу)."""
+    await bump_version(session, PAGES_CACHE)
+    await session.commit()
+    site_pages_cache.invalidate()
@@ -0,0 +1,128 @@
+# staff_identity.py
+"""
+Хто пише в адмін-бот: співробітник і його роль, визначені один раз на апдейт.
+
+StaffMiddleware — зовнішній middleware dp_admin.update. Для відправника апдейту він бере
+рядок співробітника з TTL-кешу (STAFF_CACHE_SIZE користувачів, STAFF_CACHE_SECONDS секунд),
+а при промаху — одним запитом за індексом telegram_user_id. Роль береться зі знімка
+довідників (reference_data.py), тож зміна ролі в адмін-панелі не потребує скидання кешу.
+Результат кладеться в дані обробника як staff: StaffMember або None, якщо користувач
+не авторизований.
+
+Вхід (прив'язка Telegram-акаунта за телефоном) виконується роботою bind_staff_telegram()
+через write_coordinator. Після входу, виходу, початку чи завершення зміни (is_on_shift) і редагування співробітника в адмін-панелі
+викликач скидає запис через forget_staff(). Інші воркери побачать зміну не пізніше,
+ніж через STAFF_CACHE_SECONDS.
+"""
+
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import joinedload
+
+from models import Employee
+from memory_utils import TTLCache
+from reference_data import RoleInfo, get_reference_data
+
+STAFF_CACHE_SIZE = int(getenv("STAFF_CACHE_SIZE", "1024"))
+STAFF_CACHE_SECONDS = float(getenv("STAFF_CACHE_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class _StaffRow:
+    id: int
+    full_name: str
+    role_id: int
+    is_on_shift: bool
+
+
+@dataclass(frozen=True)
+class StaffMember:
+    id: int
+    telegram_user_id: int
+    full_name: str
+    role: RoleInfo
+    is_on_shift: bool
+
+    @property
+    def is_courier(self) -> bool:
+        return self.role.can_be_assigned
+
+    @property
+    def is_operator(self) -> bool:
+        return self.role.can_manage_orders
+
+
+# telegram_user_id -> рядок співробітника або None (не авторизований)
+staff_cache: TTLCache[Optional[_StaffRow]] = TTLCache(STAFF_CACHE_SIZE, STAFF_CACHE_SECONDS)
+_MISSING = object()
+
+
+async def _load_staff_row(session: AsyncSession, telegram_user_id: int) -> Optional[_StaffRow]:
+    row = (await session.execute(
+        select(Employee.id, Employee.full_name, Employee.role_id, Employee.is_on_shift)
+        .where(Employee.telegram_user_id == telegram_user_id)
+    )).first()
+    return _StaffRow(row.id, row.full_name, row.role_id, bool(row.is_on_shift)) if row else None
+
+
+async def _staff_member(row: _StaffRow, telegram_user_id: int) -> StaffMember:
+    role = (await get_reference_data()).role(row.role_id) or RoleInfo(row.role_id, "", False, False)
+    return StaffMember(row.id, telegram_user_id, row.full_name, role, row.is_on_shift)
+
+
+@dataclass(frozen=True)
+class StaffLogin:
+    previous_user_id: Optional[int]
+    full_name: str
+    role_name: str
+    is_on_shift: bool
+
+
+def bind_staff_telegram(phone: str, telegram_user_id: int, courier: bool) -> Callable[[AsyncSession], Awaitable[Optional[StaffLogin]]]:
+    """
+    Робота для write_coordinator: прив'язує Telegram-акаунт до співробітника з телефоном phone,
+    якщо його роль дозволяє вхід (courier=True — кур'єр, інакше оператор). None — вхід відхилено.
+    """
+    async def save_login(write_session: AsyncSession) -> Optional[StaffLogin]:
+        employee = await write_session.scalar(
+            select(Employee).options(joinedload(Employee.role)).where(Employee.phone_number == phone)
+        )
+        if not employee or not (employee.role.can_be_assigned if courier else employee.role.can_manage_orders):
+            return None
+        login = StaffLogin(employee.telegram_user_id, employee.full_name, employee.role.name, bool(employee.is_on_shift))
+        employee.telegram_user_id = telegram_user_id
+        return login
+    return save_login
+
+
+def forget_staff(*telegram_user_ids: Optional[int]):
+    """Скидає закешованих співробітників після входу, виходу, початку чи завершення зміни або редагування."""
+    for telegram_user_id in telegram_user_ids:
+        if telegram_user_id:
+            staff_cache.discard(telegram_user_id)
+
+
+class StaffMiddleware(BaseMiddleware):
+    def __init__(self, session_pool: async_sessionmaker):
+        self.session_pool = session_pool
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        staff = None
+        if user:
+            row = staff_cache.get(user.id, _MISSING)
+            if row is _MISSING:
+                async with self.session_pool() as session:
+                    row = await _load_staff_row(session, user.id)
+                staff_cache.put(user.id, row)
+            if row is not None:
+                staff = await _staff_member(row, user.id)
+        data["staff"] = staff
+        return await handler(event, data)
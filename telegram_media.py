@@ -0,0 +1,146 @@
+# telegram_media.py
+"""
+Повторне використання file_id для фото, які бот уже надсилав.
+
+Перше надсилання фото страви (файл static/images/...) або вітального фото (URL)
+завантажує його в Telegram; file_id з відповіді зберігається в таблиці telegram_media
+з ключем (шлях або URL, sha256 вмісту файлу, id бота). Далі фото надсилається за file_id —
+без повторного завантаження байтів і без звернення Telegram до стороннього URL.
+
+Хеш вмісту рахується один раз на (шлях, mtime, розмір), тож змінений на місці файл
+отримає новий запис. Коли edit_product замінює або delete_product видаляє зображення,
+forget_media() прибирає записи старого файлу. Якщо Telegram відхиляє збережений file_id,
+запис видаляється і фото завантажується заново.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Optional
+
+import sqlalchemy as sa
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import TelegramMedia
+from db_writer import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+MediaKey = tuple[str, str]  # (source, content_hash)
+
+# (source, content_hash, bot_id) -> file_id; таблиця — спільне постійне сховище, словник — копія процесу
+_file_ids: dict[tuple[str, str, int], str] = {}
+# шлях -> ((mtime_ns, розмір), sha256)
+_hashes: dict[str, tuple[tuple[int, int], str]] = {}
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def media_key(source: Optional[str]) -> Optional[MediaKey]:
+    """Ключ фото; None — локального файлу немає або він порожній."""
+    if not source:
+        return None
+    if _is_url(source):
+        return source, ""
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    if stat.st_size == 0:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _hashes.get(source)
+    if cached and cached[0] == signature:
+        return source, cached[1]
+    content_hash = await asyncio.to_thread(_file_sha256, source)
+    _hashes[source] = (signature, content_hash)
+    return source, content_hash
+
+
+async def _lookup(session: AsyncSession, key: MediaKey, bot_id: int) -> Optional[str]:
+    memory_key = (*key, bot_id)
+    if memory_key in _file_ids:
+        return _file_ids[memory_key]
+    file_id = await session.scalar(
+        select(TelegramMedia.file_id)
+        .where(TelegramMedia.source == key[0], TelegramMedia.content_hash == key[1], TelegramMedia.bot_id == bot_id)
+    )
+    if file_id:
+        _file_ids[memory_key] = file_id
+    return file_id
+
+
+async def _remember(key: MediaKey, bot_id: int, file_id: str):
+    _file_ids[(*key, bot_id)] = file_id
+
+    async def save(write_session: AsyncSession):
+        stmt = sqlite_insert(TelegramMedia).values(source=key[0], content_hash=key[1], bot_id=bot_id, file_id=file_id)
+        await write_session.execute(stmt.on_conflict_do_update(
+            index_elements=[TelegramMedia.source, TelegramMedia.content_hash, TelegramMedia.bot_id],
+            set_={"file_id": stmt.excluded.file_id, "created_at": sa.func.now()},
+        ))
+
+    try:
+        await write_coordinator.run(save)
+    except Exception as e:
+        logger.error(f"Не вдалося зберегти file_id для {key[0]}: {e}")
+
+
+async def _drop(key: MediaKey, bot_id: int):
+    _file_ids.pop((*key, bot_id), None)
+
+    async def delete(write_session: AsyncSession):
+        await write_session.execute(sa.delete(TelegramMedia).where(
+            TelegramMedia.source == key[0], TelegramMedia.content_hash == key[1], TelegramMedia.bot_id == bot_id
+        ))
+
+    await write_coordinator.run(delete)
+
+
+async def answer_photo_cached(message: Message, session: AsyncSession, source: Optional[str], **kwargs) -> Optional[Message]:
+    """
+    message.answer_photo() для файлу або URL source з повторним використанням file_id.
+    Повертає None, якщо локального файлу немає — викликач надсилає повідомлення без фото.
+    """
+    key = await media_key(source)
+    if key is None:
+        return None
+    bot_id = message.bot.id
+
+    file_id = await _lookup(session, key, bot_id)
+    if file_id:
+        try:
+            return await message.answer_photo(photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"Збережений file_id для {source} відхилено ({e}), завантажуємо фото заново.")
+            await _drop(key, bot_id)
+
+    sent = await message.answer_photo(photo=source if _is_url(source) else FSInputFile(source), **kwargs)
+    if sent.photo:
+        await _remember(key, bot_id, sent.photo[-1].file_id)
+    return sent
+
+
+async def forget_media(session: AsyncSession, source: Optional[str]):
+    """Видаляє file_id файлу source (у транзакції викликача) — після заміни чи видалення зображення."""
+    if not source:
+        return
+    await session.execute(sa.delete(TelegramMedia).where(TelegramMedia.source == source))
+    _hashes.pop(source, None)
+    for memory_key in [k for k in _file_ids if k[0] == source]:
+        del _file_ids[memory_key]
@@ -1203,11 +1203,32 @@ WEB_ORDER_HTML = """
                 }}
             }});
 
+            // --- Conditional GET: зберігаємо відповідь разом з ETag і на 304 беремо збережену копію ---
+            const fetchWithEtag = async (url, store, key) => {{
+                let cached = null;
+                try {{
+                    cached = JSON.parse(store.getItem(key));
+                }} catch(e) {{
+                    cached = null;
+                }}
+                const headers = cached && cached.etag ? {{ 'If-None-Match': cached.etag }} : {{}};
+                const response = await fetch(url, {{ headers }});
+                if (response.status === 304 && cached) return cached.data;
+                if (!response.ok) throw new Error(`HTTP ${{response.status}}`);
+                const data = await response.json();
+                const etag = response.headers.get('ETag');
+                try {{
+                    if (etag) store.setItem(key, JSON.stringify({{ etag, data }}));
+                }} catch(e) {{
+                    console.warn('Could not cache response:', e);
+                }}
+                return data;
+            }};
+
             // --- Menu Rendering Logic ---
             const fetchMenu = async () => {{
                 try {{
-                    const response = await fetch('/api/menu');
-                    const data = await response.json();
+                    const data = await fetchWithEtag('/api/menu', localStorage, 'menuCache');
                     renderMenu(data);
                     setupScrollspy();
                     loader.style.display = 'none';
@@ -1457,9 +1478,7 @@ WEB_ORDER_HTML = """
                 pageModalBody.innerHTML = '<div class="spinner"></div>'; // Show loader
 
                 try {{
-                    const response = await fetch(`/api/page/${{itemId}}`);
-                    if (!response.ok) throw new Error('Page not found');
-                    const data = await response.json();
+                    const data = await fetchWithEtag(`/api/page/${{itemId}}`, sessionStorage, `pageCache:${{itemId}}`);
                     pageModalTitle.textContent = data.title;
                     pageModalBody.innerHTML = data.content;
                 }} catch (error) {{
@@ -0,0 +1,197 @@
+# update_pool.py
+"""
+Обробка апдейтів ботів пулом воркерів: паралельно між чатами, строго по черзі в межах чату.
+
+Стандартний polling aiogram запускає кожен апдейт окремою задачею без жодного порядку,
+а оформлення замовлення (FSM) розраховує, що наступне повідомлення клієнта обробляється
+після попереднього. PooledDispatcher.feed_update() (і в polling, і в webhook) не обробляє
+апдейт сам, а ставить його в update_pool:
+
+- апдейти одного чату (ключ — бот і чат, або користувач, якщо чату немає) виконуються
+  строго по черзі; різні чати обробляють паралельно UPDATE_WORKERS воркерів, тож повільний
+  обробник одного клієнта займає лише один воркер і не затримує інших;
+- обробник, довший за UPDATE_HANDLER_SECONDS, переривається, і чат переходить
+  до наступного апдейту;
+- в обробці або в черзі одночасно не більше UPDATE_QUEUE_SIZE апдейтів: далі polling
+  (або webhook-запит) чекає на місце;
+- лічильники (у черзі, найбільша черга загалом і в одному чаті, час очікування й обробки,
+  помилки, перевищення часу) — update_pool.metrics(); підсумок пишеться в лог при зупинці.
+
+UPDATE_WORKERS=0 або не запущений пул (скрипти, тести) — апдейт обробляється одразу,
+як у звичайному Dispatcher.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(getenv("UPDATE_WORKERS", "16"))
+UPDATE_QUEUE_SIZE = int(getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_HANDLER_SECONDS = float(getenv("UPDATE_HANDLER_SECONDS", "60"))
+UPDATE_DRAIN_SECONDS = float(getenv("UPDATE_DRAIN_SECONDS", "10"))
+
+
+@dataclass
+class UpdateStats:
+    submitted: int = 0
+    handled: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    max_queue: int = 0
+    max_chat_queue: int = 0
+    total_wait: float = 0.0  # секунд у черзі до початку обробки
+    max_wait: float = 0.0
+    total_seconds: float = 0.0  # секунд обробки
+    max_seconds: float = 0.0
+
+    def snapshot(self, queued: int = 0, chats: int = 0) -> dict[str, Any]:
+        done = self.handled + self.failed + self.timeouts
+        return {
+            "submitted": self.submitted, "handled": self.handled, "failed": self.failed, "timeouts": self.timeouts,
+            "queued": queued, "chats": chats, "max_queue": self.max_queue, "max_chat_queue": self.max_chat_queue,
+            "avg_wait": round(self.total_wait / done, 3) if done else 0.0, "max_wait": round(self.max_wait, 3),
+            "avg_seconds": round(self.total_seconds / done, 3) if done else 0.0, "max_seconds": round(self.max_seconds, 3),
+        }
+
+
+@dataclass(frozen=True)
+class _Item:
+    dispatcher: Dispatcher
+    bot: Bot
+    update: Update
+    kwargs: dict[str, Any] = field(default_factory=dict)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+def chat_key(bot: Bot, update: Update) -> str:
+    """Ключ черги апдейту: бот і чат (або користувач); апдейти без обох обробляються незалежно."""
+    context = UserContextMiddleware.resolve_event_context(event=update)
+    subject = context.chat_id or context.user_id
+    if subject is None:
+        return f"{bot.id}:update:{update.update_id}"
+    return f"{bot.id}:{subject}"
+
+
+class UpdatePool:
+    def __init__(self, workers: int = UPDATE_WORKERS, max_queue: int = UPDATE_QUEUE_SIZE,
+                 handler_timeout: float = UPDATE_HANDLER_SECONDS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.handler_timeout = handler_timeout
+        self.stats = UpdateStats()
+        self._ready: Optional[asyncio.Queue] = None  # ключі чатів, чий перший апдейт можна обробляти
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._chats: dict[str, deque[_Item]] = {}  # чат -> апдейти; перший — в обробці або в _ready
+        self._queued = 0
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running or self.workers <= 0:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        logger.info(f"Пул обробки апдейтів запущено: {self.workers} воркерів, черга до {self.max_queue}.")
+
+    async def stop(self, timeout: float = UPDATE_DRAIN_SECONDS):
+        """Дає до timeout секунд на обробку апдейтів у черзі і зупиняє воркери."""
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queued and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queued:
+            logger.warning(f"Пул апдейтів зупинено, не оброблено: {self._queued}.")
+        self._chats.clear()
+        self._queued = 0
+        logger.info(f"Пул обробки апдейтів зупинено: {self.metrics()}")
+
+    def metrics(self) -> dict[str, Any]:
+        return self.stats.snapshot(queued=self._queued, chats=len(self._chats))
+
+    async def submit(self, dispatcher: Dispatcher, bot: Bot, update: Update, **kwargs):
+        """Ставить апдейт у чергу його чату; чекає, лише якщо пул заповнений."""
+        await self._slots.acquire()
+        item = _Item(dispatcher, bot, update, kwargs)
+        key = chat_key(bot, update)
+        self.stats.submitted += 1
+        self._queued += 1
+        self.stats.max_queue = max(self.stats.max_queue, self._queued)
+        chat = self._chats.get(key)
+        if chat is None:
+            self._chats[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            chat.append(item)
+            self.stats.max_chat_queue = max(self.stats.max_chat_queue, len(chat))
+
+    async def _worker_loop(self):
+        while True:
+            key = await self._ready.get()
+            chat = self._chats[key]
+            try:
+                await self._process(key, chat[0])
+            finally:
+                chat.popleft()
+                self._queued -= 1
+                self._slots.release()
+                if chat:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+
+    async def _process(self, key: str, item: _Item):
+        started = time.monotonic()
+        wait = started - item.enqueued_at
+        self.stats.total_wait += wait
+        self.stats.max_wait = max(self.stats.max_wait, wait)
+        try:
+            # Dispatcher.feed_update напряму: PooledDispatcher.feed_update знову поставив би апдейт у чергу
+            response = await asyncio.wait_for(
+                Dispatcher.feed_update(item.dispatcher, item.bot, item.update, **item.kwargs), self.handler_timeout
+            )
+            if isinstance(response, TelegramMethod):
+                await item.dispatcher.silent_call_request(bot=item.bot, result=response)
+            self.stats.handled += 1
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning(f"Обробка апдейту {item.update.update_id} (чат {key}) перевищила {self.handler_timeout:g} с і перервана.")
+        except Exception as e:
+            self.stats.failed += 1
+            logger.error(f"Помилка обробки апдейту {item.update.update_id} (чат {key}): {e}", exc_info=True)
+        finally:
+            elapsed = time.monotonic() - started
+            self.stats.total_seconds += elapsed
+            self.stats.max_seconds = max(self.stats.max_seconds, elapsed)
+
+
+update_pool = UpdatePool()
+
+
+class PooledDispatcher(Dispatcher):
+    """Dispatcher, чиї апдейти обробляє update_pool (якщо він запущений)."""
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        if not update_pool.running:
+            return await super().feed_update(bot, update, **kwargs)
+        await update_pool.submit(self, bot, update, **kwargs)
+        return None